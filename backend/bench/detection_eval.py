@@ -0,0 +1,125 @@
+"""
+Precision / recall / latency of the detection profiles on a labelled page set.
+
+The page set is a folder of pages plus a labels.json mapping each file name
+to the bubble boxes that should be found, in the format /detect returns:
+
+    pages/
+        labels.json          {"001.jpg": [{"x": 120, "y": 40, "w": 180, "h": 260}, ...], ...}
+        001.jpg
+        ...
+
+Run from backend/ (needs ultralytics and the YOLO weights in DETECTION_MODEL):
+
+    python -m bench.detection_eval path/to/pages
+    python -m bench.detection_eval path/to/pages --profiles fast,accurate --iou 0.6
+    python -m bench.detection_eval path/to/pages --json results.json
+
+A detection counts as correct when it overlaps a labelled box by at least
+--iou (intersection over union); every labelled box can be matched once,
+by the most confident detection. Latency is the detector time per page
+(decoding excluded), the cache is not used.
+"""
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+
+def iou(a: dict, b: dict) -> float:
+    x1, y1 = max(a["x"], b["x"]), max(a["y"], b["y"])
+    x2, y2 = min(a["x"] + a["w"], b["x"] + b["w"]), min(a["y"] + a["h"], b["y"] + b["h"])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = a["w"] * a["h"] + b["w"] * b["h"] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def match(detected: list[dict], labelled: list[dict], threshold: float) -> int:
+    """Number of detections matching a labelled box; `detected` is sorted by confidence."""
+    unmatched = list(labelled)
+    hits = 0
+    for box in detected:
+        best = max(unmatched, key=lambda label: iou(box, label), default=None)
+        if best is not None and iou(box, best) >= threshold:
+            unmatched.remove(best)
+            hits += 1
+    return hits
+
+
+def load_page_set(folder: Path) -> tuple[list[Path], list[list[dict]]]:
+    labels = json.loads((folder / "labels.json").read_text(encoding="utf-8"))
+    names = sorted(labels)
+    missing = [name for name in names if not (folder / name).is_file()]
+    if missing:
+        raise SystemExit(f"{len(missing)} labelled pages are missing, e.g. {missing[0]}")
+    return [folder / name for name in names], [labels[name] for name in names]
+
+
+def evaluate(profile, pages: list, labels: list[list[dict]], threshold: float, rounds: int) -> dict:
+    from utils.detection import detect_page
+
+    # Warm up (first inference at this input size) so it doesn't count as latency
+    detect_page(pages[0], profile)
+
+    timings = []
+    hits = detections = expected = 0
+    for page, labelled in zip(pages, labels):
+        for _ in range(rounds):
+            started = time.perf_counter()
+            detected = detect_page(page, profile)
+            timings.append(time.perf_counter() - started)
+        hits += match(detected, labelled, threshold)
+        detections += len(detected)
+        expected += len(labelled)
+
+    precision = hits / detections if detections else 1.0
+    recall = hits / expected if expected else 1.0
+    timings.sort()
+    return {
+        "profile": profile.name,
+        "settings": profile.predict_args(),
+        "pages": len(pages),
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "boxes_per_page": detections / len(pages),
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+    }
+
+
+def main():
+    from utils.detection import PROFILES
+    from utils.pages import open_page
+
+    parser = argparse.ArgumentParser(description="Evaluate the detection profiles on a labelled page set")
+    parser.add_argument("pages", type=Path, help="folder with pages and labels.json")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="comma separated profile names")
+    parser.add_argument("--iou", type=float, default=0.5, help="overlap needed to count a detection as correct")
+    parser.add_argument("--rounds", type=int, default=3, help="timed detections per page")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    paths, labels = load_page_set(args.pages)
+    # Decode once up front, only the detector is timed
+    pages = [open_page(str(path)) for path in paths]
+
+    rows = []
+    for name in args.profiles.split(","):
+        if name not in PROFILES:
+            raise SystemExit(f"Unknown profile {name} ({', '.join(PROFILES)})")
+        print(f"Running {name} on {len(pages)} pages...")
+        rows.append(evaluate(PROFILES[name], pages, labels, args.iou, args.rounds))
+
+    print(f"\n{'profile':<10} {'precision':>9} {'recall':>7} {'F1':>6} {'boxes':>6} {'p50':>9} {'p95':>9}")
+    for row in rows:
+        print(f"{row['profile']:<10} {row['precision']:9.1%} {row['recall']:7.1%} {row['f1']:6.3f} "
+              f"{row['boxes_per_page']:6.1f} {row['median_ms']:7.0f}ms {row['p95_ms']:7.0f}ms")
+
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+End-to-end load test: N virtual readers replaying realistic sessions against
+the backend, with Ollama replaced by the stub server.
+
+Each virtual user opens a synthetic volume (load-folder + thumbnails) and then,
+page by page: loads the image, prefetches, detects bubbles, analyzes a few of
+them, looks up a word, streams a translation and saves it. Run from backend/:
+
+    python -m bench.loadtest --users 8 --pages 5
+    python -m bench.loadtest --url http://localhost:8000 --users 20   # existing server
+
+Without --url the backend is started in-process on a free port, pointed at a
+stub Ollama server whose delays can be tuned with --ocr-delay, --ttft and
+--token-delay. The report lists throughput, p50/p95/p99 latency per endpoint
+and time to the first token (thinking or content event) of translation streams.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+from bench.stub_ollama import StubConfig, start_stub
+from bench.synthetic import make_volume
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.first_event: dict[str, list[float]] = defaultdict(list)
+
+    def ok(self, name: str, seconds: float):
+        self.latencies[name].append(seconds)
+
+    def error(self, name: str):
+        self.errors[name] += 1
+
+
+async def timed(rec: Recorder, name: str, request):
+    start = time.perf_counter()
+    try:
+        response = await request
+        response.raise_for_status()
+    except httpx.HTTPError:
+        rec.error(name)
+        return None
+    rec.ok(name, time.perf_counter() - start)
+    return response
+
+
+async def timed_stream(rec: Recorder, client: httpx.AsyncClient, name: str, url: str, body: dict):
+    """
+    Consume an SSE stream, recording time to the first thinking/content event
+    and total time. Named frames (the job frame sent as soon as the job exists,
+    done and error) don't count as the first token.
+    """
+    start = time.perf_counter()
+    first = None
+    event_name = None
+    try:
+        async with client.stream("POST", url, json=body) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    event_name = None  # end of frame
+                elif line.startswith("event:"):
+                    event_name = line[len("event:"):].strip()
+                elif first is None and event_name is None and line.startswith("data:"):
+                    first = time.perf_counter() - start
+    except httpx.HTTPError:
+        rec.error(name)
+        return
+    rec.ok(name, time.perf_counter() - start)
+    if first is not None:
+        rec.first_event[name].append(first)
+
+
+async def virtual_user(user: int, args, base_url: str, folder: str, truth: dict, rec: Recorder):
+    rng = random.Random(user)
+    limits = httpx.Limits(max_connections=6)  # like a browser's per-host limit
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        response = await timed(rec, "load-folder", client.post("/api/load-folder", json={"folder_path": folder}))
+        if response is None:
+            return
+        images = response.json()["images"]
+
+        await asyncio.gather(*(
+            timed(rec, "thumbnail", client.get("/api/thumbnail", params={"path": os.path.join(folder, name)}))
+            for name in images[:args.thumbnails]
+        ))
+
+        start_page = rng.randrange(max(1, len(images) - args.pages))
+        for name in images[start_page:start_page + args.pages]:
+            path = os.path.join(folder, name)
+            await timed(rec, "image", client.get("/api/image", params={"path": path}))
+            await timed(rec, "prefetch", client.post("/api/prefetch", json={"image": path}))
+
+            response = await timed(rec, "detect", client.post("/detect", json={"image": path}))
+            boxes = response.json()["boxes"] if response is not None else []
+            if not boxes:
+                boxes = truth[name]  # detector found nothing on the synthetic page
+            await asyncio.sleep(rng.uniform(0, args.think))
+
+            selected = rng.sample(boxes, min(len(boxes), rng.randint(1, 3)))
+            response = await timed(rec, "analyze-multiple",
+                                   client.post("/analyze-multiple", json={"image": path, "boxes": selected}))
+            if response is None:
+                continue
+            breakdown = response.json()["bubbleBreakdown"]
+            ocr_texts = [b["ocr_text"] for b in breakdown]
+            tokens = [t for b in breakdown for t in b["ocr_tokens"]] or ["テスト"]
+            await asyncio.sleep(rng.uniform(0, args.think))
+
+            await timed(rec, "word", client.post("/word", json={"image": path, "word": rng.choice(tokens)}))
+            await timed_stream(rec, client, "translate-multiple", "/translate-multiple",
+                               {"image": path, "boxes": selected, "ocr_texts": ocr_texts})
+            await asyncio.sleep(rng.uniform(0, args.think))
+
+            await timed(rec, "save-translation", client.post("/api/translations", json={
+                "image_name": name,
+                "box_index": boxes.index(selected[0]),
+                "marker": str(user),
+                "translation": "Load test translation.",
+                "original_text": ocr_texts[0],
+            }))
+
+
+def start_backend() -> tuple[object, str]:
+    """Run the FastAPI app with uvicorn on a free port in a background thread."""
+    import uvicorn
+    from main import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def report(rec: Recorder, elapsed: float, users: int) -> dict:
+    total = sum(len(v) for v in rec.latencies.values())
+    errors = sum(rec.errors.values())
+    print(f"\n{users} users, {total} requests ({errors} errors) in {elapsed:.1f}s "
+          f"-> {total / elapsed:.1f} req/s\n")
+    print(f"{'endpoint':<20} {'count':>6} {'err':>4} {'req/s':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    summary = {"users": users, "elapsed": elapsed, "requests": total, "errors": errors, "endpoints": {}}
+    for name in sorted(set(rec.latencies) | set(rec.errors)):
+        values = rec.latencies[name]
+        row = {
+            "count": len(values),
+            "errors": rec.errors[name],
+            "throughput": len(values) / elapsed,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+        if rec.first_event.get(name):
+            row["first_event_p50"] = percentile(rec.first_event[name], 50)
+            row["first_event_p95"] = percentile(rec.first_event[name], 95)
+            row["first_event_p99"] = percentile(rec.first_event[name], 99)
+        summary["endpoints"][name] = row
+        print(f"{name:<20} {row['count']:>6} {row['errors']:>4} {row['throughput']:>7.2f} "
+              f"{row['p50'] * 1000:>9.1f} {row['p95'] * 1000:>9.1f} {row['p99'] * 1000:>9.1f}")
+    for name, values in rec.first_event.items():
+        print(f"\nTime to first token ({name}): p50 {percentile(values, 50) * 1000:.1f} ms, "
+              f"p95 {percentile(values, 95) * 1000:.1f} ms, p99 {percentile(values, 99) * 1000:.1f} ms")
+    return summary
+
+
+async def run(args, base_url: str, folder: str, truth: dict) -> Recorder:
+    rec = Recorder()
+    users = []
+    for user in range(args.users):
+        users.append(asyncio.create_task(virtual_user(user, args, base_url, folder, truth, rec)))
+        await asyncio.sleep(args.ramp_up / max(1, args.users))
+    await asyncio.gather(*users)
+    return rec
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent reading-session load test")
+    parser.add_argument("--users", type=int, default=4, help="concurrent virtual readers")
+    parser.add_argument("--pages", type=int, default=5, help="pages read per session")
+    parser.add_argument("--thumbnails", type=int, default=20, help="thumbnails loaded when opening the volume")
+    parser.add_argument("--think", type=float, default=0.5, help="max think time between actions (s)")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="seconds over which users start")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--url", help="test an already running backend instead of starting one")
+    parser.add_argument("--folder", help="volume to read (default: generated synthetic volume)")
+    parser.add_argument("--ocr-delay", type=float, default=0.2, help="stub OCR/word latency (s)")
+    parser.add_argument("--ttft", type=float, default=0.5, help="stub time to first translation token (s)")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="stub delay between tokens (s)")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="manga-loadtest-")
+    folder = args.folder or os.path.join(workdir, "volume")
+    truth = {}
+    if not args.folder:
+        make_volume(folder, pages=max(args.pages * 2, args.thumbnails))
+    truth_path = os.path.join(folder, "boxes.json")
+    if os.path.exists(truth_path):
+        with open(truth_path, encoding="utf-8") as f:
+            truth = json.load(f)
+    truth = defaultdict(lambda: [{"x": 0, "y": 0, "w": 200, "h": 300}], truth)
+
+    stub = server = None
+    base_url = args.url
+    if not base_url:
+        stub, stub_url = start_stub(config=StubConfig(
+            generate_delay=args.ocr_delay, ttft=args.ttft, token_delay=args.token_delay))
+        os.environ["OLLAMA_HOSTS"] = stub_url
+        server, base_url = start_backend()
+
+    start = time.perf_counter()
+    rec = asyncio.run(run(args, base_url, folder, truth))
+    summary = report(rec, time.perf_counter() - start, args.users)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if server is not None:
+        server.should_exit = True
+    if stub is not None:
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Accuracy / latency comparison of the OCR engines on a labelled crop set.
+
+The crop set is a folder of bubble crops plus a labels.json mapping each
+file name to its correct text:
+
+    crops/
+        labels.json          {"0001.png": "お前、本気でそんなこと言ってるのか！？", ...}
+        0001.png
+        ...
+
+Run from backend/ (the Ollama engine needs a running Ollama with the OCR model,
+manga-ocr needs transformers and the weights in MANGA_OCR_MODEL):
+
+    python -m bench.ocr_compare path/to/crops
+    python -m bench.ocr_compare path/to/crops --engines ollama,manga-ocr,manga-ocr+ollama --fallback 0.8
+    python -m bench.ocr_compare path/to/crops --json results.json
+
+For every engine it reports the character error rate (edit distance / label
+length, whitespace ignored), the share of exactly matching crops, latency of a
+single crop (median/p95) and throughput when the whole set is sent at once,
+which is where batching pays off. Pass --stub to dry-run the Ollama engine
+against the stub server.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+
+
+def edit_distance(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def normalize(text: str) -> str:
+    return "".join(text.split())
+
+
+def load_crop_set(folder: Path) -> tuple[list[str], list[str]]:
+    labels = json.loads((folder / "labels.json").read_text(encoding="utf-8"))
+    names = sorted(labels)
+    missing = [name for name in names if not (folder / name).is_file()]
+    if missing:
+        raise SystemExit(f"{len(missing)} labelled crops are missing, e.g. {missing[0]}")
+    return [str(folder / name) for name in names], [labels[name] for name in names]
+
+
+def build_engine(spec: str, fallback: float):
+    from utils.ocr_engines import FallbackEngine, MangaOCREngine, OllamaEngine
+
+    if spec == "ollama":
+        return OllamaEngine()
+    if spec == "ollama-single":
+        return OllamaEngine(multi=False)
+    if spec == "manga-ocr":
+        return MangaOCREngine()
+    if spec == "manga-ocr+ollama":
+        return FallbackEngine(MangaOCREngine(), OllamaEngine(), fallback)
+    raise SystemExit(f"Unknown engine {spec} (ollama, ollama-single, manga-ocr, manga-ocr+ollama)")
+
+
+def evaluate(label: str, engine, paths: list[str], labels: list[str], single_rounds: int) -> dict:
+    # Warm up (model loading, first request) so it doesn't count as latency
+    engine.recognize(paths[:1])
+
+    single = []
+    for path in paths[:single_rounds]:
+        started = time.perf_counter()
+        engine.recognize([path])
+        single.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    results = engine.recognize(paths)
+    batch_seconds = time.perf_counter() - started
+
+    errors = 0
+    chars = 0
+    exact = 0
+    for result, expected in zip(results, labels):
+        text, expected = normalize(result.text), normalize(expected)
+        errors += edit_distance(text, expected)
+        chars += len(expected)
+        exact += text == expected
+
+    confidences = [r.confidence for r in results if r.confidence is not None]
+    single.sort()
+    return {
+        "engine": label,
+        "crops": len(paths),
+        "cer": errors / max(chars, 1),
+        "exact": exact / len(paths),
+        "single_median_ms": statistics.median(single) * 1000,
+        "single_p95_ms": single[min(len(single) - 1, int(len(single) * 0.95))] * 1000,
+        "batch_crops_per_s": len(paths) / batch_seconds,
+        "mean_confidence": statistics.mean(confidences) if confidences else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR engines on a labelled crop set")
+    parser.add_argument("crops", type=Path, help="folder with crops and labels.json")
+    parser.add_argument("--engines", default="ollama,manga-ocr",
+                        help="comma separated: ollama, ollama-single, manga-ocr, manga-ocr+ollama")
+    parser.add_argument("--fallback", type=float, default=0.8,
+                        help="confidence threshold of manga-ocr+ollama")
+    parser.add_argument("--single-rounds", type=int, default=20, help="crops timed one by one")
+    parser.add_argument("--stub", action="store_true", help="run the Ollama engine against the stub server")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    paths, labels = load_crop_set(args.crops)
+
+    server = None
+    if args.stub:
+        from bench.stub_ollama import start_stub
+        server, url = start_stub()
+        # The host pool reads OLLAMA_HOSTS when utils.llm is first imported
+        os.environ["OLLAMA_HOSTS"] = url
+
+    rows = []
+    for spec in args.engines.split(","):
+        print(f"Running {spec} on {len(paths)} crops...")
+        try:
+            rows.append(evaluate(spec, build_engine(spec, args.fallback), paths, labels, args.single_rounds))
+        except RuntimeError as e:
+            print(f"  skipped: {e}")
+
+    if server is not None:
+        server.shutdown()
+
+    print(f"\n{'engine':<28} {'CER':>7} {'exact':>7} {'single p50':>11} {'single p95':>11} {'batch':>12} {'conf':>6}")
+    for row in rows:
+        conf = f"{row['mean_confidence']:.2f}" if row["mean_confidence"] is not None else "-"
+        print(f"{row['engine']:<28} {row['cer']:7.1%} {row['exact']:7.1%} "
+              f"{row['single_median_ms']:9.0f}ms {row['single_p95_ms']:9.0f}ms "
+              f"{row['batch_crops_per_s']:8.1f}/s {conf:>6}")
+
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Exercise the Ollama host pool against several local stub servers.
+
+Starts --hosts stub servers (the last one without the translation model) plus
+--dead unreachable addresses, points OLLAMA_HOSTS at all of them and runs
+OCR requests and page translations through utils.llm. Run from backend/:
+
+    python -m bench.pool
+    python -m bench.pool --hosts 4 --dead 1 --ocr 200 --pages 8 --ocr-delay 0.05
+
+The report shows how requests were spread over the hosts, that every
+translation of a page stayed on one host, and the failovers away from dead
+hosts and hosts without the model. The exit code is 1 if a request failed
+or a check didn't hold.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from bench.stub_ollama import DEFAULT_MODELS, StubConfig, start_stub
+
+
+def unused_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the Ollama host pool with stub servers")
+    parser.add_argument("--hosts", type=int, default=3, help="stub servers (the last one lacks the translation model)")
+    parser.add_argument("--dead", type=int, default=1, help="unreachable hosts added to the pool")
+    parser.add_argument("--ocr", type=int, default=60, help="OCR requests, sent from 12 threads")
+    parser.add_argument("--pages", type=int, default=6, help="pages to translate")
+    parser.add_argument("--bubbles", type=int, default=3, help="translations per page")
+    parser.add_argument("--ocr-delay", type=float, default=0.02, help="stub /api/generate delay (s)")
+    parser.add_argument("--token-delay", type=float, default=0.001, help="stub delay between streamed tokens (s)")
+    args = parser.parse_args()
+
+    servers = []
+    for i in range(args.hosts):
+        models = list(DEFAULT_MODELS)
+        if i == args.hosts - 1 and args.hosts > 1:
+            models = [model for model in models if "thinking" not in model]
+        config = StubConfig(generate_delay=args.ocr_delay, token_delay=args.token_delay,
+                            thinking_tokens=20, content_tokens=20, models=models)
+        servers.append(start_stub(config=config))
+    urls = [url for _, url in servers] + [unused_url() for _ in range(args.dead)]
+    # The pool reads its hosts when utils.llm is first imported
+    os.environ["OLLAMA_HOSTS"] = ",".join(urls)
+
+    from utils import llm
+
+    # The client sends image files along, their content doesn't matter to the stub
+    workdir = Path(tempfile.mkdtemp(prefix="pool-bench-"))
+    image = str(workdir / "image.png")
+    Image.new("L", (64, 64), 255).save(image)
+
+    print(f"Pool of {len(urls)} hosts: {args.hosts} stubs, {args.dead} unreachable")
+    print(f"Limits: OCR {llm.SCHEDULER.limit(llm.OCR_MODEL)}, translation {llm.SCHEDULER.limit(llm.TRANSLATE_MODEL)} "
+          "concurrent requests (before health checks)")
+
+    with ThreadPoolExecutor(12) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(lambda _: llm.ocr_image(image), range(args.ocr)))
+        ocr_seconds = time.perf_counter() - started
+    print(f"\n{args.ocr} OCR requests in {ocr_seconds:.2f}s ({args.ocr / ocr_seconds:.0f}/s)")
+
+    llm.POOL.check_all()
+    print(f"After health checks: OCR {llm.SCHEDULER.limit(llm.OCR_MODEL)}, "
+          f"translation {llm.SCHEDULER.limit(llm.TRANSLATE_MODEL)} concurrent requests")
+
+    # Which host each page's translations went to, from the stubs' request counters
+    stubs = {url: server.RequestHandlerClass.counters for server, url in servers}
+    page_hosts: dict[str, list[str]] = {}
+
+    async def translate(page: str):
+        for _ in range(args.bubbles):
+            before = {url: counters.get("chat", 0) for url, counters in stubs.items()}
+            async for _ in llm.stream_translation(page, image, "テスト"):
+                pass
+            page_hosts.setdefault(page, []).extend(
+                url for url, counters in stubs.items() if counters.get("chat", 0) > before[url])
+
+    async def translate_pages():
+        # One after another, so the host counters tell which request went where
+        for i in range(args.pages):
+            page = str(workdir / f"page{i:03}.png")
+            Image.new("L", (64, 64), 255).save(page)
+            await translate(page)
+
+    started = time.perf_counter()
+    asyncio.run(translate_pages())
+    print(f"{args.pages * args.bubbles} translations in {time.perf_counter() - started:.2f}s")
+
+    print(f"\n{'host':<28} {'up':>3} {'ocr':>5} {'chat':>5} {'ok':>5} {'failed':>6}")
+    for status in llm.POOL.stats():
+        counters = stubs.get(status["url"], {})
+        print(f"{status['url']:<28} {'yes' if status['available'] else 'no':>3} {counters.get('generate', 0):5} "
+              f"{counters.get('chat', 0):5} {status['completed']:5} {status['failed']:6}")
+
+    spread = Counter(hosts[0] for hosts in page_hosts.values() if hosts)
+    print(f"\nPages per translation host: {dict(spread)}")
+    failures = []
+    if len(results) != args.ocr or not all(results):
+        failures.append("some OCR requests returned nothing")
+    if any(len(set(hosts)) != 1 for hosts in page_hosts.values()):
+        failures.append("translations of a page went to different hosts")
+    if args.hosts > 1 and servers[-1][1] in spread:
+        failures.append("a translation went to the host without the model")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
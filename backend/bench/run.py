@@ -0,0 +1,280 @@
+"""
+Offline micro-benchmarks for the backend's hot paths.
+
+Runs every stage against synthetic pages and a local stub Ollama server, so
+no GPU, model download or real manga is needed (detection is skipped when
+ultralytics or the YOLO weights are unavailable). Run from backend/:
+
+    python -m bench.run                      # run and compare against bench/baseline.json
+    python -m bench.run --save-baseline      # record the current numbers as the baseline
+    python -m bench.run --only decode,chop   # run a subset
+
+Each run is saved to bench/results/<timestamp>.json. A benchmark counts as a
+regression when its median is slower than the baseline median by more than
+its threshold; the exit code is 1 if any benchmark regressed.
+"""
+import argparse
+import asyncio
+import copy
+import gzip
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from bench.stub_ollama import StubConfig, start_stub
+
+BENCH_FOLDER = Path(__file__).parent
+RESULTS_FOLDER = BENCH_FOLDER / "results"
+DEFAULT_BASELINE = BENCH_FOLDER / "baseline.json"
+DEFAULT_THRESHOLD = 0.20
+# Benchmarks that cross a socket are noisier than pure CPU work
+THRESHOLDS = {
+    "ocr_roundtrip": 0.50,
+    "ocr_batch_roundtrip": 0.50,
+    "translate_stream": 0.50,
+}
+
+SENTENCES = [
+    "今日は良い天気ですね。",
+    "夏のある日、私は一人で家の前の浜に居た。",
+    "お前、本気でそんなこと言ってるのか！？",
+    "この箱は誰のものですか？",
+    "ちょっと待って…まだ準備ができてないよ！",
+]
+
+
+class Bench:
+    def __init__(self, rounds: int, only: set[str] | None):
+        self.rounds = rounds
+        self.only = only
+        self.results: dict[str, dict] = {}
+        self.skipped: dict[str, str] = {}
+        self.loop = asyncio.new_event_loop()
+
+    def wanted(self, name: str) -> bool:
+        return not self.only or name in self.only or name.split("_")[0] in self.only
+
+    def run(self, name: str, fn, rounds: int | None = None, warmup: int = 2):
+        if not self.wanted(name):
+            return
+        rounds = rounds or self.rounds
+        is_async = asyncio.iscoroutinefunction(fn)
+        call = (lambda: self.loop.run_until_complete(fn())) if is_async else fn
+
+        for _ in range(warmup):
+            call()
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - start)
+
+        timings.sort()
+        self.results[name] = {
+            "rounds": rounds,
+            "min": timings[0],
+            "median": statistics.median(timings),
+            "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            "mean": statistics.fmean(timings),
+        }
+        print(f"  {name:<24} median {self.results[name]['median'] * 1000:9.3f} ms"
+              f"   p95 {self.results[name]['p95'] * 1000:9.3f} ms   ({rounds} rounds)")
+
+    def skip(self, name: str, reason: str):
+        if self.wanted(name):
+            self.skipped[name] = reason
+            print(f"  {name:<24} skipped: {reason}")
+
+
+def run_benchmarks(bench: Bench, workdir: str):
+    # Imported here so OLLAMA_HOSTS already points at the stub server
+    from bench.synthetic import make_page, make_volume
+    from utils import llm
+    from utils.pages import crop_box, open_page, save_crop
+    from utils.page_store import PageStore
+    from utils.sse import batch_events, format_event
+    from utils import translations as translation_store
+    from utils.translations import load_translations, save_translations, set_translation
+    from fastapi.responses import JSONResponse
+    from ollama import ChatResponse
+    from utils.responses import FastJSONResponse
+
+    pages = make_volume(os.path.join(workdir, "volume"), pages=4)
+    png_path = os.path.join(workdir, "page.png")
+    page_img, boxes = make_page(seed=0)
+    page_img.save(png_path)
+
+    print("Image stages")
+    bench.run("decode_jpeg", lambda: open_page(pages[0]))
+    bench.run("decode_png", lambda: open_page(png_path))
+    page = open_page(pages[0])
+    crop_path = os.path.join(workdir, "crop.png")
+    bench.run("crop_page", lambda: [save_crop(page, box, crop_path) for box in boxes])
+
+    # One bubble crop as a request sees it: a fresh decode, or a slice of the
+    # memory-mapped page another worker already stored (mapping opened per crop)
+    store = PageStore(os.path.join(workdir, "raw"), open_pages=0)
+    store.get(pages[1])
+    bench.run("crop_bubble_decoded", lambda: crop_box(open_page(pages[1]), boxes[0]).load())
+    bench.run("crop_bubble_page_store", lambda: crop_box(store.get(pages[1]), boxes[0]).load())
+
+    from utils.detection import DETECTOR
+    try:
+        model = DETECTOR.load()
+    except Exception as e:
+        bench.skip("detect", f"detector unavailable ({type(e).__name__}: {e})")
+    else:
+        bench.run("detect", lambda: model(page, verbose=False), rounds=max(3, bench.rounds // 5))
+
+    print("Text stages")
+    bench.run("chop", lambda: [llm.chop(s) for s in SENTENCES])
+
+    def analyze_response():
+        # Same shape /analyze-multiple returns for a dense page
+        tokens, breakdown = [], []
+        for i, sentence in enumerate(SENTENCES * 4):
+            t, h, r = llm.chop(sentence)
+            tokens += [{"text": x, "bubbleIndex": i} for x in t]
+            breakdown.append({"bubbleIndex": i, "ocr_text": sentence, "ocr_tokens": t,
+                              "hiragana_tokens": h, "romaji_tokens": r})
+        return {"ocr_tokens": tokens, "hiragana_tokens": tokens, "romaji_tokens": tokens,
+                "bubbleBreakdown": breakdown}
+
+    response = analyze_response()
+    bench.run("json_analyze_multiple", lambda: JSONResponse(response).body)
+    bench.run("json_analyze_orjson", lambda: FastJSONResponse(response).body)
+    # ...and its compact format
+    compact = {"format": "compact", "ocr_texts": [], "ocr_tokens": [], "hiragana_tokens": [],
+               "romaji_tokens": [], "bubble_offsets": [0]}
+    for bubble in response["bubbleBreakdown"]:
+        compact["ocr_texts"].append(bubble["ocr_text"])
+        for key in ("ocr_tokens", "hiragana_tokens", "romaji_tokens"):
+            compact[key] += bubble[key]
+        compact["bubble_offsets"].append(len(compact["ocr_tokens"]))
+    bench.run("json_analyze_compact", lambda: FastJSONResponse(compact).body)
+    for label, body in (("verbose", JSONResponse(response).body), ("compact", FastJSONResponse(compact).body)):
+        if bench.wanted("json_analyze_compact"):
+            print(f"    {label} payload: {len(body)} bytes, {len(gzip.compress(body, 6))} gzipped")
+
+    chunks = [ChatResponse(model="m", message={"role": "assistant", "thinking": f"think{i} "}) for i in range(300)]
+    chunks += [ChatResponse(model="m", message={"role": "assistant", "content": f"word{i} "}) for i in range(100)]
+
+    async def sse_frames():
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+        async for batch in batch_events(llm._translation_events(stream(), "bench", time.perf_counter())):
+            "".join(format_event(event, i) for i, event in enumerate(batch))
+
+    bench.run("sse_translation_frames", sse_frames)
+
+    print("Translation store")
+    store_path = os.path.join(workdir, "translation.json")
+    store = {}
+    for p in range(200):
+        for b in range(8):
+            set_translation(store, f"page_{p:03d}.jpg", b, str(b + 1), SENTENCES[b % 5], "Some English translation text.")
+    save_translations(store_path, store)
+
+    def load():
+        # Forget the parsed copy, so this measures reading and parsing the file
+        translation_store._parsed.pop(store_path, None)
+        return load_translations(store_path)
+
+    def save_one():
+        # load_translations() returns the shared parsed dict, never modify it in place
+        translations = copy.deepcopy(load_translations(store_path))
+        set_translation(translations, "page_100.jpg", 3, "4", SENTENCES[0], "Updated translation.")
+        save_translations(store_path, translations)
+
+    bench.run("store_load", load)
+    bench.run("store_load_cached", lambda: load_translations(store_path))
+    bench.run("store_save_bubble", save_one)
+
+    print("Stub Ollama round trips")
+    # The crop file every round trip sends
+    save_crop(page, boxes[0], crop_path)
+    bench.run("ocr_roundtrip", lambda: llm.ocr_image(crop_path))
+    bench.run("ocr_batch_roundtrip", lambda: llm.ocr_images([crop_path] * 6))
+
+    async def translate_stream():
+        async for _ in llm.stream_translation(pages[0], crop_path, SENTENCES[0]):
+            pass
+
+    bench.run("translate_stream", translate_stream, rounds=max(3, bench.rounds // 5))
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    print(f"\n{'benchmark':<24} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, current in results.items():
+        if name not in baseline:
+            print(f"{name:<24} {'-':>12} {current['median'] * 1000:10.3f}ms {'new':>9}")
+            continue
+        before = baseline[name]["median"]
+        change = current["median"] / before - 1 if before else 0.0
+        limit = THRESHOLDS.get(name, threshold)
+        flag = ""
+        if change > limit:
+            flag = f"  REGRESSION (> {limit:.0%})"
+            regressions.append(name)
+        print(f"{name:<24} {before * 1000:10.3f}ms {current['median'] * 1000:10.3f}ms {change:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend micro-benchmarks")
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--only", help="comma separated benchmark names or prefixes (e.g. decode,store)")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed median slowdown before a benchmark counts as regressed")
+    args = parser.parse_args()
+
+    server, url = start_stub(config=StubConfig(thinking_tokens=300, content_tokens=100))
+    # Read by the host pool when utils.llm is first imported
+    os.environ["OLLAMA_HOSTS"] = url
+
+    bench = Bench(args.rounds, set(args.only.split(",")) if args.only else None)
+    with tempfile.TemporaryDirectory() as workdir:
+        run_benchmarks(bench, workdir)
+    server.shutdown()
+
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "results": bench.results,
+        "skipped": bench.skipped,
+    }
+    RESULTS_FOLDER.mkdir(exist_ok=True)
+    result_path = RESULTS_FOLDER / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    result_path.write_text(json.dumps(run, indent=2))
+    print(f"\nSaved results to {result_path}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(run, indent=2))
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return
+
+    baseline = json.loads(args.baseline.read_text())["results"]
+    regressions = compare(bench.results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
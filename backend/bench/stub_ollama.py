@@ -0,0 +1,198 @@
+"""
+Minimal stand-in for the Ollama HTTP API used by benchmarks and load tests.
+
+Serves /api/tags, /api/generate and /api/chat with canned responses and
+configurable delays so the backend can be exercised without a GPU:
+
+    python -m bench.stub_ollama --port 11435 --ocr-delay 0.2 --ttft 0.5 --token-delay 0.02
+
+then start the backend with OLLAMA_HOSTS=http://127.0.0.1:11435.
+"""
+import argparse
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_MODELS = [
+    "huihui_ai/qwen3-vl-abliterated:4b-instruct",
+    "huihui_ai/qwen3-vl-abliterated:8b-thinking",
+    "huihui_ai/qwen3-vl-abliterated:8b-instruct",
+]
+
+
+@dataclass
+class StubConfig:
+    ocr_text: str = "これはテストです。\nよろしくお願いします！"
+    word_info: str = "1. test\n2. trial\n3. experiment"
+    generate_delay: float = 0.0     # seconds before a /api/generate response
+    ttft: float = 0.0               # seconds before the first streamed chat token
+    token_delay: float = 0.0        # seconds between streamed chat tokens
+    thinking_tokens: int = 200
+    content_tokens: int = 80
+    models: list[str] = field(default_factory=lambda: list(DEFAULT_MODELS))
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    config: StubConfig = StubConfig()
+    counters: dict = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, name: str):
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    def _json(self, body: dict, status: int = 200):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode() + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _read_body(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._json({"models": [{"name": m, "model": m} for m in self.config.models]})
+        elif self.path == "/api/version":
+            self._json({"version": "stub"})
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        body = self._read_body()
+        if body.get("model") and body["model"] not in self.config.models:
+            self._json({"error": f"model '{body['model']}' not found"}, 404)
+            return
+        if self.path == "/api/generate":
+            self._count("generate")
+            self._generate(body)
+        elif self.path == "/api/chat":
+            self._count("chat")
+            self._chat(body)
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def _generate(self, body: dict):
+        time.sleep(self.config.generate_delay)
+        prompt = body.get("prompt", "")
+        if isinstance(body.get("format"), dict):
+            # Structured multi-crop OCR: one text per attached image
+            response = json.dumps([self.config.ocr_text] * len(body.get("images") or []), ensure_ascii=False)
+        elif "meanings" in prompt:
+            response = self.config.word_info
+        else:
+            response = self.config.ocr_text
+        self._json({
+            "model": body.get("model", ""),
+            "created_at": _now(),
+            "response": response,
+            "done": True,
+            "done_reason": "stop",
+            "eval_count": len(response),
+            "eval_duration": int(self.config.generate_delay * 1e9),
+        })
+
+    def _chat(self, body: dict):
+        model = body.get("model", "")
+        if not body.get("stream", True):
+            time.sleep(self.config.ttft)
+            self._json({
+                "model": model,
+                "created_at": _now(),
+                "message": {"role": "assistant", "content": "Stub answer."},
+                "done": True,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        started = time.perf_counter()
+        time.sleep(self.config.ttft)
+        tokens = [("thinking", f"think{i} ") for i in range(self.config.thinking_tokens)]
+        tokens += [("content", f"word{i} ") for i in range(self.config.content_tokens)]
+        try:
+            for kind, text in tokens:
+                self._chunk({
+                    "model": model,
+                    "created_at": _now(),
+                    "message": {"role": "assistant", "content": "", kind: text},
+                    "done": False,
+                })
+                if self.config.token_delay:
+                    time.sleep(self.config.token_delay)
+            self._chunk({
+                "model": model,
+                "created_at": _now(),
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "done_reason": "stop",
+                "eval_count": len(tokens),
+                "eval_duration": int((time.perf_counter() - started) * 1e9),
+            })
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_stub(port: int = 0, config: StubConfig | None = None) -> tuple[ThreadingHTTPServer, str]:
+    """Start a stub server on a background thread. Returns (server, base url)."""
+    handler = type("StubHandler", (_Handler,), {"config": config or StubConfig(), "counters": {}})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama server")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ocr-delay", type=float, default=0.0, help="delay of /api/generate responses (s)")
+    parser.add_argument("--ttft", type=float, default=0.0, help="delay before the first chat token (s)")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="delay between chat tokens (s)")
+    parser.add_argument("--thinking-tokens", type=int, default=200)
+    parser.add_argument("--content-tokens", type=int, default=80)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        generate_delay=args.ocr_delay,
+        ttft=args.ttft,
+        token_delay=args.token_delay,
+        thinking_tokens=args.thinking_tokens,
+        content_tokens=args.content_tokens,
+    )
+    server, url = start_stub(args.port, config)
+    print(f"Stub Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,79 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, StreamingResponse
+import time
+STARTED = time.perf_counter()  # before the imports below, so startup timing includes them
+
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import FileResponse, StreamingResponse, Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from PIL import Image
-from ultralytics import YOLO
-import ollama
-from ollama import ChatResponse
+import asyncio
 import os
-import json
+import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List
 from urllib.parse import unquote
-from utils.llm import ocr_image, chop, stream_translation, stream_translation_multiple, word_information
-
-app = FastAPI()
+from utils.llm import chop, kakasi, stream_translation, stream_translation_multiple, word_information, SCHEDULER, POOL, TRANSLATE_MODEL
+from utils.detection import detect_boxes, DETECTOR, DETECTION_WARMUP, DETECTION_PROFILE, PROFILES
+from utils.ocr import ocr_bubble, ocr_bubbles
+from utils.pages import page_key, box_key, open_page, save_crop, list_images, crop_template, remove_files
+from utils.page_store import load_page
+from utils.prefetch import PREFETCHER
+from utils.translations import load_translations, update_translations, translations_etag, TranslationsChanged
+from utils.sse import SSE_HEADERS
+from utils.translation_jobs import start_job, get_job, live_job, TranslationJob, translation_key, cache_translation, replay_translation
+from utils.cache import TRANSLATION_CACHE
+from utils.volume_jobs import VOLUME_JOBS
+from utils.chat import ChatBusy, create_session, get_session, SESSIONS
+from utils.dictionary import DICTIONARY, format_lookup
+from utils.responses import FastJSONResponse, CompressionMiddleware
+from utils.single_flight import SingleFlight, single_flight
+from utils.executors import runs_in, reject, Saturated, EXECUTORS, IMAGE_EXECUTOR, DETECT_EXECUTOR, LLM_EXECUTOR, TRANSLATION_QUEUE_LIMIT
+from utils import metrics
+from utils import tracing
+from utils.tracing import profiled
+
+tracing.configure_logging()
+logger = logging.getLogger(__name__)
+
+
+# Seconds from process start until the app accepted requests, set by lifespan()
+STARTUP_SECONDS = None
+
+
+def warm_up():
+    """Load the tokenizer and the detector so the first requests don't pay for it."""
+    kakasi()
+    if DETECTION_WARMUP:
+        DETECTOR.warm_up()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global STARTUP_SECONDS
+    # Models load in the background; images and thumbnails are served right away
+    app.state.warm_up = asyncio.create_task(asyncio.to_thread(warm_up))
+    if not DICTIONARY.available:
+        logger.info("No dictionary at %s, /word asks the LLM for every word (import one with: python -m utils.dictionary JMdict_e.gz)",
+                    DICTIONARY.path)
+    # Resume volume jobs that were interrupted by the last shutdown
+    VOLUME_JOBS.start()
+    # Keep track of which Ollama hosts are up and which models they have
+    POOL.start()
+    STARTUP_SECONDS = round(time.perf_counter() - STARTED, 2)
+    logger.info("Backend ready in %.2fs (detector: %s)", STARTUP_SECONDS,
+                "warming up" if DETECTION_WARMUP else "loaded on first use")
+    yield
+    await VOLUME_JOBS.stop()
+    await POOL.stop()
+    for executor in EXECUTORS:
+        executor.shutdown()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Compress large JSON responses (brotli/gzip); event streams pass through
+app.add_middleware(CompressionMiddleware)
 
 # Add CORS middleware to allow frontend requests
 app.add_middleware(
@@ -22,7 +82,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Job-ID", "X-Request-ID", "X-Profile-ID", "ETag", "Retry-After"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+
+
+@app.exception_handler(Saturated)
+def saturated_handler(request, exc: Saturated):
+    # Fail fast so the client can back off instead of waiting in an endless queue
+    return FastJSONResponse({"detail": str(exc)}, status_code=exc.status_code,
+                            headers={"Retry-After": str(exc.retry_after)})
 
 # Storage for translations (in production, use a database)
 TRANSLATIONS_FILE = None
@@ -31,11 +101,9 @@ THUMBNAIL_FOLDER = "thumbnails"
 Path(CROP_FOLDER).mkdir(exist_ok=True)
 Path(THUMBNAIL_FOLDER).mkdir(exist_ok=True)
 
-# --- Load YOLO model ---
-model = YOLO(".\\models\\comic-speech-bubble-detector.pt")
-
 class DetectRequest(BaseModel):
     image: str  # path or url
+    profile: Optional[str] = None  # fast, balanced or accurate (default DETECTION_PROFILE)
 
 
 class AnalyzeRequest(BaseModel):
@@ -45,11 +113,13 @@ class AnalyzeRequest(BaseModel):
 class AnalyzeMultipleRequest(BaseModel):
     image: str
     boxes: List[dict]  # Array of boxes in selection order
+    compact: Optional[bool] = False  # parallel token arrays with bubble offsets
 
 class TranslateRequest(BaseModel):
     image: str
     box: dict
     ocr_text: str
+    refresh: Optional[bool] = False  # ignore a cached translation of this bubble
 
 class TranslateMultipleRequest(BaseModel):
     image: str
@@ -67,9 +137,35 @@ class SaveTranslationRequest(BaseModel):
     translation: str
     original_text: str
 
+class SaveTranslationsBatchRequest(BaseModel):
+    translations: List[SaveTranslationRequest]
+
 class InfoRequest(BaseModel):
     image: str
     word: str
+    llm: Optional[bool] = False  # skip the dictionary and ask the LLM
+
+class VolumeJobRequest(BaseModel):
+    folder_path: str
+    translate: Optional[bool] = True  # also translate every bubble, not just detect + OCR
+
+class ChatContextRequest(BaseModel):
+    image: Optional[str] = None  # page the conversation is about (path or url)
+    ocr_text: Optional[str] = None
+    translation: Optional[str] = None
+
+class ChatSessionRequest(ChatContextRequest):
+    model: Optional[str] = None
+    history: Optional[List[dict]] = None  # earlier [{role, content}] turns to continue from
+
+class ChatMessageRequest(BaseModel):
+    content: str
+    images: Optional[List[str]] = None  # paths or urls
+
+class PrefetchRequest(BaseModel):
+    image: str  # page currently being read
+    pages: Optional[int] = None  # how many following pages to prepare
+    ocr: Optional[bool] = None  # also OCR the detected bubbles
 
 
 def image_path_from_url(url: str) -> str:
@@ -77,34 +173,75 @@ def image_path_from_url(url: str) -> str:
         return url  # Assume it's a direct path
     return unquote(url.replace("http://localhost:8000/api/image?path=", ""))
 
+# Identical requests in flight at the same time (double clicks, several tabs,
+# retries) share one computation. Pages are identified by content.
+DETECT_FLIGHTS = SingleFlight("detect")
+ANALYZE_FLIGHTS = SingleFlight("analyze")
+WORD_FLIGHTS = SingleFlight("word")
+
+
+def detect_request_key(req: DetectRequest) -> str:
+    return f"{page_key(image_path_from_url(req.image))}|{req.profile or DETECTION_PROFILE}"
+
+
+def analyze_request_key(req: AnalyzeRequest) -> str:
+    return f"one|{box_key(page_key(image_path_from_url(req.image)), req.box)}"
+
+
+def analyze_multiple_request_key(req: AnalyzeMultipleRequest) -> str:
+    page_id = page_key(image_path_from_url(req.image))
+    return f"multi|{req.compact}|" + "|".join(box_key(page_id, box) for box in req.boxes)
+
+
+def word_request_key(req: InfoRequest) -> str:
+    return f"{page_key(image_path_from_url(req.image))}|{req.word}|{req.llm}"
+
+
+@profiled
 def img_and_crop(req: AnalyzeRequest | TranslateRequest) -> tuple[Image.Image, str, Image.Image, str]:
     image_path = image_path_from_url(req.image)
-    img = Image.open(image_path)
-    x, y, w, h = req.box["x"], req.box["y"], req.box["w"], req.box["h"]
-    crop = img.crop((x, y, x + w, y + h))
-    crop_path = f"{CROP_FOLDER}/temp_crop.png"
-    crop.save(crop_path)
+    img = load_page(image_path)
+    crop_path = crop_template(CROP_FOLDER).format(0)
+    crop = save_crop(img, req.box, crop_path)
     return img, image_path, crop, crop_path
 
+
+async def removing_files(events: AsyncIterator[dict], paths: list[str]) -> AsyncIterator[dict]:
+    """Pass the events through and remove the request's crops once the stream ends."""
+    try:
+        async for event in events:
+            yield event
+    finally:
+        remove_files(paths)
+
 @app.post("/detect")
+@single_flight(DETECT_FLIGHTS, detect_request_key)
+@runs_in(DETECT_EXECUTOR)
+@profiled
 def detect(req: DetectRequest):
-    img = Image.open(image_path_from_url(req.image))
-    results = model(img)
-
-    boxes = []
-    for r in results[0].boxes:
-        x1, y1, x2, y2 = r.xyxy[0].tolist()
-        boxes.append({
-            "x": x1,
-            "y": y1,
-            "w": x2 - x1,
-            "h": y2 - y1
-        })
-
+    try:
+        boxes = detect_boxes(image_path_from_url(req.image), req.profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        # Missing weights: the rest of the reader keeps working
+        raise HTTPException(status_code=503, detail=str(e))
     return {"boxes": boxes}
 
 
+@app.get("/detect/profiles")
+def detection_profiles():
+    """Detection profiles a /detect request can pick, and the default one."""
+    return {
+        "default": DETECTION_PROFILE,
+        "profiles": {name: profile.predict_args() for name, profile in PROFILES.items()}
+    }
+
+
 @app.post("/analyze")
+@single_flight(ANALYZE_FLIGHTS, analyze_request_key)
+@runs_in(LLM_EXECUTOR)
+@profiled
 def analyze(req: AnalyzeRequest):
     """
     Analyze a speech bubble and return tokenized OCR, hiragana, romaji.
@@ -117,9 +254,10 @@ def analyze(req: AnalyzeRequest):
         "romaji_tokens": ["kono", "hako", "wa"],
     }
     """
-    # 1. Crop bubble
-    page, page_path, crop, crop_path = img_and_crop(req=req)
-    ocr_text = ocr_image(crop_path)
+    # 1. Crop bubble and OCR it (cached per page and box)
+    image_path = image_path_from_url(req.image)
+    page = load_page(image_path)
+    ocr_text = ocr_bubble(page, page_key(image_path), req.box, crop_template(CROP_FOLDER))
     ocr_text = ocr_text.replace("\n", "")
 
     tokens, hiragana, romanji =  chop(text=ocr_text)
@@ -135,6 +273,9 @@ def analyze(req: AnalyzeRequest):
 
 
 @app.post("/analyze-multiple")
+@single_flight(ANALYZE_FLIGHTS, analyze_multiple_request_key)
+@runs_in(LLM_EXECUTOR)
+@profiled
 def analyze_multiple(req: AnalyzeMultipleRequest):
     """
     Analyze multiple speech bubbles in order and return combined tokens with bubble metadata.
@@ -161,31 +302,42 @@ def analyze_multiple(req: AnalyzeMultipleRequest):
             ...
         ]
     }
+
+    With `compact: true` the tokens of all bubbles come as flat parallel arrays,
+    bubble i spanning ocr_tokens[bubble_offsets[i]:bubble_offsets[i + 1]]:
+    {
+        "format": "compact",
+        "ocr_texts": ["この箱", "それ..."],
+        "ocr_tokens": ["この", "箱", "それ", ...],
+        "hiragana_tokens": [...],
+        "romaji_tokens": [...],
+        "bubble_offsets": [0, 2, 5]
+    }
     """
     image_path = image_path_from_url(req.image)
-    page = Image.open(image_path)
+    page = load_page(image_path)
+    page_id = page_key(image_path)
 
     all_ocr_tokens = []
     all_hiragana_tokens = []
     all_romaji_tokens = []
     bubble_breakdown = []
 
-    for bubble_idx, box in enumerate(req.boxes):
-        # Crop bubble
-        x, y, w, h = box["x"], box["y"], box["w"], box["h"]
-        crop = page.crop((x, y, x + w, y + h))
-        crop_path = f"{CROP_FOLDER}/bubble_{bubble_idx}.png"
-        crop.save(crop_path)
+    # Crop and OCR all bubbles (batched into as few vision requests as possible)
+    ocr_texts = ocr_bubbles(page, page_id, req.boxes, crop_template(CROP_FOLDER))
+
+    if req.compact:
+        return compact_analysis(ocr_texts)
 
-        # OCR and tokenize
-        ocr_text = ocr_image(crop_path)
+    for bubble_idx, ocr_text in enumerate(ocr_texts):
+        # Tokenize
         ocr_text = ocr_text.replace("\n", "")
 
-        print(f"[ANALYZE-MULTI] Bubble {bubble_idx} OCR Text: '{ocr_text}'")
+        logger.debug("Analyze-multi bubble %d OCR text: '%s'", bubble_idx, ocr_text)
 
         tokens, hiragana, romanji = chop(text=ocr_text)
 
-        print(f"[ANALYZE-MULTI] Bubble {bubble_idx} Tokens: {tokens}")
+        logger.debug("Analyze-multi bubble %d tokens: %s", bubble_idx, tokens)
 
         # Add to combined arrays with bubble index
         for t, h, r in zip(tokens, hiragana, romanji):
@@ -216,19 +368,87 @@ def analyze_multiple(req: AnalyzeMultipleRequest):
         "bubbleBreakdown": bubble_breakdown
     }
 
-    print(f"[ANALYZE-MULTI] Sending response with {len(req.boxes)} bubbles")
+    logger.info("Analyze-multi sending response with %d bubbles", len(req.boxes))
 
     return response
 
 
+def compact_analysis(ocr_texts: list[str]) -> dict:
+    texts, tokens, hiragana, romaji = [], [], [], []
+    offsets = [0]
+    for ocr_text in ocr_texts:
+        ocr_text = ocr_text.replace("\n", "")
+        t, h, r = chop(text=ocr_text)
+        texts.append(ocr_text)
+        tokens += t
+        hiragana += h
+        romaji += r
+        offsets.append(len(tokens))
+
+    return {
+        "format": "compact",
+        "ocr_texts": texts,
+        "ocr_tokens": tokens,
+        "hiragana_tokens": hiragana,
+        "romaji_tokens": romaji,
+        "bubble_offsets": offsets
+    }
+
+
+@profiled
+def cached_translation(req: TranslateRequest) -> tuple[str, dict | None]:
+    """The bubble's translation cache key and, unless refreshing, its cached events."""
+    key = translation_key(page_key(image_path_from_url(req.image)), req.box, req.ocr_text)
+    return key, None if req.refresh else TRANSLATION_CACHE.get(key)
+
+
+def admit_translation():
+    """Refuse new translations while too many already wait for the translation model."""
+    if SCHEDULER.queued(TRANSLATE_MODEL) >= TRANSLATION_QUEUE_LIMIT:
+        raise reject("translation", status_code=429)
+
+
+def attach_translation(job: TranslationJob) -> StreamingResponse:
+    """Follow a translation an identical request already started, from its first event."""
+    metrics.SINGLE_FLIGHT_SHARED.labels("translate").inc()
+    return job_stream_response(job)
+
+
 @app.post("/translate")
 async def translate(req: TranslateRequest):
     """
     A streaming API endpoint for translation of a given speechbubble.
-    The response includes thinking.
+    The translation runs as a server-side job that keeps generating if the
+    client disconnects. The response is a text/event-stream starting with a
+    `job` event carrying the job id, then {"type": "thinking"|"content", "text"}
+    events (coalesced into batches), heartbeat comments and a final `done` event
+    with timing and token counts. Every event has an id for resuming via
+    /translate/jobs/{job_id}/events.
+    Finished translations are cached per bubble and OCR text (volume jobs fill
+    the same cache); a cached one is replayed instantly unless `refresh` is set.
+    A request for a bubble that is being translated right now attaches to the
+    running job instead of starting a second generation.
     """
-    page, page_path, crop, crop_path = img_and_crop(req=req)
-    return StreamingResponse(stream_translation(page_path, crop_path, req.ocr_text), media_type="text/plain")
+    # Hashing a new page and reading the cache from disk must not block the loop
+    key, cached = await asyncio.to_thread(cached_translation, req)
+    if not req.refresh:
+        if cached is not None:
+            return job_stream_response(start_job(replay_translation(cached)))
+        live = live_job(key)
+        if live is not None:
+            return attach_translation(live)
+
+    admit_translation()
+    page, page_path, crop, crop_path = await IMAGE_EXECUTOR.run(img_and_crop, req=req)
+    # An identical request may have started the job while we were cropping
+    live = None if req.refresh else live_job(key)
+    if live is not None:
+        remove_files([crop_path])
+        return attach_translation(live)
+    events = stream_translation(page_path, crop_path, req.ocr_text)
+    events = cache_translation(removing_files(events, [crop_path]), key)
+    job = start_job(events, key)
+    return job_stream_response(job)
 
 
 @app.post("/translate-multiple")
@@ -237,33 +457,233 @@ async def translate_multiple(req: TranslateMultipleRequest):
     A streaming API endpoint for translation of multiple speechbubbles.
     Treats all bubbles as a connected conversation or sentence continuation.
     """
+    admit_translation()
     image_path = image_path_from_url(req.image)
-    page = Image.open(image_path)
+
+    @profiled
+    def crop_bubbles() -> list[str]:
+        page = load_page(image_path)
+        template = crop_template(CROP_FOLDER)
+        crop_paths = []
+        for bubble_idx, box in enumerate(req.boxes):
+            crop_path = template.format(bubble_idx)
+            save_crop(page, box, crop_path)
+            crop_paths.append(crop_path)
+        return crop_paths
 
     # Create crops for all bubbles
-    crop_paths = []
-    for bubble_idx, box in enumerate(req.boxes):
-        x, y, w, h = box["x"], box["y"], box["w"], box["h"]
-        crop = page.crop((x, y, x + w, y + h))
-        crop_path = f"{CROP_FOLDER}/bubble_{bubble_idx}.png"
-        crop.save(crop_path)
-        crop_paths.append(crop_path)
+    crop_paths = await IMAGE_EXECUTOR.run(crop_bubbles)
+
+    events = stream_translation_multiple(image_path, crop_paths, req.ocr_texts)
+    job = start_job(removing_files(events, crop_paths))
+    return job_stream_response(job)
+
 
+def job_stream_response(job: TranslationJob, last_event_id: int = -1) -> StreamingResponse:
     return StreamingResponse(
-        stream_translation_multiple(image_path, crop_paths, req.ocr_texts),
-        media_type="text/plain"
+        job.stream(last_event_id),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Job-ID": job.id}
     )
 
 
+@app.get("/translate/jobs/{job_id}")
+def translation_job_status(job_id: str):
+    """
+    Status of a translation job started by /translate or /translate-multiple.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Translation job not found or expired: {job_id}")
+    return job.status()
+
+
+@app.get("/translate/jobs/{job_id}/events")
+async def translation_job_events(job_id: str, last_event_id: Optional[int] = None,
+                                 last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")):
+    """
+    Reattach to a translation job after a disconnect or page reload.
+    Streams every event after the one given by the `Last-Event-ID` header
+    (or `last_event_id` query parameter) and then follows the job live.
+    Without either, the whole translation is replayed from the start.
+    Jobs stay available for TRANSLATION_JOB_TTL seconds after finishing.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Translation job not found or expired: {job_id}")
+
+    if last_event_id is None and last_event_id_header:
+        try:
+            last_event_id = int(last_event_id_header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid Last-Event-ID: {last_event_id_header}")
+    return job_stream_response(job, -1 if last_event_id is None else last_event_id)
+
+
+@app.post("/jobs")
+async def create_volume_job(req: VolumeJobRequest):
+    """
+    Queue pre-processing of a whole volume: detection, OCR and translation of
+    every bubble at background priority, filling the same caches the reader
+    uses. Progress survives restarts. Queuing a folder that already has a
+    pending job returns that job.
+    """
+    if not os.path.isdir(req.folder_path):
+        raise HTTPException(status_code=404, detail=f"Folder not found: {req.folder_path}")
+    if not list_images(req.folder_path):
+        raise HTTPException(status_code=404, detail=f"No images found in folder: {req.folder_path}")
+
+    job = VOLUME_JOBS.submit(req.folder_path, req.translate)
+    return job.status_dict()
+
+
+@app.get("/jobs")
+def list_volume_jobs():
+    """
+    All volume jobs with their progress, newest first.
+    """
+    jobs = sorted(VOLUME_JOBS.jobs.values(), key=lambda job: job.created, reverse=True)
+    return {"jobs": [job.status_dict() for job in jobs]}
+
+
+@app.get("/jobs/{job_id}")
+def volume_job_status(job_id: str):
+    """
+    Progress of a volume job: pages done/failed, bubbles processed and an ETA
+    based on the throughput since the job (re)started.
+    """
+    job = VOLUME_JOBS.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.status_dict()
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_volume_job(job_id: str):
+    """
+    Cancel a queued or running volume job. Pages already processed stay cached.
+    """
+    job = VOLUME_JOBS.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.status_dict()
+
+
+def chat_session_or_404(session_id: str):
+    session = get_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Chat session not found or expired: {session_id}")
+    return session
+
+
+def set_chat_context(session, req: ChatContextRequest):
+    session.set_context(image_path_from_url(req.image) if req.image else None, req.ocr_text, req.translation)
+
+
+@app.post("/chat/sessions")
+async def create_chat_session(req: ChatSessionRequest):
+    """
+    Start a chat held on the server. The page image and bubble text are
+    attached once as pinned context; every message afterwards only sends
+    itself. `history` continues an earlier conversation (text only), e.g.
+    after the server restarted or a message was edited.
+    """
+    session = create_session(req.model)
+    set_chat_context(session, req)
+    if req.history:
+        session.add_history([m for m in req.history if m.get("role") in ("user", "assistant") and m.get("content")])
+    return session.status()
+
+
+@app.put("/chat/sessions/{session_id}/context")
+def update_chat_context(session_id: str, req: ChatContextRequest):
+    """
+    Replace the pinned page/bubble context, e.g. when the reader moved on to
+    another page. The conversation history is kept.
+    """
+    session = chat_session_or_404(session_id)
+    set_chat_context(session, req)
+    return session.status()
+
+
+@app.post("/chat/sessions/{session_id}/messages")
+async def send_chat_message(session_id: str, req: ChatMessageRequest):
+    """
+    Send a message and stream the reply as a job, in the same event format as
+    /translate (reattach via /translate/jobs/{job_id}/events). The `done`
+    event also reports the history size after the turn. Older turns are
+    trimmed (and summarized) to CHAT_HISTORY_TOKENS.
+    """
+    session = chat_session_or_404(session_id)
+    images = [image_path_from_url(image) for image in req.images or ()]
+    try:
+        events = session.reply(req.content, images)
+    except ChatBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job_stream_response(start_job(events))
+
+
+@app.get("/chat/sessions/{session_id}")
+def chat_session_status(session_id: str):
+    """
+    The history the next message will be sent with and its estimated size.
+    """
+    return chat_session_or_404(session_id).status()
+
+
+@app.delete("/chat/sessions/{session_id}")
+def delete_chat_session(session_id: str):
+    if SESSIONS.pop(session_id, None) is None:
+        raise HTTPException(status_code=404, detail=f"Chat session not found or expired: {session_id}")
+    return {"deleted": session_id}
+
+
+@app.post("/api/prefetch")
+def prefetch(req: PrefetchRequest):
+    """
+    Called by the frontend whenever the reader navigates to a page.
+    Schedules low-priority detection (and optionally OCR) for the following
+    pages and cancels prefetch work left over from the previous page.
+    """
+    image_path = image_path_from_url(req.image)
+    if not os.path.isfile(image_path):
+        raise HTTPException(status_code=404, detail=f"Image not found: {image_path}")
+
+    kwargs = {}
+    if req.pages is not None:
+        kwargs["count"] = req.pages
+    if req.ocr is not None:
+        kwargs["ocr"] = req.ocr
+    pages = PREFETCHER.schedule(image_path, **kwargs)
+    return {"scheduled": [os.path.basename(p) for p in pages]}
+
+
 @app.post("/word")
+@single_flight(WORD_FLIGHTS, word_request_key)
+@runs_in(LLM_EXECUTOR)
+@profiled
 def info(req: InfoRequest):
     """
     Get information about what the given word can mean.
+    The local dictionary answers first (deinflecting the token); the LLM is
+    only asked for words it doesn't know, or when `llm` is set.
     """
+    if not req.llm:
+        with metrics.stage("dictionary"):
+            result = DICTIONARY.lookup(req.word)
+        metrics.cache_lookup("dictionary", result is not None)
+        if result is not None:
+            return {
+                "info": format_lookup(result),
+                "source": "dictionary",
+                "form": result["form"]
+            }
+
     image_path = image_path_from_url(req.image)
     response = word_information(req.word, image_path)
     return {
-        "info": response
+        "info": response,
+        "source": "llm"
     }
     
 
@@ -343,6 +763,8 @@ def get_image(path: str):
 
 
 @app.get("/api/thumbnail")
+@runs_in(IMAGE_EXECUTOR)
+@profiled
 def get_thumbnail(path: str, width: int = 120, height: int = 160):
     """
     Generate and serve thumbnail for an image
@@ -351,11 +773,10 @@ def get_thumbnail(path: str, width: int = 120, height: int = 160):
     - width: Maximum width for thumbnail (default: 120)
     - height: Maximum height for thumbnail (default: 160)
 
-    Thumbnails are cached in the thumbnails/ folder to avoid regeneration.
+    Thumbnails are cached in the thumbnails/ folder to avoid regeneration,
+    keyed by page content so copies of a page share one thumbnail.
     Example: /api/thumbnail?path=C:/manga/volume1/page1.jpg&width=120&height=160
     """
-    import hashlib
-
     # Validate path
     if not path:
         raise HTTPException(status_code=400, detail="Path parameter is required")
@@ -372,12 +793,14 @@ def get_thumbnail(path: str, width: int = 120, height: int = 160):
     if ext not in image_extensions:
         raise HTTPException(status_code=400, detail=f"File is not an image: {path}")
 
-    # Create cache key from path and dimensions
-    cache_key = hashlib.md5(f"{path}_{width}_{height}".encode()).hexdigest()
+    # Create cache key from page content and dimensions
+    cache_key = f"{page_key(path)}_{width}x{height}"
     thumb_path = os.path.join(THUMBNAIL_FOLDER, f"{cache_key}.jpg")
 
     # Return cached thumbnail if exists
-    if os.path.exists(thumb_path):
+    cached = os.path.exists(thumb_path)
+    metrics.cache_lookup("thumbnail", cached)
+    if cached:
         return FileResponse(
             thumb_path,
             media_type="image/jpeg",
@@ -390,10 +813,11 @@ def get_thumbnail(path: str, width: int = 120, height: int = 160):
 
     # Generate thumbnail
     try:
-        img = Image.open(path)
+        img = open_page(path)
 
         # Use thumbnail() method which maintains aspect ratio
-        img.thumbnail((width, height), Image.Resampling.LANCZOS)
+        with metrics.stage("thumbnail"):
+            img.thumbnail((width, height), Image.Resampling.LANCZOS)
 
         # Convert RGBA to RGB if necessary (for JPEG)
         if img.mode == 'RGBA':
@@ -419,41 +843,76 @@ def get_thumbnail(path: str, width: int = 120, height: int = 160):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating thumbnail: {str(e)}")
 
+def translation_entry(req: SaveTranslationRequest) -> dict:
+    return {
+        "image_name": req.image_name,
+        "box_index": req.box_index,
+        "marker": req.marker,
+        "original": req.original_text,
+        "translation": req.translation,
+    }
+
+
+def require_translations_file() -> str:
+    if TRANSLATIONS_FILE is None:
+        raise HTTPException(status_code=400, detail="No folder loaded")
+    return TRANSLATIONS_FILE
+
+
 @app.post("/api/translations")
 def save_translation(req: SaveTranslationRequest):
     """
     Save a user translation for a specific bubble
     Stores in JSON file
     """
+    path = require_translations_file()
+    try:
+        update_translations(path, [translation_entry(req)])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving translation: {str(e)}")
+
+    return {"success": True, "message": "Translation saved successfully"}
+
+
+@app.post("/api/translations/batch")
+def save_translations_batch(req: SaveTranslationsBatchRequest,
+                            if_match: Optional[str] = Header(None)):
+    """
+    Save many bubbles at once with a single atomic write of translation.json.
+    With an `If-Match` header (the ETag from GET /api/translations) the write is
+    rejected with 412 if the file changed in the meantime.
+    Returns the new ETag.
+    """
+    path = require_translations_file()
+    try:
+        etag = update_translations(path, [translation_entry(t) for t in req.translations], if_match)
+    except TranslationsChanged:
+        raise HTTPException(status_code=412, detail="Translations changed since they were loaded")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving translations: {str(e)}")
 
-    # Load existing translations
-    translations = {}
-    if os.path.exists(TRANSLATIONS_FILE):
-        try:
-            with open(TRANSLATIONS_FILE, 'r', encoding='utf-8') as f:
-                translations = json.load(f)
-        except Exception as e:
-            print(f"Error loading translations: {e}")
+    return FastJSONResponse({"success": True, "saved": len(req.translations)}, headers={"ETag": etag})
 
-    # Create structure if needed
-    if req.image_name not in translations:
-        translations[req.image_name] = {}
 
-    # Save translation
-    translations[req.image_name][str(req.box_index)] = {
-        "marker": req.marker,
-        "original": req.original_text,
-        "translation": req.translation
-    }
+@app.get("/api/translations")
+def get_all_translations(if_none_match: Optional[str] = Header(None)):
+    """
+    Get the saved translations of every page of the loaded folder in one response:
+    {image_name: {boxIndex: {marker, original, translation}}}
+    Sends an ETag; a request with a matching `If-None-Match` gets 304 without
+    the file being read.
+    """
+    path = require_translations_file()
+    etag = translations_etag(path)
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
 
-    # Write back to file
     try:
-        with open(TRANSLATIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(translations, f, ensure_ascii=False, indent=2)
+        translations = load_translations(path)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error saving translation: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error loading translations: {str(e)}")
 
-    return {"success": True, "message": "Translation saved successfully"}
+    return FastJSONResponse(translations, headers={"ETag": etag})
 
 
 @app.get("/api/translations/{image_name}")
@@ -463,12 +922,8 @@ def get_translations(image_name: str):
     Returns dict of {boxIndex: {marker, translation}}
     """
     # Load translations
-    if not os.path.exists(TRANSLATIONS_FILE):
-        return {}
-
     try:
-        with open(TRANSLATIONS_FILE, 'r', encoding='utf-8') as f:
-            translations = json.load(f)
+        translations = load_translations(TRANSLATIONS_FILE)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading translations: {str(e)}")
 
@@ -479,9 +934,74 @@ def get_translations(image_name: str):
 @app.get("/health")
 def health_check():
     """
-    Health check endpoint for frontend to verify backend is running
+    Health check endpoint for frontend to verify backend is running.
+    `startup_seconds` is how long the backend took to accept requests,
+    `detector` whether the YOLO model is loaded yet.
+    """
+    return {
+        "status": "healthy",
+        "message": "Backend is running",
+        "startup_seconds": STARTUP_SECONDS,
+        "uptime_seconds": round(time.perf_counter() - STARTED, 1),
+        "detector": DETECTOR.status()
+    }
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms, LLM
+    time-to-first-token and tokens/second, cache hits and error counters.
+    """
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/debug/profiles/{trace_id}")
+def get_profile(trace_id: str, format: str = "prof"):
+    """
+    Download the profile of a request made with `X-Profile: 1` or `?profile=1`.
+    The trace ID is returned in the request's `X-Profile-ID` header.
+    format=prof returns the raw cProfile dump (open with snakeviz / pstats),
+    format=text a summary of the slowest functions.
+    """
+    if not tracing.TRACE_ID_PATTERN.fullmatch(trace_id):
+        raise HTTPException(status_code=400, detail=f"Invalid trace id: {trace_id}")
+
+    path = tracing.profile_path(trace_id)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail=f"No profile for trace id: {trace_id}")
+
+    if format == "text":
+        return PlainTextResponse(tracing.profile_summary(trace_id))
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+
+
+@app.get("/api/llm/stats")
+def llm_stats():
+    """
+    Per-model concurrency limit, running/queued requests by priority class
+    and average queue wait of the LLM scheduler.
+    """
+    return SCHEDULER.stats()
+
+
+@app.get("/api/llm/hosts")
+def llm_hosts():
+    """
+    The Ollama hosts LLM calls are spread over: availability, installed
+    models, running requests and request counts.
+    """
+    return {"hosts": POOL.stats()}
+
+
+@app.get("/api/executors/stats")
+def executor_stats():
+    """
+    Threads, running and queued tasks, and rejected requests of the image,
+    detection and LLM executors.
     """
-    return {"status": "healthy", "message": "Backend is running"}
+    return {executor.name: executor.stats() for executor in EXECUTORS}
 
 
 def fake_ocr(_):
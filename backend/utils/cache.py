@@ -0,0 +1,63 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from utils.metrics import cache_lookup
+
+CACHE_FOLDER = "cache"
+
+
+class ResultCache:
+    """
+    JSON results keyed by string, kept in a small in-memory LRU and mirrored to
+    disk under cache/<name>/ so they survive restarts and are shared between
+    workers.
+    """
+
+    def __init__(self, name: str, max_items: int = 512):
+        self.name = name
+        self.folder = Path(CACHE_FOLDER) / name
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_items = max_items
+        self._items: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.folder / f"{key}.json"
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                cache_lookup(self.name, True)
+                return self._items[key]
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            cache_lookup(self.name, False)
+            return None
+        cache_lookup(self.name, True)
+        self._remember(key, value)
+        return value
+
+    def set(self, key: str, value):
+        self._remember(key, value)
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _remember(self, key: str, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+DETECTION_CACHE = ResultCache("detect")
+OCR_CACHE = ResultCache("ocr", max_items=4096)
+TRANSLATION_CACHE = ResultCache("translate")
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import AsyncIterator
+from utils.llm import stream_chat, summarize_chat, TOKENIZE_MODEL
+
+# Model used when a session doesn't name one
+CHAT_MODEL = os.environ.get("CHAT_MODEL", TOKENIZE_MODEL)
+# Estimated tokens of history (pinned context, summary and turns) sent with every message
+CHAT_HISTORY_TOKENS = int(os.environ.get("CHAT_HISTORY_TOKENS", "6000"))
+# What an attached image is counted as; Qwen-VL uses roughly one token per 28x28 pixels
+CHAT_IMAGE_TOKENS = int(os.environ.get("CHAT_IMAGE_TOKENS", "1000"))
+# Fold trimmed turns into a summary instead of just forgetting them
+CHAT_SUMMARIZE = os.environ.get("CHAT_SUMMARIZE", "1") == "1"
+# Sessions untouched for this long are dropped
+CHAT_SESSION_TTL = float(os.environ.get("CHAT_SESSION_TTL", "3600"))
+# Context window passed to Ollama (0 = the server's default). Only set it when the
+# chat model isn't shared with OCR/translation, a different num_ctx reloads the model.
+CHAT_NUM_CTX = int(os.environ.get("CHAT_NUM_CTX", "0"))
+
+# Once the budget is exceeded, history is trimmed down to this share of it. Trimming
+# well below the limit means the next turns only append to an unchanged prefix,
+# which Ollama can reuse from its KV cache instead of evaluating it again.
+TRIM_TO = 0.6
+
+CHAT_SYSTEM = """
+You are a helpful assistant for someone reading japanese manga and learning japanese.
+You answer questions about the page, its text, vocabulary, grammar and translation. Keep answers short unless asked for detail.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without loading a tokenizer: about 4 characters per token
+    for latin text, about one token per japanese character.
+    """
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message["content"]) + CHAT_IMAGE_TOKENS * len(message.get("images") or ())
+
+
+class ChatBusy(Exception):
+    """The session is still generating a reply to the previous message."""
+
+
+class ChatSession:
+    """
+    A conversation held on the server, so a new message only sends itself
+    instead of the whole history. Every request to Ollama is built as:
+
+        system prompt
+        pinned context   page image + OCR/translation of the bubble, attached once
+        summary          of turns trimmed from the history (if any)
+        turns            the most recent messages, oldest first
+
+    History is kept under `budget` estimated tokens so prefill stays roughly
+    the same however long the conversation gets.
+    """
+
+    def __init__(self, model: str = CHAT_MODEL, budget: int = CHAT_HISTORY_TOKENS):
+        self.id = uuid.uuid4().hex
+        self.model = model
+        self.budget = budget
+        self.context: dict | None = None
+        self.summary = ''
+        self.turns: list[dict] = []
+        self.trimmed = 0  # turns dropped from the history so far
+        self.last_used = time.time()
+        self.busy = False
+        self._summarizing: asyncio.Task | None = None
+
+    def set_context(self, image: str | None = None, ocr_text: str | None = None, translation: str | None = None):
+        """Pin the page (and bubble) the conversation is about; replaces the previous context."""
+        lines = []
+        if ocr_text:
+            lines.append(f"Japanese OCR: {ocr_text}")
+        if translation:
+            lines.append(f"Translation: {translation}")
+        if not image and not lines:
+            self.context = None
+            return
+
+        content = "This is the manga page we are talking about." if image else "We are talking about this text."
+        if lines:
+            content += "\n" + "\n".join(lines)
+        self.context = {"role": "user", "content": content}
+        if image:
+            self.context["images"] = [image]
+
+    def add_history(self, messages: list[dict]):
+        """Seed the session with earlier text-only turns, e.g. when the frontend recreates it."""
+        for message in messages:
+            self.turns.append({"role": message["role"], "content": message["content"]})
+        self._trim(keep=0)
+
+    def history_tokens(self) -> int:
+        tokens = estimate_tokens(CHAT_SYSTEM) + estimate_tokens(self.summary)
+        if self.context is not None:
+            tokens += message_tokens(self.context)
+        return tokens + sum(message_tokens(turn) for turn in self.turns)
+
+    def messages(self) -> list[dict]:
+        messages = [{"role": "system", "content": CHAT_SYSTEM}]
+        if self.context is not None:
+            messages.append(self.context)
+        if self.summary:
+            messages.append({"role": "user", "content": f"Summary of our earlier conversation:\n{self.summary}"})
+        return messages + self.turns
+
+    def _trim(self, keep: int):
+        """
+        Drop the oldest turns (whole question/answer pairs) once the history is
+        over budget, keeping at least the last `keep` turns. Dropped turns are
+        summarized in the background.
+        """
+        if self.history_tokens() <= self.budget:
+            return
+
+        target = self.budget * TRIM_TO
+        tokens = self.history_tokens()
+        cut = 0
+        while cut < len(self.turns) - keep and tokens > target:
+            tokens -= message_tokens(self.turns[cut])
+            cut += 1
+        # Don't leave an answer without its question at the start
+        while cut < len(self.turns) - keep and self.turns[cut]["role"] != "user":
+            cut += 1
+        if cut == 0:
+            return
+
+        dropped = self.turns[:cut]
+        del self.turns[:cut]
+        self.trimmed += cut
+        logger.debug("Chat %s: trimmed %d turns, ~%d tokens of history left", self.id, cut, self.history_tokens())
+        if CHAT_SUMMARIZE:
+            self._summarizing = asyncio.create_task(self._summarize(self._summarizing, dropped))
+
+    async def _summarize(self, previous: asyncio.Task | None, dropped: list[dict]):
+        if previous is not None:
+            await previous
+        text = [{"role": m["role"], "content": m["content"]} for m in dropped]
+        try:
+            self.summary = await summarize_chat(self.model, self.summary, text, affinity=self.id)
+        except Exception:
+            logger.exception("Summarizing chat %s failed, the trimmed turns are forgotten", self.id)
+
+    def reply(self, content: str, images: list[str] | None = None) -> AsyncIterator[dict]:
+        """
+        Add a user message and stream the answer as {"type": "thinking"|"content"}
+        events and a final "done" event. Raises ChatBusy while a reply is running.
+        """
+        if self.busy:
+            raise ChatBusy(f"Chat session {self.id} is still answering")
+        self.busy = True
+        self.last_used = time.time()
+        return self._reply(content, images)
+
+    async def _reply(self, content: str, images: list[str] | None) -> AsyncIterator[dict]:
+        message = {"role": "user", "content": content}
+        # The pinned page is already in the context, don't send it again
+        pinned = self.context.get("images", []) if self.context else []
+        images = [image for image in images or () if image not in pinned]
+        if images:
+            message["images"] = images
+
+        try:
+            self.turns.append(message)
+            # Not waiting for a summary still running: it is a background request
+            # and would hold up the reply. It is part of the history from the next turn.
+            self._trim(keep=1)
+
+            answer = ''
+            options = {"num_ctx": CHAT_NUM_CTX} if CHAT_NUM_CTX else None
+            async for event in stream_chat(self.model, self.messages(), options, affinity=self.id):
+                if event["type"] == "content":
+                    answer += event["text"]
+                elif event["type"] == "done":
+                    # Thinking is not kept, the model doesn't need it for later turns
+                    self.turns.append({"role": "assistant", "content": answer})
+                    self._trim(keep=2)
+                    event = {**event, **self.stats()}
+                yield event
+        except BaseException:
+            # Forget the unanswered question so it isn't part of the next prompt
+            if self.turns and self.turns[-1] is message:
+                self.turns.pop()
+            raise
+        finally:
+            self.busy = False
+            self.last_used = time.time()
+
+    def stats(self) -> dict:
+        return {
+            "history_tokens": self.history_tokens(),
+            "turns": len(self.turns),
+            "trimmed_turns": self.trimmed,
+            "summarized": bool(self.summary),
+        }
+
+    def status(self) -> dict:
+        return {
+            "session_id": self.id,
+            "model": self.model,
+            "budget": self.budget,
+            "context": self.context,
+            "summary": self.summary,
+            "messages": self.turns,
+            "busy": self.busy,
+            **self.stats(),
+        }
+
+
+SESSIONS: dict[str, ChatSession] = {}
+
+
+def _expire_sessions():
+    now = time.time()
+    for session_id, session in list(SESSIONS.items()):
+        if not session.busy and now - session.last_used > CHAT_SESSION_TTL:
+            del SESSIONS[session_id]
+
+
+def create_session(model: str | None = None) -> ChatSession:
+    _expire_sessions()
+    session = ChatSession(model or CHAT_MODEL)
+    SESSIONS[session.id] = session
+    return session
+
+
+def get_session(session_id: str) -> ChatSession | None:
+    _expire_sessions()
+    session = SESSIONS.get(session_id)
+    if session is not None:
+        session.last_used = time.time()
+    return session
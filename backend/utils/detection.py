@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from PIL import Image
+from utils.cache import DETECTION_CACHE
+from utils.metrics import stage
+from utils.pages import open_page, page_key
+
+# YOLO speech bubble weights, relative to the backend folder
+DETECTION_MODEL = os.environ.get("DETECTION_MODEL", os.path.join("models", "comic-speech-bubble-detector.pt"))
+# Load the detector in the background right after startup instead of on the first /detect
+DETECTION_WARMUP = os.environ.get("DETECTION_WARMUP", "1") == "1"
+# Profile used when a request doesn't pick one: fast, balanced or accurate
+DETECTION_PROFILE = os.environ.get("DETECTION_PROFILE", "balanced")
+# Only keep these model classes, comma separated ids (empty = all)
+DETECTION_CLASSES = tuple(int(c) for c in os.environ.get("DETECTION_CLASSES", "").split(",") if c.strip())
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DetectionProfile:
+    """Inference settings trading detection accuracy for speed."""
+    name: str
+    imgsz: int  # input size the page is scaled to
+    conf: float  # minimum box confidence
+    iou: float  # NMS overlap threshold
+    max_det: int
+    classes: tuple[int, ...] = DETECTION_CLASSES
+
+    def predict_args(self) -> dict:
+        args = {"imgsz": self.imgsz, "conf": self.conf, "iou": self.iou, "max_det": self.max_det}
+        if self.classes:
+            args["classes"] = list(self.classes)
+        return args
+
+    @property
+    def cache_tag(self) -> str:
+        # "balanced" is what detection always used, its results keep their cache keys
+        tag = "" if self.name == "balanced" else self.name
+        if self.classes:
+            tag += "c" + "_".join(map(str, self.classes))
+        return tag
+
+
+PROFILES = {
+    "fast": DetectionProfile("fast", imgsz=480, conf=0.35, iou=0.6, max_det=100),
+    "balanced": DetectionProfile("balanced", imgsz=640, conf=0.25, iou=0.7, max_det=300),  # Ultralytics defaults
+    "accurate": DetectionProfile("accurate", imgsz=1024, conf=0.15, iou=0.6, max_det=300),
+}
+
+if DETECTION_PROFILE not in PROFILES:
+    raise ValueError(f"Unknown DETECTION_PROFILE: {DETECTION_PROFILE} (expected {', '.join(PROFILES)})")
+
+
+def get_profile(name: str | None = None) -> DetectionProfile:
+    name = name or DETECTION_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown detection profile: {name} (expected {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+
+class Detector:
+    """
+    The YOLO bubble detector, loaded on first use. Importing ultralytics pulls
+    in torch and takes seconds, so nothing heavy happens until a page is
+    detected or warm_up() runs.
+    """
+
+    def __init__(self, path: str = DETECTION_MODEL):
+        self.path = path
+        self.load_seconds: float | None = None
+        self.error: str | None = None
+        self._model = None
+        self._load_lock = threading.Lock()
+        # Ultralytics predictors are not thread-safe; requests and the prefetcher share one model
+        self._predict_lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._model is not None:
+            return "ready"
+        if self._load_lock.locked():
+            return "loading"
+        return "failed" if self.error else "not loaded"
+
+    def status(self) -> dict:
+        return {"state": self.state, "path": self.path, "load_seconds": self.load_seconds, "error": self.error}
+
+    def load(self):
+        if self._model is not None:
+            return self._model
+        with self._load_lock:
+            if self._model is None:
+                if not os.path.isfile(self.path):
+                    self.error = f"Detector weights not found at {self.path} (set DETECTION_MODEL)"
+                    raise RuntimeError(self.error)
+
+                started = time.perf_counter()
+                logger.info("Loading detector from %s", self.path)
+                try:
+                    from ultralytics import YOLO
+                    self._model = YOLO(self.path)
+                except Exception as e:
+                    self.error = f"{type(e).__name__}: {e}"
+                    raise
+                self.error = None
+                self.load_seconds = round(time.perf_counter() - started, 2)
+                logger.info("Detector loaded in %.2fs", self.load_seconds)
+        return self._model
+
+    def predict(self, img: Image.Image | list[Image.Image], profile: DetectionProfile = PROFILES["balanced"]):
+        """Raw Ultralytics results, one per image; a list of pages runs as one batch."""
+        model = self.load()
+        with self._predict_lock, stage("detect", model="yolo"):
+            return model(img, **profile.predict_args())
+
+    def warm_up(self):
+        """Load the weights and run one inference, which initialises the device."""
+        try:
+            started = time.perf_counter()
+            self.predict(Image.new("RGB", (640, 640), (255, 255, 255)))
+            logger.info("Detector warmed up in %.2fs", time.perf_counter() - started)
+        except RuntimeError as e:
+            logger.warning("Bubble detection unavailable: %s", e)
+        except Exception:
+            logger.exception("Detector warm-up failed, /detect will retry loading it")
+
+
+DETECTOR = Detector()
+
+
+def _boxes(result) -> list[dict]:
+    boxes = []
+    for r in result.boxes:
+        x1, y1, x2, y2 = r.xyxy[0].tolist()
+        boxes.append({
+            "x": x1,
+            "y": y1,
+            "w": x2 - x1,
+            "h": y2 - y1
+        })
+    return boxes
+
+
+def detect_page(img: Image.Image, profile: DetectionProfile) -> list[dict]:
+    """Speech bubble boxes of a page image, most confident first."""
+    return _boxes(DETECTOR.predict(img, profile)[0])
+
+
+def detect_pages(imgs: list[Image.Image], profile: DetectionProfile) -> list[list[dict]]:
+    """Boxes of several pages from one batched inference, in order."""
+    return [_boxes(result) for result in DETECTOR.predict(imgs, profile)]
+
+
+def _cache_key(image_path: str, profile: DetectionProfile) -> str:
+    key = page_key(image_path)
+    if profile.cache_tag:
+        key = f"{key}_{profile.cache_tag}"
+    return key
+
+
+def detect_boxes(image_path: str, profile: str | None = None) -> list[dict]:
+    """
+    Speech bubble boxes of a page, served from the detection cache when possible.
+    `profile` names one of PROFILES (default DETECTION_PROFILE).
+    """
+    profile = get_profile(profile)
+    key = _cache_key(image_path, profile)
+    cached = DETECTION_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    boxes = detect_page(open_page(image_path), profile)
+    DETECTION_CACHE.set(key, boxes)
+    return boxes
+
+
+def detect_boxes_batch(image_paths: list[str], profile: str | None = None) -> list[list[dict]]:
+    """
+    detect_boxes() for many pages: cached pages are served from the cache,
+    the others are detected in one batch and cached.
+    """
+    profile = get_profile(profile)
+    keys = [_cache_key(path, profile) for path in image_paths]
+    results = [DETECTION_CACHE.get(key) for key in keys]
+    missing = [i for i, boxes in enumerate(results) if boxes is None]
+    if not missing:
+        return results
+
+    pages = [open_page(image_paths[i]) for i in missing]
+    for i, boxes in zip(missing, detect_pages(pages, profile)):
+        DETECTION_CACHE.set(keys[i], boxes)
+        results[i] = boxes
+    return results
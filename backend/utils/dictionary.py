@@ -0,0 +1,343 @@
+"""
+Local Japanese -> English dictionary (JMdict) for /word.
+
+Import JMdict once (download JMdict_e.gz from
+https://www.edrdg.org/jmdict/edict_doc.html), run from backend/:
+
+    python -m utils.dictionary path/to/JMdict_e.gz
+
+This builds dictionary/jmdict.sqlite with an index over every kanji and kana
+form. Lookups deinflect the tapped token (言ってる -> 言う, 高かった -> 高い)
+and strip trailing particles before giving up, so most taps are answered
+without an LLM call.
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+DICTIONARY_PATH = os.environ.get("DICTIONARY_PATH", os.path.join("dictionary", "jmdict.sqlite"))
+MAX_ENTRIES = 3
+MAX_SENSES = 5
+MAX_GLOSSES = 4
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------
+# Deinflection
+#
+# Each rule turns an inflected ending back into a dictionary ending:
+# (inflected, base, type the inflected form conjugates as, type of the result).
+# Rules chain, e.g. 行かなかった -> 行かない (adj-i) -> 行く (v5). A rule applies to
+# the original token regardless of type, and to an intermediate result only if
+# the types match. Types: v1 (ichidan), v5 (godan), vk (来る), vs (noun + する),
+# vs-i (する), adj-i, te (te-form) and final (doesn't conjugate further).
+
+GODAN = {
+    # base: (a-stem, i-stem, e-stem, o-stem, te, ta)
+    "う": ("わ", "い", "え", "お", "って", "った"),
+    "く": ("か", "き", "け", "こ", "いて", "いた"),
+    "ぐ": ("が", "ぎ", "げ", "ご", "いで", "いだ"),
+    "す": ("さ", "し", "せ", "そ", "して", "した"),
+    "つ": ("た", "ち", "て", "と", "って", "った"),
+    "ぬ": ("な", "に", "ね", "の", "んで", "んだ"),
+    "ぶ": ("ば", "び", "べ", "ぼ", "んで", "んだ"),
+    "む": ("ま", "み", "め", "も", "んで", "んだ"),
+    "る": ("ら", "り", "れ", "ろ", "って", "った"),
+}
+
+POLITE = [("ます", "final"), ("ました", "final"), ("ません", "final"), ("ませんでした", "final"),
+          ("ましょう", "final"), ("たい", "adj-i"), ("たくない", "adj-i"), ("なさい", "final")]
+
+
+def _build_rules() -> list[tuple[str, str, str, str]]:
+    rules = [
+        # i-adjectives (also the ない/たい forms of verbs, which conjugate like them)
+        ("かった", "い", "final", "adj-i"),
+        ("くない", "い", "adj-i", "adj-i"),
+        ("くて", "い", "te", "adj-i"),
+        ("く", "い", "final", "adj-i"),
+        ("ければ", "い", "final", "adj-i"),
+        ("さ", "い", "final", "adj-i"),
+        ("そう", "い", "final", "adj-i"),
+        ("すぎる", "い", "v1", "adj-i"),
+        # te-form auxiliaries
+        ("ている", "て", "v1", "te"), ("てる", "て", "v1", "te"), ("でいる", "で", "v1", "te"),
+        ("でる", "で", "v1", "te"), ("ておく", "て", "v5", "te"), ("とく", "て", "v5", "te"),
+        ("てしまう", "て", "v5", "te"), ("ちゃう", "て", "v5", "te"), ("じゃう", "で", "v5", "te"),
+        ("てくる", "て", "vk", "te"), ("てくれる", "て", "v1", "te"), ("てあげる", "て", "v1", "te"),
+        ("てみる", "て", "v1", "te"), ("てください", "て", "final", "te"), ("てある", "て", "v5", "te"),
+        ("ちゃった", "て", "final", "te"), ("じゃった", "で", "final", "te"),
+        # ichidan verbs
+        ("ない", "る", "adj-i", "v1"), ("た", "る", "final", "v1"), ("て", "る", "te", "v1"),
+        ("たら", "る", "final", "v1"), ("たり", "る", "final", "v1"), ("られる", "る", "v1", "v1"),
+        ("れる", "る", "v1", "v1"), ("させる", "る", "v1", "v1"), ("よう", "る", "final", "v1"),
+        ("ろ", "る", "final", "v1"), ("れば", "る", "final", "v1"), ("ず", "る", "final", "v1"),
+        # 行く is irregular in the te/ta forms
+        ("って", "く", "te", "v5"), ("った", "く", "final", "v5"),
+        # する and noun + する
+        ("する", "", "final", "vs"), ("した", "", "final", "vs"), ("して", "", "te", "vs"),
+        ("しない", "", "adj-i", "vs"), ("される", "", "v1", "vs"), ("させる", "", "v1", "vs"),
+        ("しよう", "", "final", "vs"), ("できる", "", "v1", "vs"),
+        ("した", "する", "final", "vs-i"), ("して", "する", "te", "vs-i"), ("しない", "する", "adj-i", "vs-i"),
+        ("される", "する", "v1", "vs-i"), ("させる", "する", "v1", "vs-i"), ("しよう", "する", "final", "vs-i"),
+        # 来る
+        ("きた", "くる", "final", "vk"), ("きて", "くる", "te", "vk"), ("こない", "くる", "adj-i", "vk"),
+        ("こよう", "くる", "final", "vk"), ("こられる", "くる", "v1", "vk"), ("これる", "くる", "v1", "vk"),
+        ("来た", "来る", "final", "vk"), ("来て", "来る", "te", "vk"), ("来ない", "来る", "adj-i", "vk"),
+        ("来よう", "来る", "final", "vk"), ("来られる", "来る", "v1", "vk"), ("来れる", "来る", "v1", "vk"),
+    ]
+    for ending, polite_type in POLITE:
+        rules.append((ending, "る", polite_type, "v1"))
+        rules.append(("し" + ending, "", polite_type, "vs"))
+        rules.append(("し" + ending, "する", polite_type, "vs-i"))
+        rules.append(("き" + ending, "くる", polite_type, "vk"))
+        rules.append(("来" + ending, "来る", polite_type, "vk"))
+
+    for base, (a, i, e, o, te, ta) in GODAN.items():
+        rules += [
+            (a + "ない", base, "adj-i", "v5"), (a + "ず", base, "final", "v5"),
+            (a + "れる", base, "v1", "v5"), (a + "せる", base, "v1", "v5"),
+            (e + "る", base, "v1", "v5"), (e + "ば", base, "final", "v5"), (e, base, "final", "v5"),
+            (o + "う", base, "final", "v5"),
+            (te, base, "te", "v5"), (ta, base, "final", "v5"),
+            (ta + "ら", base, "final", "v5"), (ta + "り", base, "final", "v5"),
+        ]
+        rules += [(i + ending, base, polite_type, "v5") for ending, polite_type in POLITE]
+    # ない of ある is ない itself
+    rules.append(("ない", "ある", "adj-i", "v5"))
+    return rules
+
+
+RULES = _build_rules()
+PARTICLES = ["から", "まで", "より", "です", "だ", "は", "が", "を", "に", "で", "と", "の", "へ", "も",
+             "や", "か", "ね", "よ", "な", "さ", "ぞ", "わ"]
+
+
+def deinflect(word: str) -> list[tuple[str, str, list[str]]]:
+    """
+    Possible dictionary forms of `word`: (form, type, applied endings) with the
+    word itself first. Every form still has to be checked against the dictionary.
+    """
+    results = [(word, "", [])]
+    seen = {(word, "")}
+    i = 0
+    while i < len(results):
+        form, form_type, chain = results[i]
+        i += 1
+        for inflected, base, in_type, out_type in RULES:
+            if form_type and form_type != in_type:
+                continue
+            if not form.endswith(inflected):
+                continue
+            candidate = form[:len(form) - len(inflected)] + base
+            if not candidate or (candidate, out_type) in seen:
+                continue
+            seen.add((candidate, out_type))
+            results.append((candidate, out_type, chain + [inflected]))
+    return results
+
+
+def _pos_matches(pos: list[str], word_type: str) -> bool:
+    if not word_type:
+        return True
+    if word_type == "v5":
+        return any(p.startswith("v5") for p in pos)
+    if word_type == "vs":
+        return any(p.startswith("vs") for p in pos)
+    if word_type == "v1":
+        return any(p in ("v1", "v1-s") for p in pos)
+    if word_type == "adj-i":
+        return any(p in ("adj-i", "adj-ix") for p in pos)
+    return word_type in pos
+
+
+# ---------------------------------------------------------------------------
+# Lookup
+
+class Dictionary:
+    """
+    Read-only access to the imported JMdict. Each thread gets its own SQLite
+    connection; a lookup is a handful of indexed queries.
+    """
+
+    def __init__(self, path: str = DICTIONARY_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def available(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+        return conn
+
+    def _entries(self, form: str) -> list[dict]:
+        rows = self._connection().execute(
+            "SELECT e.data FROM forms f JOIN entries e ON e.id = f.entry_id "
+            "WHERE f.form = ? GROUP BY e.id ORDER BY MAX(f.priority) DESC, e.id LIMIT ?",
+            (form, MAX_ENTRIES * 3),
+        ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def lookup(self, word: str) -> dict | None:
+        """
+        Entries for a token as it appears in the text: tries the token, its
+        deinflected forms and the token without trailing particles.
+        Returns {"form", "inflection", "entries"} or None.
+        """
+        if not self.available or not word.strip():
+            return None
+        word = word.strip()
+
+        candidates = [word]
+        for particle in PARTICLES:
+            if word.endswith(particle) and len(word) > len(particle):
+                candidates.append(word[:-len(particle)])
+
+        for candidate in candidates:
+            for form, word_type, chain in deinflect(candidate):
+                entries = [entry for entry in self._entries(form)
+                           if _pos_matches([p for s in entry["senses"] for p in s["pos"]], word_type)]
+                if entries:
+                    return {"form": form, "inflection": chain, "entries": entries[:MAX_ENTRIES]}
+        return None
+
+
+POS_NAMES = {
+    "n": "noun", "pn": "pronoun", "v1": "ichidan verb", "vk": "kuru verb", "vs": "suru verb",
+    "vs-i": "suru verb", "vt": "transitive", "vi": "intransitive", "adj-i": "i-adjective",
+    "adj-na": "na-adjective", "adj-no": "no-adjective", "adv": "adverb", "prt": "particle",
+    "exp": "expression", "int": "interjection", "conj": "conjunction", "ctr": "counter",
+    "suf": "suffix", "pref": "prefix", "aux-v": "auxiliary verb", "cop": "copula",
+}
+
+
+def _pos_name(pos: str) -> str:
+    if pos.startswith("v5"):
+        return "godan verb"
+    return POS_NAMES.get(pos, pos)
+
+
+def format_lookup(result: dict) -> str:
+    """Plain-text meanings in the same shape as the LLM's answer."""
+    lines = []
+    if result["inflection"]:
+        lines.append(f"Dictionary form: {result['form']}")
+    for entry in result["entries"]:
+        kanji = "・".join(entry["kanji"][:2])
+        kana = "・".join(entry["kana"][:2])
+        lines.append(f"{kanji} 【{kana}】" if kanji else kana)
+        for n, sense in enumerate(entry["senses"][:MAX_SENSES], 1):
+            pos = ", ".join(dict.fromkeys(_pos_name(p) for p in sense["pos"] if p not in ("vt", "vi")))
+            gloss = "; ".join(sense["gloss"][:MAX_GLOSSES])
+            lines.append(f"{n}. ({pos}) {gloss}" if pos else f"{n}. {gloss}")
+        lines.append("")
+    return "\n".join(lines).strip()
+
+
+DICTIONARY = Dictionary()
+
+
+# ---------------------------------------------------------------------------
+# Importer
+
+class _EntityNames:
+    """
+    File wrapper that rewrites JMdict's DTD so every entity expands to its own
+    name (&v5k; -> "v5k") instead of a long description.
+    """
+    ENTITY = re.compile(rb'<!ENTITY (\S+) ".*">')
+
+    def __init__(self, f):
+        self._lines = iter(f)
+        self._buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += self.ENTITY.sub(rb'<!ENTITY \1 "\1">', line)
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def import_jmdict(source: str, output: str = DICTIONARY_PATH):
+    """Build the SQLite dictionary from a JMdict XML file (optionally .gz)."""
+    started = time.perf_counter()
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    tmp_output = output + ".tmp"
+    if os.path.exists(tmp_output):
+        os.remove(tmp_output)
+
+    conn = sqlite3.connect(tmp_output)
+    conn.execute("CREATE TABLE entries (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+    conn.execute("CREATE TABLE forms (form TEXT NOT NULL, entry_id INTEGER NOT NULL, "
+                 "kind TEXT NOT NULL, priority INTEGER NOT NULL)")
+
+    opener = gzip.open if source.endswith(".gz") else open
+    count = 0
+    with opener(source, "rb") as f:
+        for _, elem in ET.iterparse(_EntityNames(f), events=("end",)):
+            if elem.tag != "entry":
+                continue
+            entry_id = int(elem.findtext("ent_seq"))
+            forms = []
+            kanji = []
+            for k_ele in elem.findall("k_ele"):
+                keb = k_ele.findtext("keb")
+                kanji.append(keb)
+                forms.append((keb, entry_id, "k", len(k_ele.findall("ke_pri"))))
+            kana = []
+            for r_ele in elem.findall("r_ele"):
+                reb = r_ele.findtext("reb")
+                kana.append(reb)
+                forms.append((reb, entry_id, "r", len(r_ele.findall("re_pri"))))
+
+            senses = []
+            pos = []
+            for sense in elem.findall("sense"):
+                # A sense without part of speech has the one of the sense before it
+                pos = [p.text for p in sense.findall("pos")] or pos
+                gloss = [g.text for g in sense.findall("gloss") if g.text]
+                if gloss:
+                    senses.append({"pos": pos, "gloss": gloss})
+
+            conn.execute("INSERT INTO entries VALUES (?, ?)",
+                         (entry_id, json.dumps({"kanji": kanji, "kana": kana, "senses": senses}, ensure_ascii=False)))
+            conn.executemany("INSERT INTO forms VALUES (?, ?, ?, ?)", forms)
+            elem.clear()
+            count += 1
+
+    conn.execute("CREATE INDEX forms_form ON forms (form, priority)")
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_output, output)
+    print(f"Imported {count} entries into {output} in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import JMdict into the local dictionary used by /word")
+    parser.add_argument("source", help="JMdict or JMdict_e XML file (.gz is fine)")
+    parser.add_argument("--output", default=DICTIONARY_PATH)
+    args = parser.parse_args()
+    import_jmdict(args.source, args.output)
+
+
+if __name__ == "__main__":
+    main()
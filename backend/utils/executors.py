@@ -0,0 +1,132 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.metrics import ENDPOINT, EXECUTOR_QUEUED, EXECUTOR_REJECTED, EXECUTOR_RUNNING
+
+# Threads and queue limits per resource. A request arriving while all threads
+# are busy and the queue is full is turned away with Retry-After instead of
+# piling up behind the others.
+IMAGE_THREADS = int(os.environ.get("IMAGE_THREADS", str(min(4, os.cpu_count() or 1))))
+IMAGE_QUEUE_LIMIT = int(os.environ.get("IMAGE_QUEUE_LIMIT", "64"))
+DETECT_THREADS = int(os.environ.get("DETECT_THREADS", "1"))
+DETECT_QUEUE_LIMIT = int(os.environ.get("DETECT_QUEUE_LIMIT", "8"))
+LLM_THREADS = int(os.environ.get("LLM_THREADS", "8"))
+LLM_QUEUE_LIMIT = int(os.environ.get("LLM_QUEUE_LIMIT", "32"))
+# Translations waiting for the translation model before new ones are refused
+TRANSLATION_QUEUE_LIMIT = int(os.environ.get("TRANSLATION_QUEUE_LIMIT", "16"))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", "2"))
+
+
+class Saturated(Exception):
+    """A resource's queue is full; the request should be retried later."""
+
+    def __init__(self, resource: str, status_code: int = 503, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__(f"Too much {resource} work queued, retry in {retry_after}s")
+        self.resource = resource
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def reject(resource: str, status_code: int = 503) -> Saturated:
+    """Count a rejected request and build the exception to raise."""
+    EXECUTOR_REJECTED.labels(resource, ENDPOINT.get()).inc()
+    return Saturated(resource, status_code)
+
+
+class BoundedExecutor:
+    """
+    A thread pool for one kind of work (image processing, YOLO inference,
+    blocking LLM calls) so a burst of one kind can't starve the others.
+    At most `threads + queue_limit` tasks are admitted; run() raises
+    Saturated beyond that.
+    """
+
+    def __init__(self, name: str, threads: int, queue_limit: int, status_code: int = 503):
+        self.name = name
+        self.threads = threads
+        self.queue_limit = queue_limit
+        self.status_code = status_code
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def _admit(self):
+        with self._lock:
+            if self._queued + self._running >= self.threads + self.queue_limit:
+                self._rejected += 1
+                raise reject(self.name, self.status_code)
+            self._queued += 1
+        EXECUTOR_QUEUED.labels(self.name).inc()
+
+    def _call(self, ticket: dict, context: contextvars.Context, func, *args, **kwargs):
+        with self._lock:
+            if ticket["cancelled"]:
+                return None
+            ticket["started"] = True
+            self._queued -= 1
+            self._running += 1
+        EXECUTOR_QUEUED.labels(self.name).dec()
+        EXECUTOR_RUNNING.labels(self.name).inc()
+        try:
+            # Carry the request's trace id, metrics endpoint and profiler into the thread
+            return context.run(func, *args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+            EXECUTOR_RUNNING.labels(self.name).dec()
+
+    async def run(self, func, *args, **kwargs):
+        self._admit()
+        ticket = {"started": False, "cancelled": False}
+        call = functools.partial(self._call, ticket, contextvars.copy_context(), func, *args, **kwargs)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        except asyncio.CancelledError:
+            # The client went away while the task was still waiting: drop it
+            with self._lock:
+                if not ticket["started"]:
+                    ticket["cancelled"] = True
+                    self._queued -= 1
+                    EXECUTOR_QUEUED.labels(self.name).dec()
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threads": self.threads,
+                "queue_limit": self.queue_limit,
+                "running": self._running,
+                "queued": self._queued,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+IMAGE_EXECUTOR = BoundedExecutor("image", IMAGE_THREADS, IMAGE_QUEUE_LIMIT)
+DETECT_EXECUTOR = BoundedExecutor("detect", DETECT_THREADS, DETECT_QUEUE_LIMIT)
+# Too many queued LLM requests is the client asking too fast, not the server failing
+LLM_EXECUTOR = BoundedExecutor("llm", LLM_THREADS, LLM_QUEUE_LIMIT, status_code=429)
+EXECUTORS = [IMAGE_EXECUTOR, DETECT_EXECUTOR, LLM_EXECUTOR]
+
+
+def runs_in(executor: BoundedExecutor):
+    """
+    Run a sync endpoint in `executor` instead of Starlette's shared thread
+    pool. Put it above @profiled so profiling happens in the worker thread.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await executor.run(func, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,22 +1,306 @@
 from typing import Tuple
-from ollama import generate, GenerateResponse, chat, ChatResponse
+from collections import defaultdict
+from contextlib import contextmanager, asynccontextmanager
+from enum import IntEnum
+from ollama import GenerateResponse
+import asyncio
+import heapq
+import itertools
 import json
+import logging
+import os
+import threading
+import time
 import pykakasi
+from utils.metrics import stage, observe_stream, LLM_QUEUED, LLM_RUNNING
+from utils.ollama_pool import OllamaPool, OLLAMA_HOSTS
+from utils.tracing import LOG_TOKENS
+
+logger = logging.getLogger(__name__)
+
+OCR_MODEL = "huihui_ai/qwen3-vl-abliterated:4b-instruct"
+TRANSLATE_MODEL = "huihui_ai/qwen3-vl-abliterated:8b-thinking"
+TOKENIZE_MODEL = "huihui_ai/qwen3-vl-abliterated:8b-instruct"
+
+
+class Priority(IntEnum):
+    """Scheduling class of an LLM call. Lower value is served first."""
+    INTERACTIVE = 0  # word lookups / OCR the user is waiting on
+    TRANSLATION = 1  # streamed translations
+    BACKGROUND = 2   # prefetch and other speculative work
+
+
+# How many requests may run against a model at the same time, per Ollama host
+# that has it. Anything above the limit waits in our queue (ordered by
+# priority) instead of in Ollama's.
+# Override with e.g. LLM_CONCURRENCY="huihui_ai/qwen3-vl-abliterated:4b-instruct=3"
+MODEL_CONCURRENCY = {
+    OCR_MODEL: 2,
+    TRANSLATE_MODEL: 1,
+    TOKENIZE_MODEL: 1,
+}
+DEFAULT_CONCURRENCY = 1
+
+for _entry in filter(None, os.environ.get("LLM_CONCURRENCY", "").split(",")):
+    _model, _, _limit = _entry.rpartition("=")
+    MODEL_CONCURRENCY[_model.strip()] = int(_limit)
+
+
+class LLMScheduler:
+    """
+    Central gate in front of every Ollama call.
+
+    Each model has its own concurrency limit and its own priority queue, so a
+    long translation on the 8b model never delays a word lookup on the 4b
+    model, and queued background work never jumps ahead of a user request.
+    Background calls additionally leave one slot free on models that allow
+    more than one concurrent request, so interactive calls never have to wait
+    for a prefetch to finish. With several Ollama hosts, `hosts(model)` tells
+    how many can serve a model and the limits scale with it.
+    """
+
+    def __init__(self, limits: dict[str, int], default_limit: int = 1, hosts=lambda model: 1):
+        self._limits = dict(limits)
+        self._default_limit = default_limit
+        self._hosts = hosts
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting: dict[str, list] = defaultdict(list)
+        # Tickets of acquire_async() callers: their loop, future and start time
+        self._async_waiters: dict[tuple, tuple[asyncio.AbstractEventLoop, asyncio.Future, float]] = {}
+        self._running: dict[str, int] = defaultdict(int)
+        self._completed: dict[tuple[str, Priority], int] = defaultdict(int)
+        self._wait_total: dict[tuple[str, Priority], float] = defaultdict(float)
+
+    def limit(self, model: str) -> int:
+        return self._limits.get(model, self._default_limit) * self._hosts(model)
+
+    def capacity_changed(self):
+        """Hosts came up or went down: let waiting requests re-check their limits."""
+        with self._cond:
+            for model in list(self._waiting):
+                self._wake(model)
+
+    def _can_start(self, model: str, priority: Priority) -> bool:
+        limit = self.limit(model)
+        if priority == Priority.BACKGROUND and limit > 1:
+            limit -= 1
+        return self._running[model] < limit
+
+    def acquire(self, model: str, priority: Priority):
+        """Block until a slot for `model` is free and it's our turn."""
+        ticket = (int(priority), next(self._seq))
+        start = time.perf_counter()
+        with self._cond:
+            queue = self._waiting[model]
+            heapq.heappush(queue, ticket)
+            LLM_QUEUED.labels(model, priority.name.lower()).inc()
+            while queue[0] != ticket or not self._can_start(model, priority):
+                self._cond.wait()
+            self._start(model, start)
+            # The next ticket in line may fit into a remaining slot as well
+            self._wake(model)
+
+    def _start(self, model: str, start: float):
+        """Move the ticket at the head of the queue to running. Called with the lock held."""
+        priority = Priority(heapq.heappop(self._waiting[model])[0])
+        LLM_QUEUED.labels(model, priority.name.lower()).dec()
+        self._running[model] += 1
+        LLM_RUNNING.labels(model).inc()
+        self._wait_total[(model, priority)] += time.perf_counter() - start
+
+    def _wake(self, model: str):
+        """
+        Hand free slots to async waiters at the head of the queue and wake the
+        waiting threads to check theirs. Called with the lock held.
+        """
+        queue = self._waiting[model]
+        while queue and queue[0] in self._async_waiters and self._can_start(model, Priority(queue[0][0])):
+            loop, future, start = self._async_waiters.pop(queue[0])
+            priority = Priority(queue[0][0])
+            self._start(model, start)
+            loop.call_soon_threadsafe(self._granted, future, model, priority)
+        self._cond.notify_all()
+
+    def _granted(self, future: asyncio.Future, model: str, priority: Priority):
+        if future.cancelled():
+            # The caller gave up just as the slot became free
+            self.release(model, priority)
+        else:
+            future.set_result(None)
+
+    def release(self, model: str, priority: Priority):
+        with self._cond:
+            self._running[model] -= 1
+            LLM_RUNNING.labels(model).dec()
+            self._completed[(model, priority)] += 1
+            self._wake(model)
+
+    async def acquire_async(self, model: str, priority: Priority):
+        """
+        acquire() without blocking the event loop. Waits on a future that
+        release() resolves, so a queued request doesn't hold a thread.
+        """
+        ticket = (int(priority), next(self._seq))
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            heapq.heappush(self._waiting[model], ticket)
+            LLM_QUEUED.labels(model, priority.name.lower()).inc()
+            self._async_waiters[ticket] = (loop, future, time.perf_counter())
+            self._wake(model)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._cond:
+                queued = self._async_waiters.pop(ticket, None) is not None
+                if queued:
+                    queue = self._waiting[model]
+                    queue.remove(ticket)
+                    heapq.heapify(queue)
+                    LLM_QUEUED.labels(model, priority.name.lower()).dec()
+                    # Whoever was behind us may be at the head now
+                    self._wake(model)
+            if not queued and future.done() and not future.cancelled():
+                # Got the slot, but was cancelled before running; _granted()
+                # hands it back itself if the future was cancelled first
+                self.release(model, priority)
+            raise
+
+    @contextmanager
+    def slot(self, model: str, priority: Priority):
+        self.acquire(model, priority)
+        try:
+            yield
+        finally:
+            self.release(model, priority)
+
+    @asynccontextmanager
+    async def async_slot(self, model: str, priority: Priority):
+        await self.acquire_async(model, priority)
+        try:
+            yield
+        finally:
+            self.release(model, priority)
+
+    def queued(self, model: str) -> int:
+        """Requests waiting for `model`."""
+        with self._cond:
+            return len(self._waiting[model])
+
+    def stats(self) -> dict:
+        """Queue depth and throughput per model, for /api/llm/stats."""
+        with self._cond:
+            models = set(self._limits) | set(self._waiting) | set(self._running)
+            result = {}
+            for model in sorted(models):
+                queued = {p.name.lower(): 0 for p in Priority}
+                for priority, _ in self._waiting[model]:
+                    queued[Priority(priority).name.lower()] += 1
+                completed = {}
+                avg_wait_ms = {}
+                for p in Priority:
+                    n = self._completed[(model, p)]
+                    completed[p.name.lower()] = n
+                    avg_wait_ms[p.name.lower()] = round(self._wait_total[(model, p)] / n * 1000, 1) if n else 0.0
+                result[model] = {
+                    "limit": self.limit(model),
+                    "running": self._running[model],
+                    "queued": queued,
+                    "completed": completed,
+                    "avg_wait_ms": avg_wait_ms,
+                }
+            return result
+
+
+# Every call goes to one of the configured Ollama hosts (see utils/ollama_pool.py)
+POOL = OllamaPool(OLLAMA_HOSTS)
+SCHEDULER = LLMScheduler(MODEL_CONCURRENCY, DEFAULT_CONCURRENCY, hosts=POOL.host_count)
+POOL.on_change = SCHEDULER.capacity_changed
+
+
+def _generate(priority: Priority, model: str, **kwargs) -> GenerateResponse:
+    with SCHEDULER.slot(model, priority):
+        return POOL.call(model, lambda client: client.generate(model=model, **kwargs))
+
+
+def ocr_image(image_path: str, priority: Priority = Priority.INTERACTIVE) -> str:
+
+    with stage("ocr", model=OCR_MODEL):
+        res: GenerateResponse = _generate(
+            priority,
+            model=OCR_MODEL,
+            prompt="Please extract and return all the text from the provided image.",
+            system="You act as a japanese OCR tool. You respond with ONLY the OCR'd text.",
+            images=[image_path],
+        )
+    logger.debug("OCR response: [%s]", res.response)
+    return res.response
 
-def ocr_image(image_path: str) -> str:
 
-    res: GenerateResponse = generate(
-        model="huihui_ai/qwen3-vl-abliterated:4b-instruct",
-        prompt="Please extract and return all the text from the provided image.",
-        system="You act as a japanese OCR tool. You respond with ONLY the OCR'd text.",
-        images=[image_path],
-    )
-    print(f"OCR Response: [{res.response}]")
-    return res.response
+MULTI_OCR_SYSTEM = """
+You act as a japanese OCR tool. You are given several images of speech bubbles, numbered 1, 2, 3... in the order they are attached.
+You respond with ONLY a JSON array that contains the OCR'd text of every image as a string, in the same order. Use an empty string for an image without text.
+"""
+
+def ocr_images(image_paths: list[str], priority: Priority = Priority.INTERACTIVE) -> list[str] | None:
+    """
+    OCR several crops with a single request. Returns one text per image, or
+    None if the answer isn't a JSON array with exactly one string per image
+    (the caller then falls back to ocr_image per crop).
+    """
+    count = len(image_paths)
+    # Structured output: Ollama constrains the answer to this JSON schema
+    schema = {"type": "array", "items": {"type": "string"}, "minItems": count, "maxItems": count}
+
+    with stage("ocr_batch", model=OCR_MODEL):
+        res: GenerateResponse = _generate(
+            priority,
+            model=OCR_MODEL,
+            prompt=f"Please extract the text from each of the {count} provided images (Image 1 to Image {count}).",
+            system=MULTI_OCR_SYSTEM,
+            images=image_paths,
+            format=schema,
+        )
+    logger.debug("Multi-OCR response: [%s]", res.response)
+
+    texts = _parse_text_array(res.response, count)
+    if texts is None:
+        logger.warning("Multi-OCR answer for %d crops was not a matching JSON array, falling back to single OCR", count)
+    return texts
+
+
+def _parse_text_array(response: str, count: int) -> list[str] | None:
+    try:
+        texts = json.loads(response)
+    except ValueError:
+        return None
+    # Some models wrap the array in an object like {"texts": [...]}
+    if isinstance(texts, dict) and len(texts) == 1:
+        texts = next(iter(texts.values()))
+    if not isinstance(texts, list) or len(texts) != count:
+        return None
+    if not all(isinstance(text, str) for text in texts):
+        return None
+    return texts
+
+_KAKASI = None
+_KAKASI_LOCK = threading.Lock()
+
+
+def kakasi() -> pykakasi.kakasi:
+    """The tokenizer, built on first use (loading its dictionaries takes about half a second)."""
+    global _KAKASI
+    if _KAKASI is None:
+        with _KAKASI_LOCK:
+            if _KAKASI is None:
+                _KAKASI = pykakasi.kakasi()
+    return _KAKASI
+
 
-KAKASI = pykakasi.kakasi()
 def chop(text: str) -> Tuple[list[str], list[str], list[str]]:
-    c = KAKASI.convert(text)
+    with stage("chop"):
+        c = kakasi().convert(text)
 
     tokens=[]
     hiragana=[]
@@ -24,7 +308,7 @@ def chop(text: str) -> Tuple[list[str], list[str], list[str]]:
     for item in c:
         token = item["orig"]
         if token == "\n":
-            print(f"[CHOP] Skipping newline")
+            logger.debug("Chop: skipping newline")
             continue
         tokens.append(token)
         hiragana.append(item["hira"])
@@ -43,47 +327,77 @@ You respond with what you think is the most accurate translation for the speech
 After that you add a quick breakdown which part of the japenese sentence translates to which part of the english sentence.
 """
 
-async def stream_translation(page: str, crop: str, ocr_text: str):
-    stream = chat(
-        model="huihui_ai/qwen3-vl-abliterated:8b-thinking",
-        messages=[
-            {"role": "system", "content": TRANSLATE_SYSTEM},
-            {"role": "user", "content": f"The OCR'd text:\n\n{ocr_text}", "images": [page, crop]}
-        ],
-        stream=True,
-    )
-
-    in_thinking = False
+async def stream_translation(page: str, crop: str, ocr_text: str, priority: Priority = Priority.TRANSLATION):
+    async with SCHEDULER.async_slot(TRANSLATE_MODEL, priority):
+        with stage("translate", model=TRANSLATE_MODEL):
+            started = time.perf_counter()
+            # Use the async client so waiting for tokens doesn't block the event loop.
+            # Translations of a page go to the same host, which has the page cached.
+            stream = POOL.stream(TRANSLATE_MODEL, lambda client: client.chat(
+                model=TRANSLATE_MODEL,
+                messages=[
+                    {"role": "system", "content": TRANSLATE_SYSTEM},
+                    {"role": "user", "content": f"The OCR'd text:\n\n{ocr_text}", "images": [page, crop]}
+                ],
+                stream=True,
+            ), affinity=page)
+
+            async for data in _translation_events(stream, TRANSLATE_MODEL, started):
+                yield data
+
+
+async def _translation_events(stream, model: str, started: float, label: str = "Translation"):
+    """
+    Turn an Ollama chat stream into {"type": "thinking"|"content", "text": ...}
+    events, followed by one {"type": "done", ...} event with token counts.
+    """
     content = ''
     thinking = ''
+    first_token = None
+    tokens = 0
+    eval_seconds = None
+    prompt_tokens = None
 
-    # Ollama's chat() with stream=True returns a synchronous generator
-    # Use regular 'for' loop (not 'async for') since stream is not async
-    for chunk in stream:
+    async for chunk in stream:
         message = chunk.message
-
-        # Send structured JSON chunks with type markers for frontend parsing
+        if chunk.done and chunk.eval_count and chunk.eval_duration:
+            tokens = chunk.eval_count
+            eval_seconds = chunk.eval_duration / 1e9
+        if chunk.done:
+            # Prompt tokens Ollama had to evaluate, a reused prefix doesn't count
+            prompt_tokens = chunk.prompt_eval_count
+        elif message.thinking or message.content:
+            if first_token is None:
+                first_token = time.perf_counter()
+            tokens += 1
+
+        # Structured events with type markers for frontend parsing
         if message.thinking:
-            if not in_thinking:
-                in_thinking = True
-                print('Thinking:\n', end='', flush=True)
-            print(message['thinking'], end='', flush=True)
+            if LOG_TOKENS:
+                logger.debug("thinking token: %r", message['thinking'])
             thinking += message['thinking']
 
-            # Send as SSE-formatted JSON
-            data = {"type": "thinking", "text": message['thinking']}
-            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+            yield {"type": "thinking", "text": message['thinking']}
 
         elif message.content:
-            if in_thinking:
-                in_thinking = False
-                print('\n\nAnswer:\n', end='', flush=True)
-            print(message['content'], end='', flush=True)
+            if LOG_TOKENS:
+                logger.debug("content token: %r", message['content'])
             content += message['content']
 
-            # Send as SSE-formatted JSON
-            data = {"type": "content", "text": message['content']}
-            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+            yield {"type": "content", "text": message['content']}
+
+    observe_stream(model, started, first_token, tokens, eval_seconds)
+    logger.info("%s finished: %d tokens (%d thinking / %d answer chars) in %.1fs",
+                label, tokens, len(thinking), len(content), time.perf_counter() - started)
+    logger.debug("%s answer:\n%s", label, content)
+    yield {
+        "type": "done",
+        "tokens": tokens,
+        "prompt_tokens": prompt_tokens,
+        "thinking_chars": len(thinking),
+        "content_chars": len(content),
+        "ttft_ms": round((first_token - started) * 1000) if first_token else None,
+    }
 
 
 TRANSLATE_MULTIPLE_SYSTEM = """
@@ -108,7 +422,7 @@ After that you add a quick breakdown which part of the japenese sentence transla
 """
 
 
-async def stream_translation_multiple(page: str, crops: list[str], ocr_texts: list[str]):
+async def stream_translation_multiple(page: str, crops: list[str], ocr_texts: list[str], priority: Priority = Priority.TRANSLATION):
     # Build message with all bubbles
     bubble_list = "\n".join([
         f"Bubble {i+1}: {text}"
@@ -118,57 +432,84 @@ async def stream_translation_multiple(page: str, crops: list[str], ocr_texts: li
     # Include all crops as images in the context
     images = [page] + crops
 
-    stream = chat(
-        model="huihui_ai/qwen3-vl-abliterated:8b-thinking",
-        messages=[
-            {"role": "system", "content": TRANSLATE_MULTIPLE_SYSTEM},
-            {"role": "user", "content": f"The OCR'd text:\n\n{bubble_list}", "images": images}
-        ],
-        stream=True,
-    )
-
-    in_thinking = False
-    content = ''
-    thinking = ''
-
-    for chunk in stream:
-        message = chunk.message
-
-        if message.thinking:
-            if not in_thinking:
-                in_thinking = True
-                print('Thinking:\n', end='', flush=True)
-            print(message['thinking'], end='', flush=True)
-            thinking += message['thinking']
-
-            data = {"type": "thinking", "text": message['thinking']}
-            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
-
-        elif message.content:
-            if in_thinking:
-                in_thinking = False
-                print('\n\nAnswer:\n', end='', flush=True)
-            print(message['content'], end='', flush=True)
-            content += message['content']
-
-            data = {"type": "content", "text": message['content']}
-            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
-
+    async with SCHEDULER.async_slot(TRANSLATE_MODEL, priority):
+        with stage("translate", model=TRANSLATE_MODEL):
+            started = time.perf_counter()
+            stream = POOL.stream(TRANSLATE_MODEL, lambda client: client.chat(
+                model=TRANSLATE_MODEL,
+                messages=[
+                    {"role": "system", "content": TRANSLATE_MULTIPLE_SYSTEM},
+                    {"role": "user", "content": f"The OCR'd text:\n\n{bubble_list}", "images": images}
+                ],
+                stream=True,
+            ), affinity=page)
+
+            async for data in _translation_events(stream, TRANSLATE_MODEL, started):
+                yield data
+
+
+async def stream_chat(model: str, messages: list[dict], options: dict | None = None,
+                      priority: Priority = Priority.INTERACTIVE, affinity: str | None = None):
+    """
+    Stream a chat reply as translation-style events (see _translation_events).
+    Calls with the same `affinity` (a chat session) go to the same Ollama host
+    when possible, so the conversation so far is still in its prompt cache.
+    """
+    async with SCHEDULER.async_slot(model, priority):
+        with stage("chat", model=model):
+            started = time.perf_counter()
+            stream = POOL.stream(model, lambda client: client.chat(
+                model=model, messages=messages, stream=True, options=options), affinity=affinity)
+
+            async for data in _translation_events(stream, model, started, label="Chat reply"):
+                yield data
+
+
+SUMMARIZE_SYSTEM = """
+You condense a conversation about a japanese manga page between a reader and an assistant.
+Keep what later questions may refer to: words and grammar that were explained, translations that were agreed on, the reader's preferences.
+You respond with ONLY the summary, in short bullet points, no longer than 200 words.
+"""
 
-def word_information(word: str, image_path: str):
-    res: GenerateResponse = generate(
-        model="huihui_ai/qwen3-vl-abliterated:4b-instruct",
-        prompt=f"Please list possible meanings for this word:\n\n{word}",
-        system="""
+async def summarize_chat(model: str, summary: str, messages: list[dict],
+                         priority: Priority = Priority.BACKGROUND, affinity: str | None = None) -> str:
+    """Fold `messages` (oldest chat turns, text only) into the running `summary`."""
+    transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    if summary:
+        transcript = f"Summary of the conversation before:\n{summary}\n\nContinued conversation:\n\n{transcript}"
+
+    async with SCHEDULER.async_slot(model, priority):
+        with stage("chat_summary", model=model):
+            res = await POOL.call_async(model, lambda client: client.chat(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SUMMARIZE_SYSTEM},
+                    {"role": "user", "content": transcript},
+                ],
+                options={"num_predict": 400},
+            ), affinity=affinity)
+    logger.debug("Chat summary: [%s]", res.message.content)
+    return res.message.content.strip()
+
+
+WORD_SYSTEM = """
 You are an automatic japanese -> english dictionary assistant. You are also given a manga page that contains the word for reference.
 Your job is to provide very shortly the possible meanings (english translations) of a given japanese word similar to what duolingo does when you tap an underlined  word during an excercise.
-""",
-        images=[image_path],
-        options={
-            "num_predict": 1000
-        }
-    )
-    print(f"Info Response: [{res.response}]")
+"""
+
+def word_information(word: str, image_path: str, priority: Priority = Priority.INTERACTIVE):
+    with stage("word", model=OCR_MODEL):
+        res: GenerateResponse = _generate(
+            priority,
+            model=OCR_MODEL,
+            prompt=f"Please list possible meanings for this word:\n\n{word}",
+            system=WORD_SYSTEM,
+            images=[image_path],
+            options={
+                "num_predict": 1000
+            }
+        )
+    logger.debug("Word info response: [%s]", res.response)
     return res.response
 
 
@@ -205,18 +546,19 @@ Input: "今日は良い天気です。"
 Output: "今日,は,良い,天気,です,。"
 """
 
-    res: GenerateResponse = generate(
-        model="huihui_ai/qwen3-vl-abliterated:8b-instruct",
+    res: GenerateResponse = _generate(
+        Priority.INTERACTIVE,
+        model=TOKENIZE_MODEL,
         prompt=f"Tokenize the following Japanese text:\n\n{text}",
         system=SYSTEM
     )
-    print(f"Tokenization Response: [{res.response}]")
+    logger.debug("Tokenization response: [%s]", res.response)
     try:
         r = res.response.replace("\n","")
         tokens = r.split(",")
         return tokens, r
     except Exception:
-        print("Failed to parse tokenization response.")
+        logger.warning("Failed to parse tokenization response.")
         return None
     
 def _transcribe(text: str):
@@ -247,18 +589,19 @@ Input: "夏,の,ある,日,私,は,一人,で,家,の,前,の,浜,に,居た"
 Output: "なつ,の,ある,ひ,わたし,は,ひとり,で,いえ,の,まえ,の,はま,に,いた||natsu,no,aru,hi,watashi,wa,hitori,de,ie,no,mae,no,hama,ni,ita"
 """
 
-    res: GenerateResponse = generate(
-        model="huihui_ai/qwen3-vl-abliterated:8b-instruct",
+    res: GenerateResponse = _generate(
+        Priority.INTERACTIVE,
+        model=TOKENIZE_MODEL,
         prompt=f"Process the following input:\n\n{text}",
         system=SYSTEM
     )
 
-    print(f"Transcribed List: {res.response}")
+    logger.debug("Transcribed list: %s", res.response)
     try:
         hiragana_csv, romanji_csv = res.response.split("||")
         hiragana_list = hiragana_csv.split(",")
         romanji_list = romanji_csv.split(",")
         return hiragana_list, romanji_list
     except:
-        print("Failed to parse transcribed response.")
+        logger.warning("Failed to parse transcribed response.")
         return None
\ No newline at end of file
@@ -0,0 +1,172 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from starlette.routing import Match
+from utils.tracing import record_span
+
+# Endpoint (route template) the current work is done for. Work that isn't part
+# of a request, e.g. prefetching, is reported as "background".
+ENDPOINT = contextvars.ContextVar("metrics_endpoint", default="background")
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REQUEST_SECONDS = Histogram(
+    "manga_request_duration_seconds",
+    "Total request time including streamed bodies",
+    ["endpoint", "method", "status"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "manga_stage_duration_seconds",
+    "Time spent in a processing stage (decode, hash, store, crop, detect, ocr, word, chop, translate, thumbnail)",
+    ["stage", "endpoint", "model"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_TTFT_SECONDS = Histogram(
+    "manga_llm_time_to_first_token_seconds",
+    "Time from sending a streamed LLM request to its first token",
+    ["endpoint", "model"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "manga_llm_tokens_per_second",
+    "Generation speed of streamed LLM responses",
+    ["endpoint", "model"],
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200),
+)
+CACHE_LOOKUPS = Counter(
+    "manga_cache_lookups_total",
+    "Result cache lookups",
+    ["cache", "endpoint", "result"],
+)
+ERRORS = Counter(
+    "manga_errors_total",
+    "Failed requests and processing stages",
+    ["endpoint", "stage"],
+)
+LLM_QUEUED = Gauge(
+    "manga_llm_queued_requests",
+    "LLM requests waiting in the scheduler",
+    ["model", "priority"],
+)
+LLM_RUNNING = Gauge(
+    "manga_llm_running_requests",
+    "LLM requests currently running",
+    ["model"],
+)
+
+LLM_HOST_OUTSTANDING = Gauge(
+    "manga_llm_host_outstanding_requests",
+    "Requests currently sent to an Ollama host",
+    ["host"],
+)
+LLM_HOST_REQUESTS = Counter(
+    "manga_llm_host_requests_total",
+    "Requests sent to an Ollama host by result (ok, failed, cancelled)",
+    ["host", "result"],
+)
+
+EXECUTOR_QUEUED = Gauge(
+    "manga_executor_queued_tasks",
+    "Tasks waiting for a thread of a bounded executor (image, detect, llm)",
+    ["executor"],
+)
+EXECUTOR_RUNNING = Gauge(
+    "manga_executor_running_tasks",
+    "Tasks running on a bounded executor",
+    ["executor"],
+)
+EXECUTOR_REJECTED = Counter(
+    "manga_executor_rejected_total",
+    "Requests turned away because a resource's queue was full",
+    ["executor", "endpoint"],
+)
+
+SINGLE_FLIGHT_SHARED = Counter(
+    "manga_single_flight_shared_total",
+    "Requests answered by an identical request already in flight",
+    ["flight"],
+)
+
+
+@contextmanager
+def stage(name: str, model: str = ""):
+    """
+    Time a processing stage and count it as an error if it raises.
+    The timing also becomes a span in the request's trace log line.
+    """
+    endpoint = ENDPOINT.get()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.labels(endpoint, name).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name, endpoint, model).observe(elapsed)
+        record_span(name, elapsed)
+
+
+def cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, ENDPOINT.get(), "hit" if hit else "miss").inc()
+
+
+def observe_stream(model: str, started: float, first_token: float | None, tokens: int,
+                   eval_seconds: float | None = None):
+    """
+    Record time-to-first-token and generation speed of a finished stream.
+    Prefers Ollama's own eval timing when the final chunk carried it.
+    """
+    endpoint = ENDPOINT.get()
+    if first_token is None:
+        return
+    LLM_TTFT_SECONDS.labels(endpoint, model).observe(first_token - started)
+    generating = eval_seconds or (time.perf_counter() - first_token)
+    if tokens and generating > 0:
+        LLM_TOKENS_PER_SECOND.labels(endpoint, model).observe(tokens / generating)
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware so the request timer covers the whole streamed body,
+    not just the time until the response headers are sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _endpoint(self, scope) -> str:
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope)
+        ENDPOINT.set(endpoint)
+        status = "500"
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_SECONDS.labels(endpoint, scope["method"], status).observe(time.perf_counter() - start)
+            if status.startswith("5"):
+                ERRORS.labels(endpoint, "request").inc()
@@ -0,0 +1,49 @@
+from PIL import Image
+from utils.cache import OCR_CACHE
+from utils.llm import Priority
+from utils.ocr_engines import ENGINE, OllamaEngine
+from utils.pages import box_key, remove_files, save_crop
+
+
+def _cache_key(page_id: str, box: dict) -> str:
+    # LLM results keep the original keys so existing caches stay valid
+    key = box_key(page_id, box)
+    return key if isinstance(ENGINE, OllamaEngine) else f"{key}_{ENGINE.name}"
+
+
+def ocr_bubble(page: Image.Image, page_id: str, box: dict, crop_path: str,
+               priority: Priority = Priority.INTERACTIVE) -> str:
+    """
+    OCR one bubble of a page. Results are cached per page and box so prefetched
+    or previously analyzed bubbles return immediately.
+    """
+    return ocr_bubbles(page, page_id, [box], crop_path, priority)[0]
+
+
+def ocr_bubbles(page: Image.Image, page_id: str, boxes: list[dict], crop_template: str,
+                priority: Priority = Priority.INTERACTIVE) -> list[str]:
+    """
+    OCR many bubbles of a page, in order, with the configured OCR engine.
+    Only uncached bubbles are cropped and sent to the engine, all in one call
+    so it can batch them (the LLM engine packs several crops per request, the
+    local engine runs them as one inference batch). `crop_template` is
+    formatted with the bubble index to get each crop's path; it must be unique
+    to the call, the crops are read by the engine and removed afterwards.
+    """
+    texts = [OCR_CACHE.get(_cache_key(page_id, box)) for box in boxes]
+    missing = [i for i, text in enumerate(texts) if text is None]
+    if not missing:
+        return texts
+
+    crop_paths = [crop_template.format(i) for i in missing]
+    try:
+        for i, crop_path in zip(missing, crop_paths):
+            save_crop(page, boxes[i], crop_path)
+        results = ENGINE.recognize(crop_paths, priority)
+    finally:
+        remove_files(crop_paths)
+
+    for i, result in zip(missing, results):
+        OCR_CACHE.set(_cache_key(page_id, boxes[i]), result.text)
+        texts[i] = result.text
+    return texts
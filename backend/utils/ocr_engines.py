@@ -0,0 +1,164 @@
+import abc
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from utils.llm import ocr_image, ocr_images, Priority
+from utils.metrics import stage
+
+# Which engine OCRs bubbles: "ollama" (vision LLM) or "manga-ocr" (local model)
+OCR_ENGINE = os.environ.get("OCR_ENGINE", "ollama")
+# OCR several bubbles of a page in one vision request
+MULTI_OCR = os.environ.get("MULTI_OCR", "1") == "1"
+MULTI_OCR_MAX_CROPS = int(os.environ.get("MULTI_OCR_MAX_CROPS", "8"))
+# Local manga-ocr weights (a copy of kha-white/manga-ocr-base)
+MANGA_OCR_MODEL = os.environ.get("MANGA_OCR_MODEL", os.path.join("models", "manga-ocr"))
+MANGA_OCR_BATCH = int(os.environ.get("MANGA_OCR_BATCH", "16"))
+# Results of the local engine below this confidence are OCR'd again by the LLM (0 = never)
+OCR_FALLBACK_CONFIDENCE = float(os.environ.get("OCR_FALLBACK_CONFIDENCE", "0"))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OCRResult:
+    text: str
+    confidence: float | None = None  # None if the engine can't tell
+
+
+class OCREngine(abc.ABC):
+    """
+    Turns crop images into text. `name` ends up in the OCR cache keys so
+    switching engines never serves another engine's results.
+    """
+    name = ""
+
+    @abc.abstractmethod
+    def recognize(self, image_paths: list[str], priority: Priority = Priority.INTERACTIVE) -> list[OCRResult]:
+        """One result per image, in order."""
+
+
+class OllamaEngine(OCREngine):
+    """
+    The vision LLM. Crops are sent in groups of up to `max_crops` per request;
+    a group whose answer doesn't validate is OCR'd crop by crop instead.
+    """
+    name = "ollama"
+
+    def __init__(self, multi: bool = MULTI_OCR, max_crops: int = MULTI_OCR_MAX_CROPS):
+        self.multi = multi
+        self.max_crops = max_crops
+
+    def recognize(self, image_paths: list[str], priority: Priority = Priority.INTERACTIVE) -> list[OCRResult]:
+        results = []
+        for start in range(0, len(image_paths), self.max_crops):
+            group = image_paths[start:start + self.max_crops]
+            texts = None
+            if self.multi and len(group) > 1:
+                texts = ocr_images(group, priority=priority)
+            if texts is None:
+                texts = [ocr_image(path, priority=priority) for path in group]
+            results.extend(OCRResult(text) for text in texts)
+        return results
+
+
+class MangaOCREngine(OCREngine):
+    """
+    manga-ocr (a small ViT encoder + BERT decoder trained on manga text) running
+    locally with transformers. Needs `pip install transformers` and the model
+    files in MANGA_OCR_MODEL. Crops are recognised in batches of MANGA_OCR_BATCH;
+    the confidence is the mean probability of the generated tokens.
+    """
+    name = "manga-ocr"
+
+    def __init__(self, model_path: str = MANGA_OCR_MODEL, batch_size: int = MANGA_OCR_BATCH):
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    import torch
+                    from transformers import AutoTokenizer, ViTImageProcessor, VisionEncoderDecoderModel
+                except ImportError as e:
+                    raise RuntimeError("OCR_ENGINE=manga-ocr needs torch and transformers: pip install transformers") from e
+                if not os.path.isdir(self.model_path):
+                    raise RuntimeError(f"manga-ocr model not found at {self.model_path} (set MANGA_OCR_MODEL)")
+
+                logger.info("Loading manga-ocr from %s", self.model_path)
+                self._torch = torch
+                self._processor = ViTImageProcessor.from_pretrained(self.model_path)
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+                model = VisionEncoderDecoderModel.from_pretrained(self.model_path)
+                self._device = "cuda" if torch.cuda.is_available() else "cpu"
+                self._model = model.to(self._device).eval()
+        return self._model
+
+    def recognize(self, image_paths: list[str], priority: Priority = Priority.INTERACTIVE) -> list[OCRResult]:
+        from PIL import Image
+
+        model = self._load()
+        results = []
+        for start in range(0, len(image_paths), self.batch_size):
+            batch = image_paths[start:start + self.batch_size]
+            # manga-ocr is trained on greyscale crops
+            images = [Image.open(path).convert("L").convert("RGB") for path in batch]
+
+            with stage("ocr", model=self.name), self._lock, self._torch.inference_mode():
+                pixel_values = self._processor(images, return_tensors="pt").pixel_values.to(self._device)
+                output = model.generate(pixel_values, max_length=300, output_scores=True, return_dict_in_generate=True)
+                scores = model.compute_transition_scores(output.sequences, output.scores, normalize_logits=True)
+
+            # Padding after the end of shorter sequences doesn't count towards the confidence
+            generated = output.sequences[:, 1:] != self._tokenizer.pad_token_id
+            for sequence, token_scores, mask in zip(output.sequences, scores, generated):
+                text = self._tokenizer.decode(sequence, skip_special_tokens=True)
+                confidence = float(token_scores[mask].mean().exp()) if mask.any() else 0.0
+                results.append(OCRResult(_clean_manga_ocr_text(text), confidence))
+        return results
+
+
+def _clean_manga_ocr_text(text: str) -> str:
+    # The tokenizer puts spaces between characters; Japanese has none
+    return "".join(text.split())
+
+
+class FallbackEngine(OCREngine):
+    """
+    Runs a fast engine first and sends the results it isn't sure about
+    (confidence below `threshold`) to a slower, more accurate one.
+    """
+
+    def __init__(self, fast: OCREngine, accurate: OCREngine, threshold: float):
+        self.fast = fast
+        self.accurate = accurate
+        self.threshold = threshold
+        self.name = f"{fast.name}+{accurate.name}@{threshold:g}"
+
+    def recognize(self, image_paths: list[str], priority: Priority = Priority.INTERACTIVE) -> list[OCRResult]:
+        results = self.fast.recognize(image_paths, priority)
+        unsure = [i for i, result in enumerate(results)
+                  if result.confidence is not None and result.confidence < self.threshold]
+        if unsure:
+            logger.debug("OCR fallback for %d of %d crops", len(unsure), len(image_paths))
+            retried = self.accurate.recognize([image_paths[i] for i in unsure], priority)
+            for i, result in zip(unsure, retried):
+                results[i] = result
+        return results
+
+
+def create_engine(name: str = OCR_ENGINE, fallback_confidence: float = OCR_FALLBACK_CONFIDENCE) -> OCREngine:
+    if name == "ollama":
+        return OllamaEngine()
+    if name == "manga-ocr":
+        engine = MangaOCREngine()
+        if fallback_confidence > 0:
+            return FallbackEngine(engine, OllamaEngine(), fallback_confidence)
+        return engine
+    raise ValueError(f"Unknown OCR_ENGINE: {name} (expected 'ollama' or 'manga-ocr')")
+
+
+ENGINE = create_engine()
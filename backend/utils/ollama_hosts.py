@@ -0,0 +1,28 @@
+"""
+Which Ollama servers to use. Standard library only and Python 3.8 compatible:
+start.py imports this with whatever Python runs the launcher.
+"""
+from __future__ import annotations
+
+import os
+from urllib.parse import urlsplit
+
+
+def normalize_host(host: str) -> str:
+    """
+    Full URL of an Ollama host given the way OLLAMA_HOST accepts it: the
+    scheme and port may be left out (0.0.0.0:11434, gpu1), as for the ollama client.
+    """
+    parts = urlsplit(host.strip() if "://" in host else f"http://{host.strip()}")
+    port = parts.port or (443 if parts.scheme == "https" else 11434)
+    hostname = f"[{parts.hostname}]" if ":" in parts.hostname else parts.hostname
+    return f"{parts.scheme}://{hostname}:{port}{parts.path.rstrip('/')}"
+
+
+def ollama_hosts() -> list[str]:
+    """
+    Ollama servers from OLLAMA_HOSTS (comma separated). Defaults to the one the
+    ollama client would use on its own (OLLAMA_HOST or localhost:11434).
+    """
+    hosts = os.environ.get("OLLAMA_HOSTS", os.environ.get("OLLAMA_HOST", "http://localhost:11434"))
+    return [normalize_host(host) for host in hosts.split(",") if host.strip()]
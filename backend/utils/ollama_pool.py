@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+import httpx
+from ollama import AsyncClient, Client, ResponseError
+from utils.metrics import LLM_HOST_OUTSTANDING, LLM_HOST_REQUESTS
+from utils.ollama_hosts import ollama_hosts
+
+# Ollama servers to spread LLM calls over (OLLAMA_HOSTS, see utils/ollama_hosts.py)
+OLLAMA_HOSTS = ollama_hosts()
+# Seconds between /api/tags checks of every host
+OLLAMA_HEALTH_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "15"))
+# A host that failed a request is skipped this long (or until it passes a health check)
+OLLAMA_HOST_COOLDOWN = float(os.environ.get("OLLAMA_HOST_COOLDOWN", "30"))
+# Other hosts a failed request is retried on
+OLLAMA_RETRIES = int(os.environ.get("OLLAMA_RETRIES", "2"))
+# Seconds to wait for a connection; generation itself has no timeout
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+# How many more running requests the page's preferred host may have than the
+# least busy one before a translation goes elsewhere. 0 never waits for the
+# preferred host while another one is idle.
+OLLAMA_AFFINITY_SLACK = int(os.environ.get("OLLAMA_AFFINITY_SLACK", "0"))
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class NoHostAvailable(ConnectionError):
+    """No Ollama host is left to try for a request."""
+
+
+def retryable(e: Exception) -> bool:
+    """Whether another host may succeed where this one failed."""
+    if isinstance(e, ResponseError):
+        # 404: model not pulled on this host; 5xx: overloaded or crashed
+        return e.status_code == 404 or e.status_code >= 500
+    return isinstance(e, (ConnectionError, httpx.TransportError))
+
+
+class OllamaHost:
+    """One Ollama server with its clients, known models and load."""
+
+    def __init__(self, url: str):
+        self.url = url
+        timeout = httpx.Timeout(None, connect=OLLAMA_CONNECT_TIMEOUT)
+        self.client = Client(host=url, timeout=timeout)
+        self.async_client = AsyncClient(host=url, timeout=timeout)
+        self._health_client = Client(host=url, timeout=OLLAMA_CONNECT_TIMEOUT)
+        self.models: set[str] | None = None  # None until the first health check
+        self.missing: set[str] = set()  # models a request found missing since the last check
+        self.down_until = 0.0
+        self.error: str | None = None
+        self.outstanding = 0
+        self.completed = 0
+        self.failed = 0
+        self.last_used = 0.0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def serves(self, model: str) -> bool:
+        if model in self.missing:
+            return False
+        return self.models is None or model in self.models
+
+    def mark_down(self, error: str):
+        self.down_until = time.monotonic() + OLLAMA_HOST_COOLDOWN
+        self.error = error
+
+    def check(self):
+        """Health check: the same /api/tags query start.py uses to verify the models."""
+        try:
+            models = {model.model for model in self._health_client.list().models}
+        except Exception as e:
+            if self.available:
+                logger.warning("Ollama host %s is unreachable: %s", self.url, e)
+            self.mark_down(f"{type(e).__name__}: {e}")
+            return
+        if not self.available or self.models != models:
+            logger.info("Ollama host %s is up with %d models", self.url, len(models))
+        self.models = models
+        self.missing = set()
+        self.down_until = 0.0
+        self.error = None
+
+    def status(self) -> dict:
+        return {
+            "url": self.url,
+            "available": self.available,
+            "error": self.error,
+            "models": sorted(self.models) if self.models is not None else None,
+            "outstanding": self.outstanding,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+def _affinity_score(key: str, url: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{key}|{url}".encode(), digest_size=8).digest(), "big")
+
+
+class OllamaPool:
+    """
+    Spreads LLM calls over several Ollama servers. Each call goes to the
+    available host with the model that has the fewest requests running;
+    calls with an affinity key (translations of a page, a chat session)
+    prefer the same host every time so its prompt cache stays warm, unless
+    that host is much busier than the others. A call that fails with a
+    connection or server error is retried on another host, and the failed
+    host is skipped until its cooldown ends or a health check passes.
+    """
+
+    def __init__(self, urls: list[str]):
+        self.hosts = [OllamaHost(url) for url in urls]
+        self._lock = threading.Lock()
+        self._health_task: asyncio.Task | None = None
+        # Called after health changes, so the scheduler can adjust its limits
+        self.on_change: Callable[[], None] | None = None
+
+    def host_count(self, model: str) -> int:
+        """Available hosts that serve `model` (at least 1, so requests still get a chance)."""
+        return max(1, sum(1 for host in self.hosts if host.available and host.serves(model)))
+
+    def _choose(self, model: str, affinity: str | None, tried: set[str]) -> OllamaHost:
+        with self._lock:
+            candidates = [host for host in self.hosts if host.url not in tried]
+            if not candidates:
+                raise NoHostAvailable(f"No Ollama host left to try for {model}")
+            # Prefer hosts that look healthy and have the model; if none do, the
+            # health information may just be stale, so try the others anyway
+            healthy = [host for host in candidates if host.available and host.serves(model)]
+            candidates = healthy or candidates
+
+            host = min(candidates, key=lambda h: (h.outstanding, h.last_used))
+            if affinity is not None:
+                preferred = max(candidates, key=lambda h: _affinity_score(affinity, h.url))
+                if preferred.outstanding - host.outstanding <= OLLAMA_AFFINITY_SLACK:
+                    host = preferred
+
+            host.outstanding += 1
+            host.last_used = time.monotonic()
+        LLM_HOST_OUTSTANDING.labels(host.url).inc()
+        return host
+
+    def _finish(self, host: OllamaHost, model: str, error: BaseException | None = None):
+        with self._lock:
+            host.outstanding -= 1
+            if error is None:
+                host.completed += 1
+            elif isinstance(error, Exception):
+                host.failed += 1
+        LLM_HOST_OUTSTANDING.labels(host.url).dec()
+        if error is None:
+            result = "ok"
+        else:
+            result = "failed" if isinstance(error, Exception) else "cancelled"
+        LLM_HOST_REQUESTS.labels(host.url, result).inc()
+
+        if isinstance(error, Exception) and retryable(error):
+            if isinstance(error, ResponseError) and error.status_code == 404:
+                # The host is fine, it just doesn't have this model
+                logger.warning("Ollama host %s doesn't have %s", host.url, model)
+                host.missing.add(model)
+            else:
+                logger.warning("Ollama host %s failed: %s", host.url, error)
+                host.mark_down(f"{type(error).__name__}: {error}")
+            self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def _attempts(self) -> int:
+        return 1 + min(OLLAMA_RETRIES, len(self.hosts) - 1)
+
+    def call(self, model: str, request: Callable[[Client], T], affinity: str | None = None) -> T:
+        """Run `request` with the client of a host that serves `model`, failing over on errors."""
+        tried = set()
+        for attempt in range(self._attempts()):
+            host = self._choose(model, affinity, tried)
+            tried.add(host.url)
+            try:
+                result = request(host.client)
+            except BaseException as e:
+                self._finish(host, model, e)
+                if not self._retry(e, attempt):
+                    raise
+                continue
+            self._finish(host, model)
+            return result
+
+    async def call_async(self, model: str, request: Callable[[AsyncClient], Awaitable[T]],
+                         affinity: str | None = None) -> T:
+        """call() with the async clients."""
+        tried = set()
+        for attempt in range(self._attempts()):
+            host = self._choose(model, affinity, tried)
+            tried.add(host.url)
+            try:
+                result = await request(host.async_client)
+            except BaseException as e:
+                self._finish(host, model, e)
+                if not self._retry(e, attempt):
+                    raise
+                continue
+            self._finish(host, model)
+            return result
+
+    async def stream(self, model: str, request: Callable[[AsyncClient], Awaitable[AsyncIterator[T]]],
+                     affinity: str | None = None) -> AsyncIterator[T]:
+        """
+        Chunks of a streamed call. Failing over is only possible until the
+        first chunk arrived; an error after that is raised to the caller.
+        """
+        tried = set()
+        for attempt in range(self._attempts()):
+            host = self._choose(model, affinity, tried)
+            tried.add(host.url)
+            error = None
+            started = False
+            try:
+                # The request is only sent when the stream is first read
+                chunks = await request(host.async_client)
+                async for chunk in chunks:
+                    started = True
+                    yield chunk
+                return
+            except BaseException as e:
+                error = e
+                if started or not self._retry(e, attempt):
+                    raise
+            finally:
+                self._finish(host, model, error)
+
+    def _retry(self, error: BaseException, attempt: int) -> bool:
+        if not isinstance(error, Exception) or not retryable(error):
+            return False
+        if attempt == self._attempts() - 1:
+            return False
+        logger.info("Retrying on another Ollama host after: %s", error)
+        return True
+
+    def check_all(self):
+        for host in self.hosts:
+            host.check()
+        self._changed()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.to_thread(self.check_all)
+            await asyncio.sleep(OLLAMA_HEALTH_INTERVAL)
+
+    def start(self):
+        """Start the periodic health checks. Call from the running event loop."""
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            return [host.status() for host in self.hosts]
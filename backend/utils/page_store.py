@@ -0,0 +1,119 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING
+from PIL import Image
+from utils.cache import CACHE_FOLDER
+from utils.metrics import cache_lookup, stage
+from utils.pages import open_page, page_key
+
+if TYPE_CHECKING:
+    import numpy
+
+# Keep decoded pages as raw memory-mapped pixels so crops skip the JPEG/PNG decode
+USE_PAGE_STORE = os.environ.get("PAGE_STORE", "0") == "1"
+PAGE_STORE_FOLDER = os.path.join(CACHE_FOLDER, "raw")
+# Raw pages are large (a 1400x2000 colour page is 8 MB), older ones are evicted past this size
+PAGE_STORE_MAX_MB = int(os.environ.get("PAGE_STORE_MAX_MB", "2048"))
+
+logger = logging.getLogger(__name__)
+
+
+class PageStore:
+    """
+    Decoded pages written once as .npy files under cache/raw/ and memory-mapped
+    on use. All workers map the same files, so the pixels sit in the OS page
+    cache once and a crop is a slice of the mapping rather than a full decode.
+    Files are keyed by page content and evicted least recently used first once
+    the store grows past `max_bytes`.
+    """
+
+    def __init__(self, folder: str = PAGE_STORE_FOLDER, max_bytes: int = PAGE_STORE_MAX_MB * 1024 * 1024,
+                 open_pages: int = 16):
+        import numpy as np
+
+        self._np = np
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # Mappings this process keeps open, most recently used last
+        self._open: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._open_pages = open_pages
+        self._lock = threading.Lock()
+
+    def _path(self, page_id: str) -> Path:
+        return self.folder / f"{page_id}.npy"
+
+    def get(self, image_path: str):
+        """Pixels of a page as a read-only (height, width[, channels]) array."""
+        page_id = page_key(image_path)
+        with self._lock:
+            if page_id in self._open:
+                self._open.move_to_end(page_id)
+                return self._open[page_id]
+
+        path = self._path(page_id)
+        try:
+            pixels = self._np.load(path, mmap_mode="r")
+            # Mark as recently used for eviction
+            os.utime(path)
+            cache_lookup("raw_page", True)
+        except (OSError, ValueError):
+            cache_lookup("raw_page", False)
+            pixels = self._write(image_path, path)
+
+        with self._lock:
+            self._open[page_id] = pixels
+            while len(self._open) > self._open_pages:
+                self._open.popitem(last=False)
+        return pixels
+
+    def _write(self, image_path: str, path: Path):
+        page = open_page(image_path)
+        if page.mode not in ("L", "RGB", "RGBA"):
+            page = page.convert("RGB")
+
+        with stage("store"):
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                self._np.save(f, self._np.asarray(page))
+            os.replace(tmp_path, path)
+        self._evict(keep=path)
+        return self._np.load(path, mmap_mode="r")
+
+    def _evict(self, keep: Path):
+        files = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(".npy") and entry.name != keep.name:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue  # evicted by another worker meanwhile
+                files.append((st.st_mtime, st.st_size, entry.path))
+
+        total = keep.stat().st_size + sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Still mapped by a worker on Windows; try again next time
+                continue
+            total -= size
+            logger.debug("Evicted raw page %s", path)
+
+
+PAGE_STORE = PageStore() if USE_PAGE_STORE else None
+
+
+def load_page(image_path: str) -> "Image.Image | numpy.ndarray":
+    """
+    A page to crop bubbles from: its memory-mapped pixels when the page store
+    is enabled, otherwise the decoded image. Both work with crop_box/save_crop.
+    """
+    if PAGE_STORE is None:
+        return open_page(image_path)
+    return PAGE_STORE.get(image_path)
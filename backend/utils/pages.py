@@ -0,0 +1,125 @@
+import hashlib
+import os
+import uuid
+from typing import TYPE_CHECKING
+from PIL import Image
+from utils.cache import ResultCache
+from utils.metrics import stage
+
+if TYPE_CHECKING:
+    import numpy
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
+
+def is_image_file(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def list_images(folder_path: str) -> list[str]:
+    """Sorted image filenames in a folder, in the same order the reader shows them."""
+    return [
+        filename for filename in sorted(os.listdir(folder_path))
+        if is_image_file(filename) and os.path.isfile(os.path.join(folder_path, filename))
+    ]
+
+
+def upcoming_pages(image_path: str, count: int) -> list[str]:
+    """Paths of the `count` pages following `image_path` in its folder."""
+    folder, filename = os.path.split(image_path)
+    images = list_images(folder or ".")
+    if filename not in images:
+        return []
+    start = images.index(filename) + 1
+    return [os.path.join(folder, name) for name in images[start:start + count]]
+
+
+# Content hash of every page file seen, keyed by path + mtime + size
+PAGE_HASHES = ResultCache("pages", max_items=8192)
+
+
+def content_hash(image_path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def page_key(image_path: str) -> str:
+    """
+    Cache key of a page: a hash of the file's content, so the same page under
+    another path (a re-downloaded chapter, a copy in another folder) shares
+    all cached detection, OCR, thumbnail and translation work. The hash is
+    remembered per path, mtime and size; a file is only read again after it
+    was edited or replaced.
+    """
+    st = os.stat(image_path)
+    ident = f"{os.path.abspath(image_path)}|{st.st_mtime_ns}|{st.st_size}"
+    path_key = hashlib.md5(ident.encode()).hexdigest()
+
+    key = PAGE_HASHES.get(path_key)
+    if key is None:
+        with stage("hash"):
+            key = content_hash(image_path)
+        PAGE_HASHES.set(path_key, key)
+    return key
+
+
+def box_key(page: str, box: dict) -> str:
+    x, y, w, h = (round(box[k]) for k in ("x", "y", "w", "h"))
+    return f"{page}_{x}_{y}_{w}_{h}"
+
+
+def open_page(image_path: str) -> Image.Image:
+    """Open and fully decode a page so decode time isn't hidden in the first crop."""
+    with stage("decode"):
+        page = Image.open(image_path)
+        page.load()
+    return page
+
+
+def crop_box(page: "Image.Image | numpy.ndarray", box: dict) -> Image.Image:
+    x, y, w, h = box["x"], box["y"], box["w"], box["h"]
+    if isinstance(page, Image.Image):
+        return page.crop((x, y, x + w, y + h))
+    # Raw pixels from the page store: the slice only touches the bubble's rows.
+    # Rounded and padded with black outside the page exactly like Image.crop,
+    # so a crop doesn't depend on where the page came from.
+    left, top, right, bottom = (round(v) for v in (x, y, x + w, y + h))
+    right, bottom = max(left, right), max(top, bottom)
+    height, width = page.shape[:2]
+    if left >= 0 and top >= 0 and right <= width and bottom <= height:
+        return Image.fromarray(page[top:bottom, left:right])
+
+    import numpy as np
+    crop = np.zeros((bottom - top, right - left) + page.shape[2:], dtype=page.dtype)
+    src_left, src_top = max(left, 0), max(top, 0)
+    src_right, src_bottom = min(right, width), min(bottom, height)
+    if src_left < src_right and src_top < src_bottom:
+        crop[src_top - top:src_bottom - top, src_left - left:src_right - left] = page[src_top:src_bottom, src_left:src_right]
+    return Image.fromarray(crop)
+
+
+def save_crop(page: "Image.Image | numpy.ndarray", box: dict, crop_path: str) -> Image.Image:
+    with stage("crop"):
+        crop = crop_box(page, box)
+        crop.save(crop_path)
+    return crop
+
+
+def crop_template(folder: str) -> str:
+    """
+    A crop path template (formatted with the bubble index) unique to one
+    request. The LLM client reads a crop only when its request is sent, so
+    concurrent requests must never share crop files.
+    """
+    return os.path.join(folder, f"crop_{uuid.uuid4().hex}_{{}}.png")
+
+
+def remove_files(paths: list[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
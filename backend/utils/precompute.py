@@ -0,0 +1,307 @@
+"""
+Offline pre-processing of whole libraries, e.g. overnight, so reading later
+only hits caches. Run from backend/ (the caches are relative to it):
+
+    python -m utils.precompute C:/manga                    # every folder with pages below C:/manga
+    python -m utils.precompute vol1 vol2 --translate       # also translate every bubble
+    python -m utils.precompute C:/manga --workers 2 --batch 8
+
+Every page is detected (in batches of --batch pages per inference), its
+bubbles OCR'd and tokenized, and optionally translated. Results go into the
+same caches the server reads (cache/detect, cache/ocr, cache/translate and
+the page hashes), so the server can keep running meanwhile.
+
+Pages are spread over a pool of worker processes. Progress is checkpointed
+to --checkpoint after every batch; running the same command again skips
+pages that were finished with the same settings and haven't changed since,
+so an interrupted run just continues.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from pathlib import Path
+from utils.cache import CACHE_FOLDER
+
+CHECKPOINT_PATH = os.path.join(CACHE_FOLDER, "precompute.json")
+
+logger = logging.getLogger(__name__)
+
+# Settings of the worker process, set by _init_worker
+_options: dict = {}
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def default_workers() -> int:
+    # Every worker runs its own detector and its own torch threads; past a few
+    # processes they only compete for the same cores (and GPU memory).
+    return max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+def find_volumes(roots: list[str]) -> list[str]:
+    """Every folder below the roots (including them) that contains pages."""
+    from utils.pages import list_images
+
+    volumes = []
+    for root in roots:
+        for folder, dirs, _ in os.walk(root):
+            dirs.sort()
+            if list_images(folder):
+                volumes.append(os.path.abspath(folder))
+    return volumes
+
+
+def settings_tag(profile: str | None, translate: bool) -> list[str]:
+    """
+    The steps a page is processed with. A page counts as done if it was
+    processed with all of them (e.g. a page translated before needs no work
+    when only detecting and OCRing); another profile or OCR engine redoes it.
+    """
+    from utils.detection import get_profile
+    from utils.ocr_engines import ENGINE
+
+    tag = [f"detect:{get_profile(profile).name}", f"ocr:{ENGINE.name}"]
+    return tag + ["translate"] if translate else tag
+
+
+class Checkpoint:
+    """Finished pages by path, with the size/mtime and settings they were processed with."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.pages: dict[str, dict] = {}
+        self.failed: dict[str, str] = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.pages = data.get("pages", {})
+            self.failed = data.get("failed", {})
+        except FileNotFoundError:
+            pass
+
+    def is_done(self, path: str, tag: list[str]) -> bool:
+        entry = self.pages.get(path)
+        if entry is None or not set(tag) <= set(entry["settings"]):
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return entry["size"] == st.st_size and entry["mtime"] == st.st_mtime
+
+    def mark(self, result: dict, tag: list[str]):
+        path = result["path"]
+        if "error" in result:
+            self.failed[path] = result["error"]
+            return
+        self.failed.pop(path, None)
+        self.pages[path] = {
+            "size": result["size"],
+            "mtime": result["mtime"],
+            "settings": tag,
+            "bubbles": result["bubbles"],
+            "seconds": result["seconds"],
+        }
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"pages": self.pages, "failed": self.failed}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def _init_worker(options: dict, threads: int):
+    global _options, _loop
+    _options = options
+    # Before torch is imported (lazily, by the detector), so workers don't oversubscribe the CPU
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    # One loop for the life of the worker: the async Ollama client stays bound to it
+    _loop = asyncio.new_event_loop()
+    from utils.tracing import configure_logging
+    configure_logging()
+
+
+def process_batch(paths: list[str]) -> list[dict]:
+    """
+    Detect a batch of pages in one inference, then OCR, tokenize and (with
+    --translate) translate their bubbles. Runs in a worker process; returns
+    one result per page, with an "error" for pages that failed.
+    """
+    from utils.detection import detect_boxes_batch
+
+    try:
+        all_boxes = detect_boxes_batch(paths, _options["profile"])
+    except Exception as e:
+        logger.exception("Detection failed for a batch of %d pages", len(paths))
+        return [{"path": path, "error": f"{type(e).__name__}: {e}"} for path in paths]
+
+    results = []
+    for path, boxes in zip(paths, all_boxes):
+        started = time.perf_counter()
+        try:
+            st = os.stat(path)
+            tokens = _process_page(path, boxes)
+        except Exception as e:
+            logger.exception("Failed on %s", path)
+            results.append({"path": path, "error": f"{type(e).__name__}: {e}"})
+            continue
+        results.append({
+            "path": path,
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "bubbles": len(boxes),
+            "tokens": tokens,
+            "seconds": round(time.perf_counter() - started, 2),
+        })
+    return results
+
+
+def _process_page(path: str, boxes: list[dict]) -> int:
+    from utils.llm import Priority, chop
+    from utils.ocr import ocr_bubbles
+    from utils.page_store import load_page
+    from utils.pages import page_key
+
+    crop_template = os.path.join(CACHE_FOLDER, f"precompute_{os.getpid()}_{{}}.png")
+    try:
+        page = load_page(path)
+        page_id = page_key(path)
+        ocr_texts = ocr_bubbles(page, page_id, boxes, crop_template, Priority.BACKGROUND)
+        # Same normalisation as /analyze and /translate
+        ocr_texts = [text.replace("\n", "") for text in ocr_texts]
+        # Tokenizing is cheaper than a cache read, it isn't stored; running it
+        # checks every bubble tokenizes and loads the dictionaries once per worker
+        tokens = sum(len(chop(text)[0]) for text in ocr_texts)
+        if _options["translate"]:
+            _loop.run_until_complete(_translate_page(path, page, page_id, boxes, ocr_texts,
+                                                     crop_template.format("translate")))
+    finally:
+        for i in list(range(len(boxes))) + ["translate"]:
+            try:
+                os.remove(crop_template.format(i))
+            except FileNotFoundError:
+                pass
+    return tokens
+
+
+async def _translate_page(path: str, page, page_id: str, boxes: list[dict], ocr_texts: list[str], crop_path: str):
+    from utils.cache import TRANSLATION_CACHE
+    from utils.llm import Priority, stream_translation
+    from utils.pages import save_crop
+    from utils.translation_jobs import cache_translation, translation_key
+
+    for box, ocr_text in zip(boxes, ocr_texts):
+        if not ocr_text:
+            continue
+        key = translation_key(page_id, box, ocr_text)
+        if TRANSLATION_CACHE.get(key) is not None:
+            continue
+        save_crop(page, box, crop_path)
+        events = stream_translation(path, crop_path, ocr_text, priority=Priority.BACKGROUND)
+        async for _ in cache_translation(events, key):
+            pass
+
+
+def run(roots: list[str], workers: int, batch: int, profile: str | None, translate: bool,
+        checkpoint_path: str = CHECKPOINT_PATH, retry_failed: bool = True) -> int:
+    """Process every unfinished page below `roots`; returns the number of failed pages."""
+    tag = settings_tag(profile, translate)
+    checkpoint = Checkpoint(checkpoint_path)
+
+    volumes = find_volumes(roots)
+    from utils.pages import list_images
+    pages = [os.path.join(volume, name) for volume in volumes for name in list_images(volume)]
+    todo = [path for path in pages
+            if not checkpoint.is_done(path, tag) and (retry_failed or path not in checkpoint.failed)]
+    print(f"{len(volumes)} folders, {len(pages)} pages, {len(pages) - len(todo)} already done, {len(todo)} to process")
+    if not todo:
+        return 0
+
+    # Keep batches within one folder, so a batch is one run of consecutive pages
+    batches = []
+    for volume in volumes:
+        volume_todo = [path for path in todo if os.path.dirname(path) == volume]
+        batches += [volume_todo[i:i + batch] for i in range(0, len(volume_todo), batch)]
+
+    options = {"profile": profile, "translate": translate}
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    started = time.perf_counter()
+    done = failed = bubbles = tokens = 0
+
+    # spawn everywhere: forked workers would inherit the parent's threads and sockets
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn"),
+                             initializer=_init_worker, initargs=(options, threads)) as pool:
+        queue = iter(batches)
+        running = set()
+        try:
+            while True:
+                # Only a few batches ahead, so an interrupt loses little work
+                while len(running) < workers * 2:
+                    next_batch = next(queue, None)
+                    if next_batch is None:
+                        break
+                    running.add(pool.submit(process_batch, next_batch))
+                if not running:
+                    break
+
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    for result in future.result():
+                        checkpoint.mark(result, tag)
+                        if "error" in result:
+                            failed += 1
+                            print(f"  failed {result['path']}: {result['error']}")
+                        else:
+                            done += 1
+                            bubbles += result["bubbles"]
+                            tokens += result["tokens"]
+                checkpoint.save()
+
+                elapsed = time.perf_counter() - started
+                eta = elapsed / (done + failed) * (len(todo) - done - failed)
+                print(f"{done + failed}/{len(todo)} pages ({bubbles} bubbles, {failed} failed), "
+                      f"{(done + failed) / elapsed:.2f} pages/s, ETA {eta / 60:.0f} min")
+        except KeyboardInterrupt:
+            print("Interrupted, waiting for the running batches to be cancelled...")
+            pool.shutdown(wait=True, cancel_futures=True)
+            checkpoint.save()
+            raise
+
+    print(f"Done: {done} pages, {bubbles} bubbles ({tokens} tokens), {failed} failed in {(time.perf_counter() - started) / 60:.1f} min")
+    return failed
+
+
+def main():
+    from utils.detection import DETECTION_MODEL, PROFILES
+
+    parser = argparse.ArgumentParser(description="Detect, OCR and optionally translate whole manga libraries into the server caches")
+    parser.add_argument("folders", nargs="+", help="manga folders; every folder below them with pages is processed")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="worker processes")
+    parser.add_argument("--batch", type=int, default=8, help="pages per detection batch")
+    parser.add_argument("--profile", choices=list(PROFILES), help="detection profile (default DETECTION_PROFILE)")
+    parser.add_argument("--translate", action="store_true", help="also translate every bubble")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="progress file to resume from")
+    parser.add_argument("--skip-failed", action="store_true", help="don't retry pages that failed in an earlier run")
+    args = parser.parse_args()
+
+    missing = [folder for folder in args.folders if not os.path.isdir(folder)]
+    if missing:
+        raise SystemExit(f"Not a folder: {missing[0]}")
+    if not os.path.isfile(DETECTION_MODEL):
+        raise SystemExit(f"Detector weights not found at {DETECTION_MODEL} (set DETECTION_MODEL)")
+
+    try:
+        failed = run(args.folders, args.workers, args.batch, args.profile, args.translate,
+                     args.checkpoint, retry_failed=not args.skip_failed)
+    except KeyboardInterrupt:
+        raise SystemExit("Stopped; run the same command again to continue")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.cache import CACHE_FOLDER
+from utils.detection import DETECTOR, detect_boxes
+from utils.llm import Priority
+from utils.ocr import ocr_bubbles
+from utils.page_store import load_page
+from utils.pages import page_key, upcoming_pages
+from utils.tracing import TRACE_ID
+
+PREFETCH_PAGES = int(os.environ.get("PREFETCH_PAGES", "2"))
+PREFETCH_OCR = os.environ.get("PREFETCH_OCR", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Runs detection (and optionally OCR) for the pages after the one being read,
+    so the results are already cached when the reader turns the page.
+
+    Every call to schedule() starts a new generation; work queued for an older
+    generation is dropped as soon as a worker reaches it, so jumping around in a
+    volume never leaves a backlog of pages nobody is looking at.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def schedule(self, image_path: str, count: int = PREFETCH_PAGES, ocr: bool = PREFETCH_OCR) -> list[str]:
+        pages = upcoming_pages(image_path, count)
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        # Prefetch logs carry the trace ID of the navigation that triggered them
+        trace_id = TRACE_ID.get()
+        for path in pages:
+            self._executor.submit(self._prefetch_page, path, generation, ocr, trace_id)
+        return pages
+
+    def _is_stale(self, generation: int) -> bool:
+        return generation != self._generation
+
+    def _prefetch_page(self, image_path: str, generation: int, ocr: bool, trace_id: str):
+        if self._is_stale(generation):
+            return
+        TRACE_ID.set(trace_id)
+        try:
+            boxes = detect_boxes(image_path)
+            if not ocr:
+                return
+
+            page = load_page(image_path)
+            page_id = page_key(image_path)
+            crop_template = os.path.join(CACHE_FOLDER, f"prefetch_crop_{threading.get_ident()}_{{}}.png")
+            if self._is_stale(generation):
+                return
+            ocr_bubbles(page, page_id, boxes, crop_template, priority=Priority.BACKGROUND)
+        except RuntimeError as e:
+            if str(e) != DETECTOR.error:
+                logger.exception("Failed to prefetch %s", image_path)
+            else:
+                # Missing weights: already reported at startup, not on every page turn
+                logger.debug("Not prefetching %s: %s", image_path, e)
+        except Exception:
+            logger.exception("Failed to prefetch %s", image_path)
+
+
+PREFETCHER = Prefetcher()
@@ -0,0 +1,81 @@
+import gzip
+import os
+import orjson
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; without it responses are gzip-compressed
+    brotli = None
+
+# JSON responses smaller than this are sent as they are
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serialized with orjson instead of the stdlib encoder."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def _accepted_encoding(accept_encoding: str) -> str | None:
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing JSON responses with brotli or gzip,
+    whichever the client accepts. Only complete (single message) JSON bodies
+    are touched, so event streams, images and file downloads pass through
+    unbuffered.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Hold the headers back until we know whether the body gets compressed
+                start_message = message
+                return
+            if message["type"] == "http.response.body" and start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                body = message.get("body", b"")
+                if (not message.get("more_body", False)
+                        and len(body) >= self.minimum_size
+                        and headers.get("content-type", "").startswith("application/json")
+                        and "content-encoding" not in headers):
+                    if encoding == "br":
+                        body = brotli.compress(body, quality=4)
+                    else:
+                        body = gzip.compress(body, compresslevel=6)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    headers.add_vary_header("Accept-Encoding")
+                    message = {**message, "body": body}
+                await send(start_message)
+                start_message = None
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,57 @@
+import asyncio
+import functools
+import logging
+from typing import Awaitable, Callable
+from utils.metrics import SINGLE_FLIGHT_SHARED
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    At most one computation per key at a time. Callers arriving with a key
+    whose computation is still running wait for it and get the same result
+    (or exception) instead of starting their own. The computation runs as its
+    own task, so it isn't lost when the caller that started it disconnects.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._running: dict[str, asyncio.Future] = {}
+
+    async def run(self, key: str, compute: Callable[[], Awaitable]):
+        future = self._running.get(key)
+        if future is None:
+            future = asyncio.ensure_future(compute())
+            self._running[key] = future
+            future.add_done_callback(functools.partial(self._finished, key))
+        else:
+            SINGLE_FLIGHT_SHARED.labels(self.name).inc()
+            logger.debug("Joining in-flight %s request %s", self.name, key)
+        return await asyncio.shield(future)
+
+    def _finished(self, key: str, future: asyncio.Future):
+        if self._running.get(key) is future:
+            del self._running[key]
+        # Every waiter may have disconnected; don't warn about an unretrieved exception
+        if not future.cancelled():
+            future.exception()
+
+def single_flight(flight: SingleFlight, request_key: Callable[..., str]):
+    """
+    Deduplicate concurrent identical calls of an async endpoint. `request_key`
+    gets the endpoint's arguments and returns the normalized request identity;
+    if it can't (e.g. the page doesn't exist) the call runs on its own and
+    reports the error itself. It runs in a thread, since identifying a page
+    the first time hashes the whole file.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                key = await asyncio.to_thread(request_key, *args, **kwargs)
+            except (OSError, ValueError):
+                return await func(*args, **kwargs)
+            return await flight.run(key, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator
+
+# Streamed text is flushed at most every SSE_COALESCE_MS milliseconds, or as
+# soon as SSE_COALESCE_BYTES of text are waiting. 0 disables coalescing.
+SSE_COALESCE_MS = float(os.environ.get("SSE_COALESCE_MS", "50"))
+SSE_COALESCE_BYTES = int(os.environ.get("SSE_COALESCE_BYTES", "2048"))
+# Comment sent when nothing else was sent for this long, so proxies and
+# browsers don't time out while the model is loading or thinking slowly
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # nginx: don't buffer the stream
+}
+HEARTBEAT = ": heartbeat\n\n"
+
+_END = object()
+
+
+def format_event(data: dict, event_id: int | str | None = None) -> str:
+    """SSE frame for an event dict. done/error/job events get a matching event name."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if data.get("type") in ("done", "error", "job"):
+        lines.append(f"event: {data['type']}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class _Batch:
+    """Text events waiting to be sent; consecutive events of one type are merged."""
+
+    def __init__(self):
+        self.events: list[dict] = []
+        self.size = 0
+        self.deadline: float | None = None
+
+    def add(self, event: dict, window: float):
+        if self.events and self.events[-1]["type"] == event["type"]:
+            self.events[-1]["text"] += event["text"]
+        else:
+            self.events.append(dict(event))
+        self.size += len(event["text"].encode())
+        if self.deadline is None:
+            self.deadline = time.monotonic() + window
+
+    def take(self) -> list[dict]:
+        events = self.events
+        self.events, self.size, self.deadline = [], 0, None
+        return events
+
+
+async def batch_events(events: AsyncIterator[dict],
+                       window_ms: float = SSE_COALESCE_MS,
+                       max_bytes: int = SSE_COALESCE_BYTES) -> AsyncIterator[list[dict]]:
+    """
+    Coalesce a stream of {"type": "thinking"|"content", "text": ...} events into
+    batches, flushed by time window or size, so each batch becomes one write.
+
+    The source may end with a {"type": "done", ...} event carrying its own
+    statistics; it is emitted last, extended with the stream's timing and batch
+    count. Errors from the source become a final {"type": "error"} event
+    instead of cutting the stream off.
+    """
+    window = window_ms / 1000
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for event in events:
+                await queue.put(event)
+            await queue.put(_END)
+        except Exception as e:
+            await queue.put(e)
+
+    producer = asyncio.create_task(pump())
+    getter = None
+    batch = _Batch()
+    started = time.monotonic()
+    first_batch = None
+    batches = 0
+    done = {"type": "done"}
+
+    def flush() -> list[dict]:
+        nonlocal batches, first_batch
+        batches += 1
+        if first_batch is None:
+            first_batch = time.monotonic()
+        return batch.take()
+
+    try:
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            timeout = batch.deadline - time.monotonic() if batch.events else None
+            finished, _ = await asyncio.wait({getter}, timeout=None if timeout is None else max(0.0, timeout))
+
+            if not finished:
+                yield flush()
+                continue
+
+            item, getter = getter.result(), None
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                final = flush() if batch.events else []
+                yield final + [{"type": "error", "message": str(item)}]
+                return
+            if item.get("type") == "done":
+                done.update(item)
+                continue
+
+            batch.add(item, window)
+            if window <= 0 or batch.size >= max_bytes:
+                yield flush()
+
+        final = flush() if batch.events else []
+        done["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+        done["first_batch_ms"] = round((first_batch - started) * 1000) if first_batch else None
+        done["batches"] = batches
+        yield final + [done]
+    finally:
+        producer.cancel()
+        if getter is not None:
+            getter.cancel()
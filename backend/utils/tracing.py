@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import re
+import sys
+import time
+import uuid
+from pathlib import Path
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Echo every streamed thinking/content token at DEBUG level. Off by default: it
+# costs a log call per token and is only useful when debugging prompts.
+LOG_TOKENS = os.environ.get("LOG_TOKENS", "0") == "1"
+# Per-request profiling writes a file for every profiled request, so it is opt-in
+PROFILING_ENABLED = os.environ.get("PROFILING", "0") == "1"
+PROFILE_FOLDER = "profiles"
+# Trace IDs are used as file names; anything else a client sends is replaced
+TRACE_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+TRACE_ID = contextvars.ContextVar("trace_id", default="-")
+# Stage timings of the current request, filled in by metrics.stage()
+SPANS: contextvars.ContextVar[list | None] = contextvars.ContextVar("spans", default=None)
+PROFILE: contextvars.ContextVar[cProfile.Profile | None] = contextvars.ContextVar("profile", default=None)
+
+logger = logging.getLogger(__name__)
+
+
+class _TraceIdFilter(logging.Filter):
+    def filter(self, record):
+        record.trace_id = TRACE_ID.get()
+        return True
+
+
+def configure_logging():
+    """
+    Send application logs to stdout (start.py shows stderr as errors) with the
+    trace ID of the request they belong to.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.addFilter(_TraceIdFilter())
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-5s [%(trace_id)s] %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+
+
+def record_span(name: str, seconds: float):
+    spans = SPANS.get()
+    if spans is not None:
+        spans.append((name, seconds))
+    logger.debug("span %s took %.1fms", name, seconds * 1000)
+
+
+def _format_spans(spans: list) -> str:
+    totals: dict[str, float] = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in totals.items())
+
+
+def profile_path(trace_id: str) -> Path:
+    return Path(PROFILE_FOLDER) / f"{trace_id}.prof"
+
+
+def profile_summary(trace_id: str, limit: int = 40) -> str:
+    """Human readable top functions of a saved profile, sorted by cumulative time."""
+    from io import StringIO
+    out = StringIO()
+    stats = pstats.Stats(str(profile_path(trace_id)), stream=out)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+def profiled(func):
+    """
+    Run a synchronous function under cProfile when the request asked for it
+    (`X-Profile: 1` header or `?profile=1`). Use it on sync endpoints and on
+    the functions async endpoints run in worker threads. Coroutines are not
+    supported: a profiler enabled on the event loop records every other
+    request's tasks and the loop's own polling as well.
+    """
+    if asyncio.iscoroutinefunction(func):
+        raise TypeError(f"@profiled only profiles synchronous work, not {func.__qualname__}")
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = PROFILE.get()
+        if profile is None:
+            return func(*args, **kwargs)
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process
+            logger.debug("Another request is being profiled, not profiling %s", func.__qualname__)
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+    return wrapper
+
+
+class TracingMiddleware:
+    """
+    Assigns every request a trace ID (taken from `X-Request-ID` if the client
+    sent a valid one), collects its stage timings into one summary log line and, on
+    request, profiles it and saves the result under profiles/<trace id>.prof.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        trace_id = headers.get(b"x-request-id", b"").decode("latin-1")
+        if not TRACE_ID_PATTERN.fullmatch(trace_id):
+            trace_id = uuid.uuid4().hex[:12]
+        TRACE_ID.set(trace_id)
+        spans = []
+        SPANS.set(spans)
+
+        query = scope.get("query_string", b"").decode()
+        wants_profile = headers.get(b"x-profile") == b"1" or "profile=1" in query.split("&")
+        profile = cProfile.Profile() if wants_profile and PROFILING_ENABLED else None
+        PROFILE.set(profile)
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                extra = [(b"x-request-id", trace_id.encode())]
+                if profile is not None:
+                    extra.append((b"x-profile-id", trace_id.encode()))
+                message["headers"] = list(message.get("headers", [])) + extra
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            logger.info("%s %s %s in %.0fms %s", scope["method"], scope["path"], status,
+                        elapsed * 1000, _format_spans(spans))
+            if profile is not None:
+                Path(PROFILE_FOLDER).mkdir(exist_ok=True)
+                profile.dump_stats(profile_path(trace_id))
+                logger.info("Saved profile to %s", profile_path(trace_id))
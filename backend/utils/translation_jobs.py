@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from typing import AsyncIterator
+from utils.cache import TRANSLATION_CACHE
+from utils.pages import box_key
+from utils.sse import HEARTBEAT, SSE_HEARTBEAT_SECONDS, batch_events, format_event
+
+# How long a finished translation stays available for clients to reattach
+TRANSLATION_JOB_TTL = float(os.environ.get("TRANSLATION_JOB_TTL", "900"))
+
+logger = logging.getLogger(__name__)
+
+
+class TranslationJob:
+    """
+    A translation generated on the server independently of any client
+    connection. Every event is buffered with a sequential ID so a client that
+    drops (page reload, network hiccup) can reattach with `Last-Event-ID` and
+    continue where it left off, or replay the whole result once it finished.
+    Event 0 is always {"type": "job", "job_id": ...}.
+    """
+
+    def __init__(self, events: AsyncIterator[dict], key: str | None = None):
+        self.id = uuid.uuid4().hex
+        self.key = key  # translation_key() of the bubble, for attaching identical requests
+        self.created = time.time()
+        self.finished_at: float | None = None
+        self.events: list[dict] = [{"type": "job", "job_id": self.id}]
+        self._changed = asyncio.Condition()
+        self._task = asyncio.create_task(self._run(events))
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    async def _run(self, events: AsyncIterator[dict]):
+        try:
+            async for batch in batch_events(events):
+                async with self._changed:
+                    self.events.extend(batch)
+                    self._changed.notify_all()
+        except Exception as e:
+            logger.exception("Translation job %s failed", self.id)
+            self.events.append({"type": "error", "message": str(e)})
+        finally:
+            if LIVE.get(self.key) is self:
+                del LIVE[self.key]
+            async with self._changed:
+                self.finished_at = time.time()
+                self._changed.notify_all()
+
+    async def stream(self, last_event_id: int = -1) -> AsyncIterator[str]:
+        """SSE frames for all events after `last_event_id`, following the job live until it ends."""
+        next_id = last_event_id + 1
+        while True:
+            async with self._changed:
+                if next_id >= len(self.events) and not self.finished:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), SSE_HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                pending = self.events[next_id:]
+                finished = self.finished
+
+            if pending:
+                yield "".join(format_event(event, event_id) for event_id, event in enumerate(pending, next_id))
+                next_id += len(pending)
+            elif not finished:
+                yield HEARTBEAT
+            if finished and next_id >= len(self.events):
+                return
+
+    def status(self) -> dict:
+        return {
+            "job_id": self.id,
+            "finished": self.finished,
+            "events": len(self.events),
+            "created": self.created,
+            "finished_at": self.finished_at,
+        }
+
+
+JOBS: dict[str, TranslationJob] = {}
+# Running single-bubble translations by translation_key()
+LIVE: dict[str, TranslationJob] = {}
+
+
+def _expire_jobs():
+    now = time.time()
+    for job_id, job in list(JOBS.items()):
+        if job.finished and now - job.finished_at > TRANSLATION_JOB_TTL:
+            del JOBS[job_id]
+
+
+def start_job(events: AsyncIterator[dict], key: str | None = None) -> TranslationJob:
+    _expire_jobs()
+    job = TranslationJob(events, key)
+    JOBS[job.id] = job
+    if key is not None:
+        LIVE[key] = job
+    return job
+
+
+def live_job(key: str) -> TranslationJob | None:
+    """The job currently translating the bubble with this translation_key(), if any."""
+    return LIVE.get(key)
+
+
+def get_job(job_id: str) -> TranslationJob | None:
+    _expire_jobs()
+    return JOBS.get(job_id)
+
+
+def translation_key(page_id: str, box: dict, ocr_text: str) -> str:
+    """Cache key of a single-bubble translation; a corrected OCR text gets a new translation."""
+    text_hash = hashlib.md5(ocr_text.encode()).hexdigest()[:12]
+    return f"{box_key(page_id, box)}_{text_hash}"
+
+
+async def cache_translation(events: AsyncIterator[dict], key: str) -> AsyncIterator[dict]:
+    """Pass translation events through and store the finished result in TRANSLATION_CACHE."""
+    thinking = ''
+    content = ''
+    async for event in events:
+        if event["type"] == "thinking":
+            thinking += event["text"]
+        elif event["type"] == "content":
+            content += event["text"]
+        elif event["type"] == "done" and content:
+            TRANSLATION_CACHE.set(key, {"thinking": thinking, "content": content, "tokens": event.get("tokens")})
+        yield event
+
+
+async def replay_translation(entry: dict) -> AsyncIterator[dict]:
+    """Events of a cached translation, in the same shape as a live one."""
+    if entry.get("thinking"):
+        yield {"type": "thinking", "text": entry["thinking"]}
+    yield {"type": "content", "text": entry["content"]}
+    yield {"type": "done", "cached": True, "tokens": entry.get("tokens"),
+           "thinking_chars": len(entry.get("thinking", "")), "content_chars": len(entry["content"])}
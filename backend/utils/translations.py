@@ -0,0 +1,80 @@
+import copy
+import json
+import os
+import threading
+
+# Parsed translation.json files, keyed by path and validated by mtime + size
+_parsed: dict[str, tuple[str, dict]] = {}
+_lock = threading.Lock()
+
+
+class TranslationsChanged(Exception):
+    """translation.json no longer has the ETag the writer expected."""
+
+
+def translations_etag(path: str) -> str:
+    """
+    Validator of a folder's translation.json, taken from its mtime and size so
+    unchanged files can be answered with 304 without reading them.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return '"empty"'
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def load_translations(path: str) -> dict:
+    """
+    Read a folder's translation.json:
+    {image_name: {box_index: {marker, original, translation}}}
+    The file is only parsed again after it changed. The returned dict is
+    shared, use update_translations() to modify it.
+    """
+    etag = translations_etag(path)
+    cached = _parsed.get(path)
+    if cached is not None and cached[0] == etag:
+        return cached[1]
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        translations = json.load(f)
+    _parsed[path] = (etag, translations)
+    return translations
+
+
+def save_translations(path: str, translations: dict):
+    # Write to a temporary file first so a crash never leaves half a file behind
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(translations, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    _parsed[path] = (translations_etag(path), translations)
+
+
+def set_translation(translations: dict, image_name: str, box_index: int,
+                    marker: str, original: str, translation: str):
+    translations.setdefault(image_name, {})[str(box_index)] = {
+        "marker": marker,
+        "original": original,
+        "translation": translation
+    }
+
+
+def update_translations(path: str, entries: list[dict], if_match: str | None = None) -> str:
+    """
+    Save many bubbles with one read and one write. Each entry has the arguments
+    of set_translation(). With `if_match`, raises TranslationsChanged unless
+    the file still has that ETag; the check and the write happen under one
+    lock, so two writers holding the same ETag can't both succeed.
+    Returns the new ETag.
+    """
+    with _lock:
+        if if_match is not None and if_match != translations_etag(path):
+            raise TranslationsChanged(f"{path} changed since it was loaded")
+        translations = copy.deepcopy(load_translations(path))
+        for entry in entries:
+            set_translation(translations, entry["image_name"], entry["box_index"],
+                            entry["marker"], entry["original"], entry["translation"])
+        save_translations(path, translations)
+        return translations_etag(path)
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from utils.cache import CACHE_FOLDER, TRANSLATION_CACHE
+from utils.detection import detect_boxes
+from utils.llm import Priority, chop, stream_translation
+from utils.ocr import ocr_bubbles
+from utils.page_store import load_page
+from utils.pages import list_images, page_key, remove_files, save_crop
+from utils.tracing import TRACE_ID
+from utils.translation_jobs import cache_translation, live_job, translation_key
+
+JOBS_FOLDER = "jobs"
+# Pages of one volume job processed at the same time. The LLM scheduler still
+# keeps a slot free for the reader, this only bounds how much is queued there.
+VOLUME_JOB_CONCURRENCY = int(os.environ.get("VOLUME_JOB_CONCURRENCY", "2"))
+
+logger = logging.getLogger(__name__)
+
+
+class VolumeJob:
+    """
+    Pre-processing of a whole volume folder: detection, OCR, tokenizing and
+    (optionally) translation of every bubble, at background priority. Progress is written to
+    jobs/<id>.json after every page so a restarted backend resumes where it
+    stopped; finished work lives in the shared caches and is never redone.
+    """
+
+    def __init__(self, folder: str, pages: list[str], translate: bool = True, job_id: str | None = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.folder = folder
+        self.pages = pages
+        self.translate = translate
+        self.status = "queued"  # queued, running, finished, cancelled
+        self.done: dict[str, dict] = {}  # page -> {"bubbles", "tokens", "seconds"}
+        self.failed: dict[str, str] = {}  # page -> error of the last attempt
+        self.created = time.time()
+        self.started: float | None = None
+        self.finished: float | None = None
+        # Throughput of the current run, for the ETA
+        self._run_started: float | None = None
+        self._run_pages = 0
+        # Saves run in threads; an older snapshot must never replace a newer one
+        self._save_lock = threading.Lock()
+        self._snapshots = 0
+        self._written = 0
+
+    @property
+    def path(self) -> Path:
+        return Path(JOBS_FOLDER) / f"{self.id}.json"
+
+    def save(self):
+        self._write(*self._snapshot())
+
+    async def save_async(self):
+        """save() with the file write off the event loop."""
+        await asyncio.to_thread(self._write, *self._snapshot())
+
+    def _snapshot(self) -> tuple[int, str]:
+        # Serialized on the event loop, where the job is modified
+        self._snapshots += 1
+        data = {
+            "id": self.id,
+            "folder": self.folder,
+            "pages": self.pages,
+            "translate": self.translate,
+            "status": self.status,
+            "done": self.done,
+            "failed": self.failed,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        return self._snapshots, json.dumps(data, ensure_ascii=False, indent=2)
+
+    def _write(self, snapshot: int, text: str):
+        with self._save_lock:
+            if snapshot < self._written:
+                return
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, self.path)
+            self._written = snapshot
+
+    @classmethod
+    def load(cls, path: Path) -> "VolumeJob":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        job = cls(data["folder"], data["pages"], data["translate"], job_id=data["id"])
+        job.status = data["status"]
+        job.done = data["done"]
+        job.failed = data["failed"]
+        job.created = data["created"]
+        job.started = data["started"]
+        job.finished = data["finished"]
+        return job
+
+    def remaining(self) -> list[str]:
+        return [page for page in self.pages if page not in self.done]
+
+    def status_dict(self) -> dict:
+        remaining = len(self.pages) - len(self.done)
+        eta = None
+        if self.status == "running" and self._run_pages:
+            per_page = (time.time() - self._run_started) / self._run_pages
+            eta = round(per_page * remaining)
+        return {
+            "job_id": self.id,
+            "folder": self.folder,
+            "status": self.status,
+            "translate": self.translate,
+            "pages_total": len(self.pages),
+            "pages_done": len(self.done),
+            "pages_failed": len(self.failed),
+            "bubbles_done": sum(page["bubbles"] for page in self.done.values()),
+            "tokens_done": sum(page.get("tokens", 0) for page in self.done.values()),
+            "progress": round(len(self.done) / len(self.pages), 3) if self.pages else 1.0,
+            "eta_seconds": eta,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "failed": self.failed,
+        }
+
+
+class VolumeJobQueue:
+    """
+    Runs volume jobs one after another on the event loop, each with
+    VOLUME_JOB_CONCURRENCY pages in flight. Blocking steps (detection, OCR)
+    run in the threadpool, translations stream on the async client.
+    """
+
+    def __init__(self, concurrency: int = VOLUME_JOB_CONCURRENCY):
+        self.concurrency = concurrency
+        self.jobs: dict[str, VolumeJob] = {}
+        self._queue: asyncio.Queue | None = None
+        self._runner: asyncio.Task | None = None
+
+    def start(self):
+        """Load persisted jobs and requeue the unfinished ones. Call from the running event loop."""
+        Path(JOBS_FOLDER).mkdir(exist_ok=True)
+        self._queue = asyncio.Queue()
+
+        jobs = []
+        for path in Path(JOBS_FOLDER).glob("*.json"):
+            try:
+                jobs.append(VolumeJob.load(path))
+            except (OSError, ValueError, KeyError):
+                logger.exception("Skipping unreadable job file %s", path)
+        for job in sorted(jobs, key=lambda j: j.created):
+            self.jobs[job.id] = job
+            if job.status in ("queued", "running"):
+                logger.info("Resuming volume job %s (%d/%d pages done)", job.id, len(job.done), len(job.pages))
+                job.status = "queued"
+                self._queue.put_nowait(job.id)
+
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+
+    def submit(self, folder: str, translate: bool = True) -> VolumeJob:
+        # Enqueuing the same volume twice attaches to the job already pending
+        for job in self.jobs.values():
+            if job.folder == folder and job.status in ("queued", "running") and job.translate >= translate:
+                return job
+
+        job = VolumeJob(folder, list_images(folder), translate)
+        self.jobs[job.id] = job
+        job.save()
+        self._queue.put_nowait(job.id)
+        logger.info("Queued volume job %s for %s (%d pages)", job.id, folder, len(job.pages))
+        return job
+
+    def cancel(self, job_id: str) -> VolumeJob | None:
+        job = self.jobs.get(job_id)
+        if job is not None and job.status in ("queued", "running"):
+            # Workers stop after the page they are on
+            job.status = "cancelled"
+            job.save()
+        return job
+
+    async def _run(self):
+        while True:
+            job = self.jobs.get(await self._queue.get())
+            if job is None or job.status != "queued":
+                continue
+            try:
+                await self._run_job(job)
+            except Exception:
+                logger.exception("Volume job %s crashed", job.id)
+
+    async def _run_job(self, job: VolumeJob):
+        TRACE_ID.set(f"job-{job.id[:8]}")
+        job.status = "running"
+        job.started = job.started or time.time()
+        job._run_started = time.time()
+        job._run_pages = 0
+        await job.save_async()
+        logger.info("Volume job %s started: %d pages left", job.id, len(job.remaining()))
+
+        pages = iter(job.remaining())
+
+        async def worker():
+            for page in pages:
+                if job.status != "running":
+                    return
+                await self._process_page(job, page)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+        if job.status == "running":
+            job.status = "finished"
+            job.finished = time.time()
+            logger.info("Volume job %s finished: %d pages, %d failed", job.id, len(job.done), len(job.failed))
+        await job.save_async()
+
+    async def _process_page(self, job: VolumeJob, page_name: str):
+        image_path = os.path.join(job.folder, page_name)
+        crop_template = os.path.join(CACHE_FOLDER, f"job_crop_{job.id}_{job.pages.index(page_name)}_{{}}.png")
+        crop_path = crop_template.format("translate")
+        started = time.perf_counter()
+        try:
+            page, boxes, tokens, translate = await asyncio.to_thread(
+                self._prepare_page, image_path, crop_template, job.translate)
+
+            for box, ocr_text, key in translate:
+                if job.status != "running":
+                    return
+                # The reader is translating it right now
+                if live_job(key) is not None:
+                    continue
+                await asyncio.to_thread(save_crop, page, box, crop_path)
+                events = stream_translation(image_path, crop_path, ocr_text, priority=Priority.BACKGROUND)
+                async for _ in cache_translation(events, key):
+                    pass
+        except Exception as e:
+            logger.exception("Volume job %s failed on %s", job.id, page_name)
+            job.failed[page_name] = str(e)
+        else:
+            job.done[page_name] = {"bubbles": len(boxes), "tokens": tokens,
+                                   "seconds": round(time.perf_counter() - started, 2)}
+            job.failed.pop(page_name, None)
+            job._run_pages += 1
+        finally:
+            # OCR removes its own crops
+            remove_files([crop_path])
+        await job.save_async()
+
+    def _prepare_page(self, image_path: str, crop_template: str, translate: bool) -> tuple:
+        """
+        Detect, OCR and tokenize a page in a worker thread, along with the page
+        hash and cache reads. Returns the page, its boxes, the number of tokens
+        and the (box, ocr_text, key) of every bubble that still needs translating.
+        """
+        boxes = detect_boxes(image_path)
+        page = load_page(image_path)
+        page_id = page_key(image_path)
+        ocr_texts = ocr_bubbles(page, page_id, boxes, crop_template, Priority.BACKGROUND)
+        # Same normalisation as /analyze, so /translate finds the cached result
+        ocr_texts = [text.replace("\n", "") for text in ocr_texts]
+        # Tokenizing isn't cached (it's cheaper than a cache read); running it
+        # checks every bubble tokenizes and counts the tokens for the job status
+        tokens = sum(len(chop(text)[0]) for text in ocr_texts if text)
+
+        todo = []
+        for box, ocr_text in zip(boxes, ocr_texts) if translate else []:
+            if not ocr_text:
+                continue
+            key = translation_key(page_id, box, ocr_text)
+            if TRANSLATION_CACHE.get(key) is None:
+                todo.append((box, ocr_text, key))
+        return page, boxes, tokens, todo
+
+
+VOLUME_JOBS = VolumeJobQueue()
@@ -15,10 +15,26 @@ const api = axios.create({
   }
 });
 
+// A saturated backend answers 503/429 with Retry-After: wait and retry a couple of times
+const MAX_BUSY_RETRIES = 2;
+api.interceptors.response.use(undefined, async (error) => {
+  const config = error.config;
+  const status = error.response?.status;
+  if (!config || (status !== 503 && status !== 429)) throw error;
+
+  config.busyRetries = (config.busyRetries || 0) + 1;
+  if (config.busyRetries > MAX_BUSY_RETRIES) throw error;
+
+  const retryAfter = Number(error.response.headers['retry-after']) || 1;
+  console.warn(`[API] Backend busy (${status}), retrying in ${retryAfter}s:`, config.url);
+  await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+  return api(config);
+});
+
 // Error handler
 function handleError(error, context = '') {
   console.error(`API Error ${context}:`, error);
-  const message = error.response?.data?.message || error.message || 'An unexpected error occurred';
+  const message = error.response?.data?.message || error.response?.data?.detail || error.message || 'An unexpected error occurred';
   throw new Error(message);
 }
 
@@ -27,11 +43,12 @@ function handleError(error, context = '') {
 /**
  * Detect speech bubbles in an image
  * @param {string} imagePath - Path to the image file
+ * @param {'fast'|'balanced'|'accurate'|null} profile - Detection profile (null = backend default)
  * @returns {Promise<{boxes: Array<{x: number, y: number, w: number, h: number}>}>}
  */
-export async function detectBubbles(imagePath) {
+export async function detectBubbles(imagePath, profile = null) {
   try {
-    const response = await api.post('/detect', { image: imagePath });
+    const response = await api.post('/detect', { image: imagePath, profile });
     return response.data;
   } catch (error) {
     handleError(error, 'detectBubbles');
@@ -61,20 +78,53 @@ export async function analyzeBubble(imagePath, box) {
  */
 export async function analyzeMultipleBubbles(imagePath, boxes) {
   try {
-    const response = await api.post('/analyze-multiple', { image: imagePath, boxes });
-    return response.data;
+    const response = await api.post('/analyze-multiple', { image: imagePath, boxes, compact: true });
+    return expandCompactAnalysis(response.data);
   } catch (error) {
     handleError(error, 'analyzeMultipleBubbles');
   }
 }
 
+/**
+ * Expand the compact /analyze-multiple response (flat token arrays plus
+ * bubble offsets) into the per-token objects and breakdown the UI works with.
+ * @param {{ocr_texts: string[], ocr_tokens: string[], hiragana_tokens: string[], romaji_tokens: string[], bubble_offsets: number[]}} data
+ */
+function expandCompactAnalysis(data) {
+  if (data.format !== 'compact') return data;
+
+  const result = { ocr_tokens: [], hiragana_tokens: [], romaji_tokens: [], bubbleBreakdown: [] };
+  const bubbleCount = data.ocr_texts.length;
+
+  for (let bubbleIndex = 0; bubbleIndex < bubbleCount; bubbleIndex++) {
+    const start = data.bubble_offsets[bubbleIndex];
+    const end = data.bubble_offsets[bubbleIndex + 1];
+    const breakdown = { bubbleIndex, ocr_text: data.ocr_texts[bubbleIndex] };
+
+    for (const key of ['ocr_tokens', 'hiragana_tokens', 'romaji_tokens']) {
+      const tokens = data[key].slice(start, end);
+      breakdown[key] = tokens;
+      for (const text of tokens) {
+        result[key].push({ text, bubbleIndex });
+      }
+      // Separator between bubbles (except after the last)
+      if (bubbleIndex < bubbleCount - 1) {
+        result[key].push({ type: 'separator', bubbleIndex });
+      }
+    }
+    result.bubbleBreakdown.push(breakdown);
+  }
+  return result;
+}
+
 /**
  * Get info for a given word in context of the image
  * @param {string} imagePath - Path to the image file
  * @param {string} word - Word
- * @returns {Promise<{info: string}>}
+ * @param {boolean} llm - Ask the LLM even if the local dictionary knows the word
+ * @returns {Promise<{info: string, source: 'dictionary'|'llm'}>}
  */
-export async function wordInfo(imagePath, word) {
+export async function wordInfo(imagePath, word, llm = false) {
   try {
     // Check cache first
     const $wordCache = get(wordCache);
@@ -86,7 +136,7 @@ export async function wordInfo(imagePath, word) {
     }
 
     console.log('[API] Word info cache miss, fetching:', word);
-    const response = await api.post('/word', { image: imagePath, word: word });
+    const response = await api.post('/word', { image: imagePath, word: word, llm: llm });
 
     // Cache the result
     setWordCacheEntry($wordCache, word, response.data);
@@ -98,6 +148,151 @@ export async function wordInfo(imagePath, word) {
   }
 }
 
+/**
+ * Read a text/event-stream response until it ends.
+ * Events ({type: 'job'|'thinking'|'content', ...}) are passed to onEvent with
+ * their id, heartbeat comments are skipped, the final `done` event is logged
+ * and an `error` event is thrown.
+ * @param {Response} response - fetch response with an SSE body
+ * @param {function(Object, number|null): void} onEvent - Callback for each parsed event and its id
+ * @returns {Promise<void>}
+ */
+async function readEventStream(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = ''; // Buffer for incomplete events
+
+  while (true) {
+    const { done, value } = await reader.read();
+
+    if (done) {
+      break;
+    }
+
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line; keep the last incomplete one in the buffer
+    const events = buffer.split('\n\n');
+    buffer = events.pop() || '';
+
+    for (const rawEvent of events) {
+      let eventName = 'message';
+      let eventId = null;
+      const dataLines = [];
+
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith(':')) continue; // heartbeat comment
+        if (line.startsWith('id:')) {
+          eventId = parseInt(line.substring(3).trim(), 10);
+        } else if (line.startsWith('event:')) {
+          eventName = line.substring(6).trim();
+        } else if (line.startsWith('data:')) {
+          dataLines.push(line.substring(5).trimStart());
+        }
+      }
+
+      if (dataLines.length === 0) continue;
+
+      let data;
+      try {
+        data = JSON.parse(dataLines.join('\n'));
+      } catch (parseError) {
+        console.warn('Failed to parse event:', rawEvent, parseError);
+        continue;
+      }
+
+      if (eventName === 'error') {
+        throw new Error(data.message || 'Translation stream failed');
+      }
+      if (eventName === 'done') {
+        console.log('[API] Stream finished:', data);
+        continue;
+      }
+      onEvent(data, eventId);
+    }
+  }
+}
+
+// Translation job that is still running, kept across page reloads
+const PENDING_JOB_KEY = 'pendingTranslationJob';
+const MAX_REATTACH_ATTEMPTS = 3;
+
+/**
+ * Follow a translation job's event stream until it finishes.
+ * If the connection drops mid-stream, reattach to the job with Last-Event-ID
+ * so no text is lost and nothing is generated twice.
+ * @param {Response} response - Initial SSE response (starts with a `job` event)
+ * @param {function(Object): void} onChunk - Callback for each {type, text} chunk
+ * @returns {Promise<void>}
+ */
+async function followTranslationJob(response, onChunk) {
+  let jobId = null;
+  let lastEventId = -1;
+  let attempts = 0;
+
+  const onEvent = (data, eventId) => {
+    if (eventId !== null) lastEventId = eventId;
+    if (data.type === 'job') {
+      jobId = data.job_id;
+      sessionStorage.setItem(PENDING_JOB_KEY, JSON.stringify({ jobId }));
+      return;
+    }
+    onChunk(data);
+  };
+
+  while (true) {
+    try {
+      await readEventStream(response, onEvent);
+      break;
+    } catch (error) {
+      // fetch reports dropped connections as TypeError
+      if (!jobId || !(error instanceof TypeError) || attempts >= MAX_REATTACH_ATTEMPTS) {
+        throw error;
+      }
+      attempts++;
+      console.warn(`[API] Translation stream dropped, reattaching to job ${jobId} (attempt ${attempts})`);
+      response = await fetch(`${API_BASE_URL}/translate/jobs/${jobId}/events`, {
+        headers: { 'Last-Event-ID': String(lastEventId) }
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+    }
+  }
+
+  sessionStorage.removeItem(PENDING_JOB_KEY);
+}
+
+/**
+ * Whether a translation was still streaming when the page was last closed/reloaded
+ * @returns {boolean}
+ */
+export function hasPendingTranslation() {
+  return sessionStorage.getItem(PENDING_JOB_KEY) !== null;
+}
+
+/**
+ * Replay and follow the translation job that was interrupted by a page reload.
+ * The server keeps generating (and keeps finished jobs for a while), so this
+ * never costs a second generation.
+ * @param {function(Object): void} onChunk - Callback for each {type, text} chunk
+ * @returns {Promise<boolean>} false if there was no pending job or it expired
+ */
+export async function resumePendingTranslation(onChunk) {
+  const pending = sessionStorage.getItem(PENDING_JOB_KEY);
+  if (!pending) return false;
+
+  const { jobId } = JSON.parse(pending);
+  const response = await fetch(`${API_BASE_URL}/translate/jobs/${jobId}/events`);
+  if (!response.ok) {
+    sessionStorage.removeItem(PENDING_JOB_KEY);
+    return false;
+  }
+
+  await followTranslationJob(response, onChunk);
+  return true;
+}
+
 /**
  * Stream translation from LLM (with thinking enabled)
  * @param {string} imagePath - Path to the image file
@@ -105,9 +300,10 @@ export async function wordInfo(imagePath, word) {
  * @param {string} ocrText - OCR'd Japanese text to translate
  * @param {function(string): void} onChunk - Callback for each chunk of streamed text
  * @param {function(Error): void} onError - Error callback
+ * @param {boolean} refresh - Generate a new translation instead of replaying a cached one
  * @returns {Promise<void>}
  */
-export async function streamTranslation(imagePath, box, ocrText, onChunk, onError) {
+export async function streamTranslation(imagePath, box, ocrText, onChunk, onError, refresh = false) {
   try {
     const response = await fetch(`${API_BASE_URL}/translate`, {
       method: 'POST',
@@ -117,7 +313,8 @@ export async function streamTranslation(imagePath, box, ocrText, onChunk, onErro
       body: JSON.stringify({
         image: imagePath,
         box: box,
-        ocr_text: ocrText
+        ocr_text: ocrText,
+        refresh: refresh
       })
     });
 
@@ -125,43 +322,8 @@ export async function streamTranslation(imagePath, box, ocrText, onChunk, onErro
       throw new Error(`HTTP error! status: ${response.status}`);
     }
 
-    // Get the reader from the response body
-    const reader = response.body.getReader();
-    const decoder = new TextDecoder();
-    let buffer = ''; // Buffer for incomplete lines
-
-    // Read the stream
-    while (true) {
-      const { done, value } = await reader.read();
-
-      if (done) {
-        break;
-      }
-
-      // Decode chunk and add to buffer
-      buffer += decoder.decode(value, { stream: true });
-
-      // Process complete lines (SSE format: lines ending with \n\n)
-      const lines = buffer.split('\n\n');
-
-      // Keep the last incomplete line in buffer
-      buffer = lines.pop() || '';
-
-      // Process complete lines
-      for (const line of lines) {
-        if (line.trim().startsWith('data: ')) {
-          try {
-            const jsonStr = line.trim().substring(6); // Remove 'data: ' prefix
-            const data = JSON.parse(jsonStr);
-
-            // Pass parsed object {type, text} to callback
-            onChunk(data);
-          } catch (parseError) {
-            console.warn('Failed to parse chunk:', line, parseError);
-          }
-        }
-      }
-    }
+    // Pass parsed objects {type, text} to callback
+    await followTranslationJob(response, onChunk);
   } catch (error) {
     console.error('Stream translation error:', error);
     if (onError) {
@@ -199,43 +361,8 @@ export async function streamTranslationMultiple(imagePath, boxes, ocrTexts, onCh
       throw new Error(`HTTP error! status: ${response.status}`);
     }
 
-    // Get the reader from the response body
-    const reader = response.body.getReader();
-    const decoder = new TextDecoder();
-    let buffer = ''; // Buffer for incomplete lines
-
-    // Read the stream
-    while (true) {
-      const { done, value } = await reader.read();
-
-      if (done) {
-        break;
-      }
-
-      // Decode chunk and add to buffer
-      buffer += decoder.decode(value, { stream: true });
-
-      // Process complete lines (SSE format: lines ending with \n\n)
-      const lines = buffer.split('\n\n');
-
-      // Keep the last incomplete line in buffer
-      buffer = lines.pop() || '';
-
-      // Process complete lines
-      for (const line of lines) {
-        if (line.trim().startsWith('data: ')) {
-          try {
-            const jsonStr = line.trim().substring(6); // Remove 'data: ' prefix
-            const data = JSON.parse(jsonStr);
-
-            // Pass parsed object {type, text} to callback
-            onChunk(data);
-          } catch (parseError) {
-            console.warn('Failed to parse chunk:', line, parseError);
-          }
-        }
-      }
-    }
+    // Pass parsed objects {type, text} to callback
+    await followTranslationJob(response, onChunk);
   } catch (error) {
     console.error('Stream translation multiple error:', error);
     if (onError) {
@@ -246,6 +373,81 @@ export async function streamTranslationMultiple(imagePath, boxes, ocrTexts, onCh
   }
 }
 
+/**
+ * Start a chat session on the backend. The page/bubble context is attached
+ * once; later messages only send themselves.
+ * @param {string} model - Ollama model name
+ * @param {{image?: string, ocr_text?: string, translation?: string}} context - Pinned page/bubble context
+ * @param {Array<{role: string, content: string}>} history - Earlier turns to continue from
+ * @returns {Promise<Object>} Session status including session_id
+ */
+export async function createChatSession(model, context = {}, history = []) {
+  try {
+    const response = await api.post('/chat/sessions', { model, ...context, history });
+    return response.data;
+  } catch (error) {
+    handleError(error, 'createChatSession');
+  }
+}
+
+/**
+ * Replace the pinned page/bubble context of a chat session
+ * @param {string} sessionId - Chat session ID
+ * @param {{image?: string, ocr_text?: string, translation?: string}} context - New context
+ * @returns {Promise<Object>} Session status
+ */
+export async function updateChatContext(sessionId, context) {
+  try {
+    const response = await api.put(`/chat/sessions/${sessionId}/context`, context);
+    return response.data;
+  } catch (error) {
+    handleError(error, 'updateChatContext');
+  }
+}
+
+/**
+ * Send a chat message and stream the reply.
+ * @param {string} sessionId - Chat session ID
+ * @param {string} content - Message text
+ * @param {string[]|null} images - Image URLs attached to the message
+ * @param {function(Object): void} onChunk - Callback for each {type: 'thinking'|'content', text} chunk
+ * @returns {Promise<void>} Rejects with error.status 404 if the session expired
+ */
+export async function sendChatMessage(sessionId, content, images, onChunk) {
+  const response = await fetch(`${API_BASE_URL}/chat/sessions/${sessionId}/messages`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json'
+    },
+    body: JSON.stringify({ content, images: images || [] })
+  });
+
+  if (!response.ok) {
+    const error = new Error(`HTTP error! status: ${response.status}`);
+    error.status = response.status;
+    throw error;
+  }
+
+  await readEventStream(response, (data) => {
+    if (data.type !== 'job') onChunk(data);
+  });
+}
+
+/**
+ * Ask the backend to prepare the pages following the current one
+ * (bubble detection, optionally OCR) in the background.
+ * Fire-and-forget: failures are only logged.
+ * @param {string} imagePath - Path to the page currently being read
+ * @returns {Promise<void>}
+ */
+export async function prefetchPages(imagePath) {
+  try {
+    await api.post('/api/prefetch', { image: imagePath });
+  } catch (error) {
+    console.warn('[API] Prefetch failed:', error.message);
+  }
+}
+
 // ========== REAL API ENDPOINTS (NEWLY IMPLEMENTED) ==========
 
 /**
@@ -344,6 +546,53 @@ export async function getTranslations(imageName) {
   }
 }
 
+// Last response of getAllTranslations, revalidated with its ETag
+let allTranslationsCache = { etag: null, data: null };
+
+/**
+ * Get saved translations of every page in the loaded folder with one request.
+ * Unchanged translations are revalidated with If-None-Match (304, no body).
+ * @returns {Promise<Object>} {imageName: {boxIndex: {marker, original, translation}}}
+ */
+export async function getAllTranslations() {
+  try {
+    const headers = allTranslationsCache.etag ? { 'If-None-Match': allTranslationsCache.etag } : {};
+    const response = await api.get('/api/translations', {
+      headers,
+      validateStatus: status => (status >= 200 && status < 300) || status === 304
+    });
+    if (response.status === 304) {
+      return allTranslationsCache.data;
+    }
+    allTranslationsCache = { etag: response.headers.etag, data: response.data };
+    return response.data;
+  } catch (error) {
+    handleError(error, 'getAllTranslations');
+  }
+}
+
+/**
+ * Save many bubble translations with a single write
+ * @param {Array<{imageName: string, boxIndex: number, marker: string, translation: string, originalText: string}>} entries
+ * @returns {Promise<Object>} {success, saved}
+ */
+export async function saveTranslationsBatch(entries) {
+  try {
+    const response = await api.post('/api/translations/batch', {
+      translations: entries.map(entry => ({
+        image_name: entry.imageName,
+        box_index: entry.boxIndex,
+        marker: entry.marker || '',
+        translation: entry.translation,
+        original_text: entry.originalText || ''
+      }))
+    });
+    return response.data;
+  } catch (error) {
+    handleError(error, 'saveTranslationsBatch');
+  }
+}
+
 // ========== EXPORT/IMPORT FUNCTIONALITY ==========
 
 /**
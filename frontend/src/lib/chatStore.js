@@ -27,6 +27,8 @@ function createNewTab(title = null, existingTabCount = 0) {
     title: title || `Chat ${existingTabCount + 1}`,
     messages: [],
     model: 'llama3.2', // Default model
+    sessionId: null, // Backend chat session holding the history
+    sessionContext: null, // Context the session was last given (JSON)
     isStreaming: false,
     streamingContent: '',
     streamingThinking: '',
@@ -301,7 +303,7 @@ export function clearChatMessages(tabId) {
   chatTabs.update(tabs => {
     return tabs.map(tab =>
       tab.id === tabId
-        ? { ...tab, messages: [], streamingContent: '', isStreaming: false }
+        ? { ...tab, messages: [], streamingContent: '', isStreaming: false, sessionId: null }
         : tab
     );
   });
@@ -318,7 +320,8 @@ export function truncateMessagesAtIndex(tabId, messageIndex) {
           ...tab,
           messages: tab.messages.slice(0, messageIndex + 1),
           streamingContent: '',
-          isStreaming: false
+          isStreaming: false,
+          sessionId: null // The backend history still has the removed turns
         };
       }
       return tab;
@@ -332,7 +335,18 @@ export function truncateMessagesAtIndex(tabId, messageIndex) {
 export function setTabModel(tabId, modelName) {
   chatTabs.update(tabs => {
     return tabs.map(tab =>
-      tab.id === tabId ? { ...tab, model: modelName } : tab
+      tab.id === tabId ? { ...tab, model: modelName, sessionId: null } : tab
+    );
+  });
+}
+
+/**
+ * Remember the backend chat session of a tab (null to start a new one)
+ */
+export function setTabSession(tabId, sessionId, sessionContext = null) {
+  chatTabs.update(tabs => {
+    return tabs.map(tab =>
+      tab.id === tabId ? { ...tab, sessionId, sessionContext } : tab
     );
   });
 }
@@ -357,6 +371,21 @@ export function getCurrentContext() {
   return context.trim();
 }
 
+/**
+ * Page and bubble context pinned to a backend chat session
+ */
+export function getChatSessionContext() {
+  const context = {};
+  const pageImage = getCurrentPageImage();
+  const ocrText = getOcrContext();
+  const translation = getTranslationContext();
+
+  if (pageImage) context.image = pageImage;
+  if (ocrText) context.ocr_text = ocrText;
+  if (translation) context.translation = translation;
+  return context;
+}
+
 /**
  * Insert current translation context into a message
  */
@@ -500,6 +529,7 @@ export default {
   handleStreamingError,
   clearChatMessages,
   setTabModel,
+  setTabSession,
   getCurrentContext,
   insertContext,
   exportChatHistory,
@@ -17,6 +17,10 @@ import queue
 from pathlib import Path
 from typing import Optional, List
 
+# Ollama host parsing is shared with the backend (backend/utils/ollama_hosts.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent / "backend"))
+from utils.ollama_hosts import ollama_hosts
+
 # ANSI color codes
 class Colors:
     CYAN = '\033[96m'
@@ -60,11 +64,17 @@ def check_url(url: str, timeout: int = 5) -> bool:
     except Exception:
         return False
 
+
 def check_ollama() -> bool:
     """Check if Ollama is running"""
     print_info("Checking Ollama availability...")
-    if check_url("http://localhost:11434/api/tags"):
-        print_success("Ollama is running")
+    hosts = ollama_hosts()
+    reachable = [host for host in hosts if check_url(f"{host}/api/tags")]
+    for host in hosts:
+        if host not in reachable and len(hosts) > 1:
+            print_warning(f"Ollama host {host} is not reachable")
+    if reachable:
+        print_success(f"Ollama is running ({len(reachable)}/{len(hosts)} hosts)" if len(hosts) > 1 else "Ollama is running")
         return True
     else:
         print_error("Ollama is not running or not accessible")
@@ -87,9 +97,15 @@ def check_ollama_models() -> bool:
         import urllib.request
         import json
 
-        response = urllib.request.urlopen("http://localhost:11434/api/tags", timeout=5)
-        data = json.loads(response.read())
-        installed_models = [model['name'] for model in data.get('models', [])]
+        # A model counts as installed if any reachable host has it
+        installed_models = set()
+        for host in ollama_hosts():
+            try:
+                response = urllib.request.urlopen(f"{host}/api/tags", timeout=5)
+            except Exception:
+                continue
+            data = json.loads(response.read())
+            installed_models.update(model['name'] for model in data.get('models', []))
 
         missing_models = [model for model in required_models if model not in installed_models]
 
@@ -256,21 +272,40 @@ def drain_output_queue(output_queue: queue.Queue, max_lines: int = 100):
         except queue.Empty:
             break
 
+def get_backend_health(timeout: int = 2) -> Optional[dict]:
+    """Fetch the backend's /health report, None if it isn't up yet"""
+    try:
+        import urllib.request
+        import json
+
+        with urllib.request.urlopen("http://localhost:8000/health", timeout=timeout) as response:
+            return json.loads(response.read())
+    except Exception:
+        return None
+
 def wait_for_backend(output_queue: queue.Queue, max_attempts: int = 30) -> bool:
     """Wait for backend to be ready"""
     print_info("Waiting for backend to be ready...")
 
-    for attempt in range(max_attempts):
+    # The backend loads its models in the background, so it is usually up within a second
+    for attempt in range(max_attempts * 4):
         # Show any log output while waiting
         drain_output_queue(output_queue, max_lines=10)
 
-        if check_url("http://localhost:8000/health", timeout=2):
+        health = get_backend_health()
+        if health is not None:
             print()
-            print_success("Backend is ready at http://localhost:8000")
+            print_success(f"Backend is ready at http://localhost:8000 (started in {health.get('startup_seconds')}s)")
+            detector = health.get("detector", {})
+            if detector.get("state") == "failed":
+                print_warning(f"Bubble detection unavailable: {detector.get('error')}")
+            elif detector.get("state") != "ready":
+                print_info("Bubble detector is still loading in the background")
             return True
 
-        time.sleep(1)
-        print(".", end="", flush=True)
+        time.sleep(0.25)
+        if attempt % 4 == 3:
+            print(".", end="", flush=True)
 
     print()
     print_error("Backend failed to start within 30 seconds")